@@ -8,37 +8,43 @@ import plotly.express as px
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.colors import LinearSegmentedColormap
+from rk.sql.database import mysql_connection, pool_stats
+from rk.sql.penalty_events import EVENT_COLUMNS, get_penalty_events, get_penalty_episodes, count_penalty_events
 
-# Database connection details
-MYSQL_HOST = 'ec2-54-241-86-221.us-west-1.compute.amazonaws.com'
-MYSQL_USER = 'driving_user'
-MYSQL_PASSWORD = 'dsci560'
-MYSQL_DATABASE = 'driving_data'
+# Local time zone of the phones, which ISO timestamps are recorded in. Epoch-millisecond
+# timestamps are shown in it too; use the zone passed to sql/migrate_timestamps.py.
+DISPLAY_TIME_ZONE = 'America/Los_Angeles'
 
-# Function to fetch data and return a DataFrame
-def fetch_data(query, params=None):
-    """Fetch data from MySQL database and return it as a DataFrame."""
+# Function to run a query helper on a pooled connection
+def read_database(read, *args):
+    """Run read(cursor, *args) and return its result with the cursor's column names."""
     try:
-        connection = mysql.connector.connect(
-            host=MYSQL_HOST,
-            user=MYSQL_USER,
-            password=MYSQL_PASSWORD,
-            database=MYSQL_DATABASE,
-            auth_plugin='mysql_native_password',
-            connection_timeout=10
-        )
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(query, params or ())
-        results = cursor.fetchall()
-        return pd.DataFrame(results)
+        # Connections come from the shared pool, which health checks and
+        # reconnects them and retries failed connects with backoff
+        with mysql_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                return read(cursor, *args), cursor.column_names
+            finally:
+                cursor.close()
     except mysql.connector.Error as err:
         st.error(f"Database query error: {err}")
-        return pd.DataFrame()
-    finally:
-        if cursor:
-            cursor.close()
-        if connection.is_connected():
-            connection.close()
+        return None, []
+
+def run_query(cursor, query, params=None):
+    cursor.execute(query, params or ())
+    return cursor.fetchall()
+
+# Function to fetch rows and return a DataFrame
+def fetch_rows(read, *args):
+    """Fetch the rows a query helper returns as a DataFrame."""
+    rows, columns = read_database(read, *args)
+    return pd.DataFrame(rows or [], columns=columns)
+
+# Function to fetch data and return a DataFrame
+def fetch_data(query, params=None):
+    """Fetch data from MySQL database and return it as a DataFrame."""
+    return fetch_rows(run_query, query, params)
 
 # Fetch distinct trip IDs for the dropdown menu
 def get_trip_ids():
@@ -125,29 +131,30 @@ if selected_trip:
         # Display other scores in a table
         st.subheader("Detailed Scores")
         st.dataframe(scores_data[['acceleration_score', 'braking_score', 'speeding_score', 'cornering_score']])
+
+        # Count the stored events of each criterion; samples without an event are not stored
+        event_counts, _ = read_database(count_penalty_events, selected_trip)
+        if event_counts:
+            st.subheader("Penalty Events")
+            st.dataframe(pd.DataFrame(
+                [event_counts[column] for column in EVENT_COLUMNS],
+                index=[column.replace('_event', '') for column in EVENT_COLUMNS]
+            ))
     else:
         st.warning("No scores data found for this Trip ID.")
 
 
 # Penalty Events and Route Visualization (Folium Map)
 st.subheader("Route and Penalty Events Map")
-events_query = """
-    SELECT latitude, longitude, acceleration_event, braking_event, speeding_event, cornering_event
-    FROM penalty_events_data
-    WHERE trip_id = %s AND (
-        acceleration_event = 'severe' OR
-        braking_event = 'severe' OR
-        speeding_event = 'severe' OR
-        cornering_event = 'severe'
-    )
-"""
 route_query = """
     SELECT latitude, longitude
     FROM driving_data
     WHERE trip_id = %s
     ORDER BY timestamp
 """
-events_data = fetch_data(events_query, (selected_trip,))
+episodes_data = fetch_rows(get_penalty_episodes, selected_trip, 'severe')
+# Trips scored before episodes were stored only have per-sample events
+events_data = fetch_rows(get_penalty_events, selected_trip, 'severe') if episodes_data.empty else pd.DataFrame()
 route_data = fetch_data(route_query, (selected_trip,))
 
 if not route_data.empty:
@@ -158,12 +165,25 @@ if not route_data.empty:
     route_coordinates = list(zip(route_data['latitude'], route_data['longitude']))
     folium.PolyLine(route_coordinates, color="blue", weight=2.5, opacity=1).add_to(m)
 
+    # Add one marker per severe penalty episode
+    for _, row in episodes_data.iterrows():
+        event_info = f"{row['criterion'].capitalize()}: {row['severity']}, " \
+                     f"{row['duration_seconds']:.0f}s, peak {row['peak_magnitude']:.2f}"
+        folium.Marker(
+            location=[row['latitude'], row['longitude']],
+            popup=event_info,
+            icon=folium.Icon(color='red')
+        ).add_to(m)
+
     # Add markers for severe penalty events
     if not events_data.empty:
         for _, row in events_data.iterrows():
             #st.write(f"Adding marker for event: {row}")  # Debugging log
-            event_info = f"Acceleration: {row['acceleration_event']}, Braking: {row['braking_event']}, " \
-                         f"Speeding: {row['speeding_event']}, Cornering: {row['cornering_event']}"
+            # Only the events the sample has are stored
+            event_info = ", ".join(
+                f"{column.replace('_event', '').capitalize()}: {row[column]}"
+                for column in EVENT_COLUMNS if pd.notna(row[column])
+            )
             folium.Marker(
                 location=[row['latitude'], row['longitude']],
                 popup=event_info,
@@ -186,7 +206,16 @@ trip_query = """
 """
 trip_data = fetch_data(trip_query, (selected_trip,))
 if not trip_data.empty:
-    trip_data['timestamp'] = pd.to_datetime(trip_data['timestamp'])
+    if pd.api.types.is_numeric_dtype(trip_data['timestamp']):
+        # Epoch-millisecond timestamps, shown in the same local time as ISO ones
+        trip_data['timestamp'] = (
+            pd.to_datetime(trip_data['timestamp'], unit='ms')
+            .dt.tz_localize('UTC')
+            .dt.tz_convert(DISPLAY_TIME_ZONE)
+            .dt.tz_localize(None)
+        )
+    else:
+        trip_data['timestamp'] = pd.to_datetime(trip_data['timestamp'])
     
     # Show summary statistics
     avg_speed = trip_data['speed'].mean()
@@ -209,3 +238,7 @@ if not trip_data.empty:
     st.plotly_chart(fig)
 else:
     st.warning("No trip analytics data found for this Trip ID.")
+
+# Connection pool metrics of this Streamlit server
+with st.sidebar.expander("Database connections"):
+    st.json(pool_stats().get(False, {}))
@@ -0,0 +1,54 @@
+import sys
+import os
+import time
+
+# Add the repository root to sys.path
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "..")
+    )
+)
+
+import numpy as np
+from rk.scoring.bands import PENALTY_BANDS, classify_bands
+
+
+def scalar_acceleration(values):
+    """
+    Per-row if/elif chain as previously used by score_acceleration.
+    """
+    results = []
+    for acceleration_g in values:
+        if 0.15 <= acceleration_g < 0.25:
+            results.append(("mild", 5))
+        elif acceleration_g >= 0.25:
+            results.append(("severe", 10))
+        else:
+            results.append((None, 0))
+    return results
+
+
+def main(samples=100000, repeat=20):
+    rng = np.random.default_rng(0)
+    values = rng.normal(0, 0.15, samples)
+    value_list = values.tolist()
+
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        scalar_acceleration(value_list)
+    scalar_time = (time.perf_counter() - start_time) / repeat
+
+    print(f"Classifying {samples} samples")
+    print(f"{'if/elif chain':<16} {scalar_time / samples * 1e9:8.1f} us per 1000 samples")
+
+    for criterion in PENALTY_BANDS:
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            classify_bands(criterion, values)
+        vector_time = (time.perf_counter() - start_time) / repeat
+        print(f"{criterion:<16} {vector_time / samples * 1e9:8.1f} us per 1000 samples "
+              f"({scalar_time / vector_time:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import sys
+import os
+import math
+import time
+
+# Add the repository root to sys.path
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "..")
+    )
+)
+
+import numpy as np
+from rk.scoring.geodesy import step_bearings, step_distances, nearest_point
+
+try:
+    from geopy.distance import geodesic
+except ImportError:
+    geodesic = None
+
+
+def scalar_bearings(latitudes, longitudes):
+    """
+    Per-row bearing loop as previously used by calculate_bearing.
+    """
+    bearings = [None] * len(latitudes)
+    for i in range(1, len(latitudes)):
+        lat1 = math.radians(latitudes[i - 1])
+        lon1 = math.radians(longitudes[i - 1])
+        lat2 = math.radians(latitudes[i])
+        lon2 = math.radians(longitudes[i])
+        delta_lon = lon2 - lon1
+        x = math.sin(delta_lon) * math.cos(lat2)
+        y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(delta_lon)
+        bearings[i] = (math.degrees(math.atan2(x, y)) + 360) % 360
+    return bearings
+
+
+def scalar_distances(latitudes, longitudes):
+    """
+    Per-row haversine loop as previously used by calculate_speed.
+    """
+    distances = [None] * len(latitudes)
+    for i in range(1, len(latitudes)):
+        lat1 = math.radians(latitudes[i - 1])
+        lon1 = math.radians(longitudes[i - 1])
+        lat2 = math.radians(latitudes[i])
+        lon2 = math.radians(longitudes[i])
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        distances[i] = 6371000 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return distances
+
+
+def scalar_nearest(lat, lon, points):
+    """
+    geopy lookup as previously used by find_nearest_speed_limit.
+    """
+    return min(points, key=lambda point: geodesic((lat, lon), point).miles)
+
+
+def time_call(function, *args, repeat=3):
+    """
+    Return the best wall-clock time of several calls.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def report(label, scalar_time, vector_time):
+    print(f"{label:<28} scalar {scalar_time * 1000:10.2f} ms   "
+          f"vectorized {vector_time * 1000:8.2f} ms   ({scalar_time / vector_time:.0f}x)")
+
+
+def main(samples=100000, cache_size=2000, queries=200):
+    rng = np.random.default_rng(0)
+
+    # A random walk around Los Angeles at roughly highway speed
+    latitudes = 34.05 + np.cumsum(rng.normal(0, 1e-4, samples))
+    longitudes = -118.25 + np.cumsum(rng.normal(0, 1e-4, samples))
+    latitude_list, longitude_list = latitudes.tolist(), longitudes.tolist()
+
+    print(f"Trip of {samples} samples")
+    report(
+        "bearings",
+        time_call(scalar_bearings, latitude_list, longitude_list),
+        time_call(step_bearings, latitudes, longitudes)
+    )
+    report(
+        "haversine distances",
+        time_call(scalar_distances, latitude_list, longitude_list),
+        time_call(step_distances, latitudes, longitudes)
+    )
+
+    print(f"\nNearest of {cache_size} cached points for {queries} queries")
+    points = list(zip(latitudes[:cache_size].tolist(), longitudes[:cache_size].tolist()))
+    point_lats, point_lons = zip(*points)
+    query_lats = latitudes[-queries:]
+    query_lons = longitudes[-queries:]
+
+    vector_time = time_call(
+        lambda: [nearest_point(lat, lon, point_lats, point_lons) for lat, lon in zip(query_lats, query_lons)]
+    )
+    if geodesic is None:
+        print(f"{'nearest point':<28} vectorized {vector_time * 1000:8.2f} ms   (geopy not installed)")
+    else:
+        scalar_time = time_call(
+            lambda: [scalar_nearest(lat, lon, points) for lat, lon in zip(query_lats, query_lons)],
+            repeat=1
+        )
+        report("nearest point", scalar_time, vector_time)
+
+
+if __name__ == "__main__":
+    main()
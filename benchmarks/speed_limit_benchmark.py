@@ -0,0 +1,79 @@
+import sys
+import os
+import time
+
+# Add the repository root to sys.path
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "..")
+    )
+)
+
+import numpy as np
+from rk.scoring.geodesy import EARTH_RADIUS_M
+from rk.scoring.speed_limit_index import (
+    SPEED_LIMIT_INDEX_PATH,
+    build_speed_limit_index,
+    load_speed_limit_index,
+    lookup_speed_limit
+)
+
+
+def synthetic_roads(rng, roads=20000, center=(34.02, -118.29), span=0.3):
+    """
+    Random polyline roads around a center point, about the road count of
+    a city extract.
+    """
+    result = []
+    for _ in range(roads):
+        lon = center[1] + rng.uniform(-span, span)
+        lat = center[0] + rng.uniform(-span, span)
+        coordinates = [(lon, lat)]
+        for _ in range(rng.integers(1, 8)):
+            lon += rng.normal(0, 0.002)
+            lat += rng.normal(0, 0.002)
+            coordinates.append((lon, lat))
+        result.append((coordinates, float(rng.choice([25, 35, 45, 65])), None))
+    return result
+
+
+def main(samples=2000, network_samples=0):
+    rng = np.random.default_rng(0)
+
+    if os.path.exists(SPEED_LIMIT_INDEX_PATH):
+        index = load_speed_limit_index(SPEED_LIMIT_INDEX_PATH)
+        print(f"Using {SPEED_LIMIT_INDEX_PATH}")
+    else:
+        start_time = time.perf_counter()
+        index = build_speed_limit_index(synthetic_roads(rng))
+        print(f"Built a synthetic index in {time.perf_counter() - start_time:.2f}s")
+    print(f"{len(index['speed_limits'])} segments in {len(index['cell_keys'])} cells")
+
+    # Query points scattered over the indexed area
+    segments = index["segments"][rng.integers(len(index["segments"]), size=samples)]
+    reference_lat = float(index["reference_lat"])
+    x = segments[:, 0] + rng.normal(0, 20, samples)
+    y = segments[:, 1] + rng.normal(0, 20, samples)
+    lats = np.degrees(y / EARTH_RADIUS_M)
+    lons = np.degrees(x / (EARTH_RADIUS_M * np.cos(np.radians(reference_lat))))
+
+    start_time = time.perf_counter()
+    found = sum(lookup_speed_limit(index, lat, lon) is not None for lat, lon in zip(lats, lons))
+    index_time = (time.perf_counter() - start_time) / samples
+    print(f"{'offline index':<16} {index_time * 1e6:10.1f} us per point ({found}/{samples} found)")
+
+    if network_samples:
+        # The per-point Overpass lookup, as used without an index
+        from rk.scoring.speed import fetch_osm_speed_limit
+
+        start_time = time.perf_counter()
+        for lat, lon in zip(lats[:network_samples], lons[:network_samples]):
+            fetch_osm_speed_limit(lat, lon)
+        network_time = (time.perf_counter() - start_time) / network_samples
+        print(f"{'overpass query':<16} {network_time * 1e6:10.1f} us per point "
+              f"({network_time / index_time:.0f}x)")
+
+
+if __name__ == "__main__":
+    # Pass a sample count to also time that many Overpass queries
+    main(network_samples=int(sys.argv[1]) if len(sys.argv) > 1 else 0)
@@ -1,11 +1,20 @@
 import requests
 import json
 import time
-from datetime import datetime
 from pimux import scrip
 import os
 import sys
 
+# Add the repository root to sys.path
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../..")
+    )
+)
+
+# Stored timestamp format, shared with the database side
+from mj.sql.timestamps import current_timestamp
+
 # Get trip_id from command-line arguments
 trip_id = sys.argv[1] if len(sys.argv) > 1 else "default_trip_id"
 
@@ -26,7 +35,7 @@ while not os.path.exists(stop_signal_file):
             last_timestamp = current_time
 
             # Get timestamps
-            readable_ts = datetime.now().isoformat()
+            readable_ts = current_timestamp()
 
             # Fetch GPS data from termux-location
             gpscmd = scrip.compute("termux-location")
@@ -28,6 +28,7 @@ if __name__ == "__main__":
 
     # Run gps.py and sensor.py in the background
     print("Starting gps.py and sensor.py...")
+    start_ts = int(time.time() * 1000)
     run_in_background(f"python gps.py {trip_id}")
     run_in_background(f"python sensor.py {trip_id}")
 
@@ -45,12 +46,13 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         print("\nUser interrupted. Terminating telemetry collection...")
 
+    end_ts = int(time.time() * 1000)
     print("Telemetry collection stopped.")
 
     # Run the SQL handler orchestrator script
     print("Running sql/run_all_handlers.py to update the database...")
     try:
-        os.system(f"python sql/run_all_handlers.py {trip_id}")
+        os.system(f"python sql/run_all_handlers.py {trip_id} {start_ts} {end_ts}")
         print("Database update completed successfully.")
     except Exception as e:
         print(f"Error running sql/run_all_handlers.py: {e}")
@@ -4,46 +4,11 @@ import os
 # Add the parent directory of `testing_user` to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
+import numpy as np
 from mj.sql.database import connect_to_mysql
-
-
-# Create or update required tables
-def create_tables(connection):
-    try:
-        cursor = connection.cursor()
-
-        # Create or update scores_data table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS scores_data (
-            trip_id VARCHAR(255) PRIMARY KEY,
-            acceleration_score FLOAT DEFAULT 100,
-            braking_score FLOAT DEFAULT 100,
-            speeding_score FLOAT DEFAULT 100,
-            cornering_score FLOAT DEFAULT 100
-        )
-        """)
-
-        # Create or update penalty_events_data table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS penalty_events_data (
-            trip_id VARCHAR(255),
-            timestamp VARCHAR(255),
-            latitude DOUBLE,
-            longitude DOUBLE,
-            acceleration_event VARCHAR(10),
-            braking_event VARCHAR(10),
-            speeding_event VARCHAR(10),
-            cornering_event VARCHAR(10),
-            PRIMARY KEY (trip_id, timestamp)
-        )
-        """)
-
-        connection.commit()
-        # print("Tables created successfully.")
-
-    except Exception as e:
-        print(f"Error creating tables: {e}")
-        sys.exit(1)
+from mj.sql.schema import ensure_schema
+from mj.sql.penalty_events import clear_events, prune_empty_events
+from mj.scoring.bands import PENALTY_BANDS, classify_bands
 
 
 # Fetch acceleration data for a specific trip
@@ -59,7 +24,7 @@ def get_acceleration_data(trip_id, connection):
         return cursor.fetchall()
     except Exception as e:
         print(f"Error fetching data: {e}")
-        sys.exit(1)
+        raise
 
 
 # Convert acceleration from mps² to G-force
@@ -80,27 +45,23 @@ def score_acceleration(data, connection):
         total_score = 0
         penalty_count = 0  # Count of penalty events
 
-        for record in data:
+        # Clear the previous acceleration events of the trip
+        trip_id = data[0][0]
+        clear_events(cursor, trip_id, "acceleration_event")
+
+        # Classify every sample against the acceleration bands in one call
+        acceleration_g = convert_to_g_force(np.array([record[4] for record in data], dtype=float))
+        events, penalties = classify_bands("acceleration", acceleration_g)
+
+        for i, record in enumerate(data):
             trip_id, timestamp, latitude, longitude, acceleration_mps2 = record
 
-            # Skip rows where acceleration is None
-            if acceleration_mps2 is None:
+            # Only samples with an acceleration event are stored
+            acceleration_event = events[i]
+            if acceleration_event is None:
                 continue
 
-            # Convert acceleration to G-force
-            acceleration_g = convert_to_g_force(acceleration_mps2)
-
-            # Determine if a penalty applies for acceleration
-            if 0.15 <= acceleration_g < 0.25:
-                acceleration_event = "mild"
-                penalty_score = 5
-            elif acceleration_g >= 0.25:
-                acceleration_event = "severe"
-                penalty_score = 10
-            else:
-                # Insert row even if there's no penalty (NULL event)
-                acceleration_event = None
-                penalty_score = 0
+            penalty_score = int(penalties[i])
 
             # Corrected INSERT statement for penalty_events_data
             cursor.execute("""
@@ -117,11 +78,14 @@ def score_acceleration(data, connection):
                 total_score += penalty_score
                 penalty_count += 1
 
+        # Remove rows left without any event
+        prune_empty_events(cursor, trip_id)
+
         # Calculate the normalized acceleration score
         if penalty_count == 0:
             normalized_score = 100.0  # Perfect score if no penalties
         else:
-            normalized_score = max(10, 100 - (total_score / trip_duration * 100))
+            normalized_score = max(PENALTY_BANDS["acceleration"]["floor"], 100 - (total_score / trip_duration * 100))
 
         # Insert or update the acceleration score in scores_data
         cursor.execute("""
@@ -136,7 +100,7 @@ def score_acceleration(data, connection):
 
     except Exception as e:
         print(f"Error scoring data: {e}")
-        sys.exit(1)
+        raise
 
 
 # Main Execution
@@ -150,13 +114,16 @@ if __name__ == "__main__":
     connection = connect_to_mysql()
 
     try:
-        # Create the required tables
-        create_tables(connection)
+        # Make sure the schema is up to date
+        ensure_schema(connection)
 
         # Fetch and score data
         accel_data = get_acceleration_data(trip_id, connection)
         score_acceleration(accel_data, connection)
 
+    except Exception:
+        sys.exit(1)
+
     finally:
         if connection.is_connected():
             connection.close()
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+def iter_episodes(events, penalties, magnitudes):
+    """
+    Merge runs of consecutive samples carrying an event into episodes,
+    yielding each one as soon as its run ends. Each episode is a dictionary
+    with the first, last and peak sample index (largest absolute magnitude),
+    the sample count, and the event and penalty of its most severe sample.
+    """
+    episode = None
+    for i in np.flatnonzero(np.asarray(events, dtype=object).astype(bool)).tolist():
+        if episode is not None and i == episode["last"] + 1:
+            # Extend the current run
+            episode["last"] = i
+            episode["sample_count"] += 1
+            if abs(magnitudes[i]) > abs(magnitudes[episode["peak"]]):
+                episode["peak"] = i
+            if penalties[i] > episode["penalty"]:
+                episode["event"] = events[i]
+                episode["penalty"] = int(penalties[i])
+            continue
+
+        if episode is not None:
+            yield episode
+        episode = {
+            "first": i,
+            "last": i,
+            "peak": i,
+            "sample_count": 1,
+            "event": events[i],
+            "penalty": int(penalties[i])
+        }
+
+    if episode is not None:
+        yield episode
+
+
+def episode_penalties(episodes):
+    """
+    Penalty points of a list of episodes: one penalty per episode.
+    """
+    return np.array([episode["penalty"] for episode in episodes], dtype=np.int64)
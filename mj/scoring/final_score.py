@@ -9,7 +9,15 @@ sys.path.append(
 )
 
 from mj.sql.database import connect_to_mysql
+from mj.sql.schema import ensure_schema
 
+# Weight of each component score in the final score
+WEIGHTS = {
+    "acceleration": 0.25,  # 25%
+    "braking": 0.25,       # 25%
+    "speeding": 0.30,      # 30%
+    "cornering": 0.20      # 20%
+}
 
 # Fetch scores from the database
 def get_component_scores(trip_id, connection):
@@ -25,25 +33,16 @@ def get_component_scores(trip_id, connection):
         if result:
             return result
         else:
-            print(f"No scores found for trip_id {trip_id}.")
-            sys.exit(1)
+            raise ValueError(f"No scores found for trip_id {trip_id}.")
     except Exception as e:
         print(f"Error fetching scores: {e}")
-        sys.exit(1)
+        raise
 
 
 # Calculate the final weighted score
 def calculate_final_score(scores):
     acceleration_score, braking_score, speeding_score, cornering_score = scores
 
-    # Define weights
-    WEIGHTS = {
-        "acceleration": 0.25,  # 25%
-        "braking": 0.25,       # 25%
-        "speeding": 0.30,      # 30%
-        "cornering": 0.20      # 20%
-    }
-
     # Calculate the final score
     final_score = (
         (acceleration_score * WEIGHTS["acceleration"]) +
@@ -59,19 +58,6 @@ def update_final_score(trip_id, final_score, connection):
     try:
         cursor = connection.cursor()
 
-        # Add column if it doesn't exist
-        cursor.execute("""
-        SELECT COUNT(*)
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'scores_data' AND COLUMN_NAME = 'final_score'
-        """)
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("""
-            ALTER TABLE scores_data 
-            ADD COLUMN final_score FLOAT
-            """)
-            # print("Added column `final_score` to `scores_data`.")
-
         # Insert or update the final score
         cursor.execute("""
         UPDATE scores_data
@@ -83,7 +69,7 @@ def update_final_score(trip_id, final_score, connection):
         print(f"Final score updated for trip_id {trip_id}. Final score: {final_score:.2f}")
     except Exception as e:
         print(f"Error updating final score: {e}")
-        sys.exit(1)
+        raise
 
 
 # Main Execution
@@ -96,6 +82,9 @@ if __name__ == "__main__":
     connection = connect_to_mysql()
 
     try:
+        # Make sure the schema is up to date
+        ensure_schema(connection)
+
         # Fetch the component scores
         component_scores = get_component_scores(trip_id, connection)
 
@@ -103,6 +92,9 @@ if __name__ == "__main__":
         final_score = calculate_final_score(component_scores)
         update_final_score(trip_id, final_score, connection)
 
+    except Exception:
+        sys.exit(1)
+
     finally:
         if connection.is_connected():
             connection.close()
@@ -5,15 +5,25 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
 import math
+import numpy as np
 from mysql.connector import Error
-from datetime import datetime, timedelta
 from mj.sql.database import connect_to_mysql
-from mj.sql.database import MYSQL_DATABASE
-
-def preprocess_timestamp_data(trip_id):
+from mj.sql.timestamps import parse_timestamp
+from mj.scoring.preprocessing_engine import run_preprocessing_engine, to_datetime64, format_datetime64
+from mj.scoring.interpolation import fill_gaps
+from mj.scoring.rolling import rolling_mean, rolling_circular_mean
+from mj.scoring.geodesy import step_bearings, step_distances
+from mj.scoring.resampling import SAMPLE_RATE_HZ, GRID_TOLERANCE_SECONDS, find_gaps
+from mj.sql.schema import ensure_schema
+
+def preprocess_timestamp_data(trip_id, since=None, rate=SAMPLE_RATE_HZ,
+                              tolerance=GRID_TOLERANCE_SECONDS):
     """
     Preprocess driving data for the given trip_id by filling in
     missing timestamps and saving the preprocessed data to a new table.
+    Samples are snapped to a grid of rate Hz anchored at the trip start,
+    and only grid slots with no sample within tolerance are filled.
+    If since is given, only samples after that timestamp are copied.
     """
     connection = None
     try:
@@ -21,75 +31,48 @@ def preprocess_timestamp_data(trip_id):
         connection = connect_to_mysql()
         cursor = connection.cursor()
 
-        # Step 2: Fetch the start and end timestamps for the trip_id
+        # Step 2: Fetch the existing timestamps for the trip_id in order
         cursor.execute("""
-            SELECT MIN(timestamp), MAX(timestamp)
+            SELECT timestamp
             FROM driving_data
             WHERE trip_id = %s
+            ORDER BY timestamp
         """, (trip_id,))
-        start_time_str, end_time_str = cursor.fetchone()
+        existing_timestamps = [row[0] for row in cursor.fetchall()]
 
         # Ensure the trip_id exists in the database
-        if not start_time_str or not end_time_str:
+        if not existing_timestamps:
             print(f"No data found for trip_id: {trip_id}")
             return
 
-        # Convert timestamps from ISO 8601 format
-        # (with 'T') to datetime objects
-        start_time = datetime.strptime(start_time_str, "%Y-%m-%dT%H:%M:%S.%f")
-        end_time = datetime.strptime(end_time_str, "%Y-%m-%dT%H:%M:%S.%f")
-
-        # Step 3: Generate a list of all timestamps at 1-second intervals
-        current_time = start_time
-        timestamps = []
-        while current_time <= end_time:
-            timestamps.append(current_time)
-            current_time += timedelta(seconds=1)
-
-        # Step 4: Fetch existing timestamps for the trip_id
-        cursor.execute("""
-            SELECT timestamp
-            FROM driving_data
-            WHERE trip_id = %s
-        """, (trip_id,))
-        existing_timestamps = {
-            datetime.strptime(row[0], "%Y-%m-%dT%H:%M:%S.%f") for row in cursor.fetchall()
-        }
-
-        # Step 5: Find missing timestamps
-        missing_timestamps = set(timestamps) - existing_timestamps
-
-        # Step 6: Create a new SQL table for preprocessed data
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS preprocessed_driving_data (
-                trip_id VARCHAR(255),
-                timestamp VARCHAR(255),
-                latitude DOUBLE NULL,
-                longitude DOUBLE NULL,
-                bearing DOUBLE NULL,
-                speed DOUBLE NULL,
-                PRIMARY KEY (trip_id, timestamp)
-            )
-        """)
-        connection.commit()
+        # Step 3: Find the grid slots that no sample fills
+        missing_times = find_gaps(to_datetime64(existing_timestamps), rate=rate, tolerance=tolerance)
+        if since is not None:
+            missing_times = missing_times[missing_times > to_datetime64([since])[0]]
 
-        # Step 7: Copy existing data to the new table
-        cursor.execute("""
-            INSERT IGNORE INTO preprocessed_driving_data (trip_id, timestamp, latitude, longitude, bearing, speed)
-            SELECT trip_id, timestamp, latitude, longitude, bearing, speed
-            FROM driving_data
-            WHERE trip_id = %s
-        """, (trip_id,))
+        # Step 4: Copy existing data to the new table
+        if since is None:
+            cursor.execute("""
+                INSERT IGNORE INTO preprocessed_driving_data (trip_id, timestamp, latitude, longitude, bearing, speed)
+                SELECT trip_id, timestamp, latitude, longitude, bearing, speed
+                FROM driving_data
+                WHERE trip_id = %s
+            """, (trip_id,))
+        else:
+            cursor.execute("""
+                INSERT IGNORE INTO preprocessed_driving_data (trip_id, timestamp, latitude, longitude, bearing, speed)
+                SELECT trip_id, timestamp, latitude, longitude, bearing, speed
+                FROM driving_data
+                WHERE trip_id = %s AND timestamp > %s
+            """, (trip_id, since))
         connection.commit()
 
-        # Step 8: Insert missing timestamps with NULL values into the new table
-        for ts in missing_timestamps:
-            # Convert the datetime object back to ISO 8601 format string
-            ts_str = ts.strftime("%Y-%m-%dT%H:%M:%S.%f")
-            cursor.execute("""
+        # Step 5: Insert missing timestamps with NULL values in one batch
+        if missing_times.size:
+            cursor.executemany("""
                 INSERT IGNORE INTO preprocessed_driving_data (trip_id, timestamp, latitude, longitude, bearing, speed)
                 VALUES (%s, %s, NULL, NULL, NULL, NULL)
-            """, (trip_id, ts_str))
+            """, [(trip_id, ts) for ts in format_datetime64(missing_times)])
 
         # Commit the changes
         connection.commit()
@@ -100,10 +83,11 @@ def preprocess_timestamp_data(trip_id):
             cursor.close()
             connection.close()
 
-def interpolate_lat_lon(trip_id):
+def interpolate_lat_lon(trip_id, method="linear", max_gap=None):
     """
     Interpolate missing latitude and longitude values in the
     preprocessed_driving_data table for the given trip_id.
+    Gaps longer than max_gap seconds are left as NULL.
     """
     connection = None
     try:
@@ -124,42 +108,16 @@ def interpolate_lat_lon(trip_id):
             print(f"No data found for trip_id: {trip_id}.")
             return
 
-        # Parse data into separate lists
+        # Parse data into separate arrays
         timestamps = [row['timestamp'] for row in data]
-        latitudes = [row['latitude'] for row in data]
-        longitudes = [row['longitude'] for row in data]
-
-        # Step 3: Linear interpolation for latitude and longitude
-        def interpolate(values):
-            for i in range(len(values)):
-                if values[i] is None:
-                    # Find nearest valid values before and after
-                    prev_idx = next((j for j in range(i - 1, -1, -1) if values[j] is not None), None)
-                    next_idx = next((j for j in range(i + 1, len(values)) if values[j] is not None), None)
-
-                    if prev_idx is not None and next_idx is not None:
-                        # Linear interpolation
-                        time_before = datetime.strptime(timestamps[prev_idx], "%Y-%m-%dT%H:%M:%S.%f")
-                        time_after = datetime.strptime(timestamps[next_idx], "%Y-%m-%dT%H:%M:%S.%f")
-                        value_before = values[prev_idx]
-                        value_after = values[next_idx]
-
-                        time_current = datetime.strptime(timestamps[i], "%Y-%m-%dT%H:%M:%S.%f")
-                        time_diff = (time_after - time_before).total_seconds()
-                        time_to_current = (time_current - time_before).total_seconds()
-
-                        values[i] = value_before + (value_after - value_before) * (time_to_current / time_diff)
-                    elif prev_idx is not None:
-                        # Forward fill
-                        values[i] = values[prev_idx]
-                    elif next_idx is not None:
-                        # Backward fill
-                        values[i] = values[next_idx]
-            return values
-
-        # Interpolate latitude and longitude
-        latitudes = interpolate(latitudes)
-        longitudes = interpolate(longitudes)
+        latitudes = np.array([row['latitude'] for row in data], dtype=float)
+        longitudes = np.array([row['longitude'] for row in data], dtype=float)
+        times = to_datetime64(timestamps)
+        seconds = (times - times[0]) / np.timedelta64(1, "s")
+
+        # Step 3: Fill gaps in latitude and longitude in one vectorized pass
+        latitudes = fill_gaps(seconds, latitudes, method, max_gap)
+        longitudes = fill_gaps(seconds, longitudes, method, max_gap)
 
         # Step 4: Update the database with interpolated values
         for i, ts in enumerate(timestamps):
@@ -167,7 +125,12 @@ def interpolate_lat_lon(trip_id):
                 UPDATE preprocessed_driving_data
                 SET latitude = %s, longitude = %s
                 WHERE trip_id = %s AND timestamp = %s
-            """, (latitudes[i], longitudes[i], trip_id, ts))
+            """, (
+                None if np.isnan(latitudes[i]) else float(latitudes[i]),
+                None if np.isnan(longitudes[i]) else float(longitudes[i]),
+                trip_id,
+                ts
+            ))
 
         connection.commit()
 
@@ -189,23 +152,7 @@ def calculate_bearing(trip_id):
         connection = connect_to_mysql()
         cursor = connection.cursor(dictionary=True)
 
-        # Step 2: Check if the column `bearing_gps` exists
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM information_schema.columns
-            WHERE table_name = 'preprocessed_driving_data'
-            AND table_schema = %s
-            AND column_name = 'bearing_gps'
-        """, (MYSQL_DATABASE,))
-        if cursor.fetchone()['COUNT(*)'] == 0:
-            # Add the `bearing_gps` column
-            cursor.execute("""
-                ALTER TABLE preprocessed_driving_data
-                ADD COLUMN bearing_gps DOUBLE NULL
-            """)
-            connection.commit()
-
-        # Step 3: Fetch all data for the trip_id, ordered by timestamp
+        # Step 2: Fetch all data for the trip_id, ordered by timestamp
         cursor.execute("""
             SELECT timestamp, latitude, longitude
             FROM preprocessed_driving_data
@@ -218,25 +165,15 @@ def calculate_bearing(trip_id):
             print(f"No data found for trip_id: {trip_id}.")
             return
 
-        # Step 4: Calculate bearing for each row
-        bearings = [None] * len(data)
-        for i in range(1, len(data)):
-            lat1 = math.radians(data[i - 1]['latitude'])
-            lon1 = math.radians(data[i - 1]['longitude'])
-            lat2 = math.radians(data[i]['latitude'])
-            lon2 = math.radians(data[i]['longitude'])
-
-            delta_lon = lon2 - lon1
-
-            x = math.sin(delta_lon) * math.cos(lat2)
-            y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(delta_lon)
-            initial_bearing = math.atan2(x, y)
-
-            # Convert bearing from radians to degrees and normalize to [0, 360]
-            bearing = (math.degrees(initial_bearing) + 360) % 360
-            bearings[i] = bearing
+        # Step 3: Calculate bearing for each row from the previous one
+        latitudes = np.array([row['latitude'] for row in data], dtype=float)
+        longitudes = np.array([row['longitude'] for row in data], dtype=float)
+        bearings = [None] + [
+            None if np.isnan(bearing) else float(bearing)
+            for bearing in step_bearings(latitudes, longitudes)
+        ]
 
-        # Step 5: Update the database with calculated bearing values
+        # Step 4: Update the database with calculated bearing values
         for i, row in enumerate(data):
             cursor.execute("""
                 UPDATE preprocessed_driving_data
@@ -255,7 +192,7 @@ def calculate_bearing(trip_id):
 
 def calculate_moving_average(trip_id):
     """
-    Calculate a centered moving average for the bearing_gps column
+    Calculate a centered circular moving average for the bearing_gps column
     with a 3-second window and save it in the bearing_gps_avg column.
     """
     connection = None
@@ -264,23 +201,7 @@ def calculate_moving_average(trip_id):
         connection = connect_to_mysql()
         cursor = connection.cursor(dictionary=True)
 
-        # Step 2: Add the bearing_gps_avg column if it does not exist
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM information_schema.columns
-            WHERE table_name = 'preprocessed_driving_data'
-            AND table_schema = %s
-            AND column_name = 'bearing_gps_avg'
-        """, (MYSQL_DATABASE,))
-        if cursor.fetchone()['COUNT(*)'] == 0:
-            # Add the bearing_gps_avg column
-            cursor.execute("""
-                ALTER TABLE preprocessed_driving_data
-                ADD COLUMN bearing_gps_avg DOUBLE NULL
-            """)
-            connection.commit()
-
-        # Step 3: Fetch all data for the trip_id, ordered by timestamp
+        # Step 2: Fetch all data for the trip_id, ordered by timestamp
         cursor.execute("""
             SELECT timestamp, bearing_gps
             FROM preprocessed_driving_data
@@ -293,23 +214,14 @@ def calculate_moving_average(trip_id):
             print(f"No data found for trip_id: {trip_id}.")
             return
 
-        # Step 4: Calculate the centered moving average
-        moving_averages = [None] * len(data)
-        for i in range(len(data)):
-            # Use the previous, current, and next rows
-            values = []
-            if i > 0 and data[i - 1]['bearing_gps'] is not None:
-                values.append(data[i - 1]['bearing_gps'])
-            if data[i]['bearing_gps'] is not None:
-                values.append(data[i]['bearing_gps'])
-            if i < len(data) - 1 and data[i + 1]['bearing_gps'] is not None:
-                values.append(data[i + 1]['bearing_gps'])
-
-            # Calculate the average if there are valid values
-            if values:
-                moving_averages[i] = sum(values) / len(values)
-
-        # Step 5: Update the database with calculated moving averages
+        # Step 3: Calculate the centered moving average
+        values = np.array([row['bearing_gps'] for row in data], dtype=float)
+        moving_averages = [
+            None if np.isnan(value) else float(value)
+            for value in rolling_circular_mean(values, window=3, center=True)
+        ]
+
+        # Step 4: Update the database with calculated moving averages
         for i, row in enumerate(data):
             cursor.execute("""
                 UPDATE preprocessed_driving_data
@@ -337,23 +249,7 @@ def calculate_speed(trip_id):
         connection = connect_to_mysql()
         cursor = connection.cursor(dictionary=True)
 
-        # Step 2: Add the speed_gps column if it does not exist
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM information_schema.columns
-            WHERE table_name = 'preprocessed_driving_data'
-            AND table_schema = %s
-            AND column_name = 'speed_gps'
-        """, (MYSQL_DATABASE,))
-        if cursor.fetchone()['COUNT(*)'] == 0:
-            # Add the speed_gps column
-            cursor.execute("""
-                ALTER TABLE preprocessed_driving_data
-                ADD COLUMN speed_gps DOUBLE NULL
-            """)
-            connection.commit()
-
-        # Step 3: Fetch all data for the trip_id, ordered by timestamp
+        # Step 2: Fetch all data for the trip_id, ordered by timestamp
         cursor.execute("""
             SELECT timestamp, latitude, longitude
             FROM preprocessed_driving_data
@@ -366,34 +262,19 @@ def calculate_speed(trip_id):
             print(f"No data found for trip_id: {trip_id}.")
             return
 
-        # Step 4: Calculate speed for each row in mph
-        speeds = [None] * len(data)
-        R = 6371000  # Earth's radius in meters
-
-        for i in range(1, len(data)):
-            lat1 = math.radians(data[i - 1]['latitude'])
-            lon1 = math.radians(data[i - 1]['longitude'])
-            lat2 = math.radians(data[i]['latitude'])
-            lon2 = math.radians(data[i]['longitude'])
-
-            delta_lat = lat2 - lat1
-            delta_lon = lon2 - lon1
-
-            # Haversine formula to calculate distance
-            a = math.sin(delta_lat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(delta_lon / 2) ** 2
-            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-            distance = R * c  # Distance in meters
+        # Step 3: Calculate speed for each row in mph from the haversine
+        # distance and time difference to the previous row
+        latitudes = np.array([row['latitude'] for row in data], dtype=float)
+        longitudes = np.array([row['longitude'] for row in data], dtype=float)
+        times = to_datetime64([row['timestamp'] for row in data])
+        distances = step_distances(latitudes, longitudes)
+        time_diffs = np.diff(times) / np.timedelta64(1, "s")
 
-            # Calculate time difference in seconds
-            time1 = datetime.strptime(data[i - 1]['timestamp'], "%Y-%m-%dT%H:%M:%S.%f")
-            time2 = datetime.strptime(data[i]['timestamp'], "%Y-%m-%dT%H:%M:%S.%f")
-            time_diff = (time2 - time1).total_seconds()
-
-            # Calculate speed (mph)
-            if time_diff > 0:
-                speeds[i] = (distance / time_diff) * 2.23694  # Convert m/s to mph
+        with np.errstate(invalid="ignore", divide="ignore"):
+            speed_values = np.where(time_diffs > 0, distances / time_diffs * 2.23694, np.nan)  # Convert m/s to mph
+        speeds = [None] + [None if np.isnan(speed) else float(speed) for speed in speed_values]
 
-        # Step 5: Update the database with calculated speed values
+        # Step 4: Update the database with calculated speed values
         for i, row in enumerate(data):
             cursor.execute("""
                 UPDATE preprocessed_driving_data
@@ -421,23 +302,7 @@ def calculate_speed_moving_average(trip_id):
         connection = connect_to_mysql()
         cursor = connection.cursor(dictionary=True)
 
-        # Step 2: Add the speed_gps_avg column if it does not exist
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM information_schema.columns
-            WHERE table_name = 'preprocessed_driving_data'
-            AND table_schema = %s
-            AND column_name = 'speed_gps_avg'
-        """, (MYSQL_DATABASE,))
-        if cursor.fetchone()['COUNT(*)'] == 0:
-            # Add the speed_gps_avg column
-            cursor.execute("""
-                ALTER TABLE preprocessed_driving_data
-                ADD COLUMN speed_gps_avg DOUBLE NULL
-            """)
-            connection.commit()
-
-        # Step 3: Fetch all data for the trip_id, ordered by timestamp
+        # Step 2: Fetch all data for the trip_id, ordered by timestamp
         cursor.execute("""
             SELECT timestamp, speed_gps
             FROM preprocessed_driving_data
@@ -450,23 +315,14 @@ def calculate_speed_moving_average(trip_id):
             print(f"No data found for trip_id: {trip_id}.")
             return
 
-        # Step 4: Calculate the centered moving average
-        moving_averages = [None] * len(data)
-        for i in range(len(data)):
-            # Use the previous, current, and next rows
-            values = []
-            if i > 0 and data[i - 1]['speed_gps'] is not None:
-                values.append(data[i - 1]['speed_gps'])
-            if data[i]['speed_gps'] is not None:
-                values.append(data[i]['speed_gps'])
-            if i < len(data) - 1 and data[i + 1]['speed_gps'] is not None:
-                values.append(data[i + 1]['speed_gps'])
-
-            # Calculate the average if there are valid values
-            if values:
-                moving_averages[i] = sum(values) / len(values)
-
-        # Step 5: Update the database with calculated moving averages
+        # Step 3: Calculate the centered moving average
+        values = np.array([row['speed_gps'] for row in data], dtype=float)
+        moving_averages = [
+            None if np.isnan(value) else float(value)
+            for value in rolling_mean(values, window=3, center=True)
+        ]
+
+        # Step 4: Update the database with calculated moving averages
         for i, row in enumerate(data):
             cursor.execute("""
                 UPDATE preprocessed_driving_data
@@ -494,23 +350,7 @@ def calculate_acceleration_with_avg_speed(trip_id):
         connection = connect_to_mysql()
         cursor = connection.cursor(dictionary=True)
 
-        # Step 2: Add the acceleration column if it does not exist
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM information_schema.columns
-            WHERE table_name = 'preprocessed_driving_data'
-            AND table_schema = %s
-            AND column_name = 'acceleration'
-        """, (MYSQL_DATABASE,))
-        if cursor.fetchone()['COUNT(*)'] == 0:
-            # Add the acceleration column
-            cursor.execute("""
-                ALTER TABLE preprocessed_driving_data
-                ADD COLUMN acceleration DOUBLE NULL
-            """)
-            connection.commit()
-
-        # Step 3: Fetch all data for the trip_id, ordered by timestamp
+        # Step 2: Fetch all data for the trip_id, ordered by timestamp
         cursor.execute("""
             SELECT timestamp, speed_gps_avg
             FROM preprocessed_driving_data
@@ -523,7 +363,7 @@ def calculate_acceleration_with_avg_speed(trip_id):
             print(f"No data found for trip_id: {trip_id}.")
             return
 
-        # Step 4: Calculate acceleration for each row
+        # Step 3: Calculate acceleration for each row
         accelerations = [None] * len(data)
         for i in range(1, len(data)):
             speed1 = data[i - 1]['speed_gps_avg']  # Speed in mph
@@ -534,15 +374,15 @@ def calculate_acceleration_with_avg_speed(trip_id):
             speed2_mps = speed2 / 3600 if speed2 is not None else None
 
             # Calculate time difference in seconds
-            time1 = datetime.strptime(data[i - 1]['timestamp'], "%Y-%m-%dT%H:%M:%S.%f")
-            time2 = datetime.strptime(data[i]['timestamp'], "%Y-%m-%dT%H:%M:%S.%f")
+            time1 = parse_timestamp(data[i - 1]['timestamp'])
+            time2 = parse_timestamp(data[i]['timestamp'])
             time_diff = (time2 - time1).total_seconds()
 
             # Calculate acceleration
             if speed1_mps is not None and speed2_mps is not None and time_diff > 0:
                 accelerations[i] = (speed2_mps - speed1_mps) / time_diff
 
-        # Step 5: Update the database with calculated acceleration values
+        # Step 4: Update the database with calculated acceleration values
         for i, row in enumerate(data):
             cursor.execute("""
                 UPDATE preprocessed_driving_data
@@ -572,22 +412,6 @@ def calculate_lateral_acceleration(trip_id):
         connection = connect_to_mysql()
         cursor = connection.cursor(dictionary=True)
 
-        # Add the lateral_acceleration column if it doesn't exist
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM information_schema.columns
-            WHERE table_name = 'preprocessed_driving_data'
-            AND table_schema = %s
-            AND column_name = 'lateral_acceleration'
-        """, (MYSQL_DATABASE,))
-        
-        if cursor.fetchone()['COUNT(*)'] == 0:
-            cursor.execute("""
-                ALTER TABLE preprocessed_driving_data
-                ADD COLUMN lateral_acceleration DOUBLE NULL
-            """)
-            connection.commit()
-
         # Fetch all data for the trip_id ordered by timestamp
         cursor.execute("""
             SELECT timestamp, speed_gps_avg, bearing_gps_avg
@@ -656,22 +480,6 @@ def calculate_lateral_acceleration_moving_average(trip_id):
         connection = connect_to_mysql()
         cursor = connection.cursor(dictionary=True)
 
-        # Add the lateral_acceleration_avg column if it doesn't exist
-        cursor.execute("""
-            SELECT COUNT(*)
-            FROM information_schema.columns
-            WHERE table_name = 'preprocessed_driving_data'
-            AND table_schema = %s
-            AND column_name = 'lateral_acceleration_avg'
-        """, (MYSQL_DATABASE,))
-        
-        if cursor.fetchone()['COUNT(*)'] == 0:
-            cursor.execute("""
-                ALTER TABLE preprocessed_driving_data
-                ADD COLUMN lateral_acceleration_avg DOUBLE NULL
-            """)
-            connection.commit()
-
         # Fetch all data for the trip_id ordered by timestamp
         cursor.execute("""
             SELECT timestamp, lateral_acceleration
@@ -686,18 +494,11 @@ def calculate_lateral_acceleration_moving_average(trip_id):
             return
 
         # Calculate the centered moving average
-        moving_averages = [None] * len(data)
-        for i in range(len(data)):
-            values = []
-            if i > 0 and data[i - 1]['lateral_acceleration'] is not None:
-                values.append(data[i - 1]['lateral_acceleration'])
-            if data[i]['lateral_acceleration'] is not None:
-                values.append(data[i]['lateral_acceleration'])
-            if i < len(data) - 1 and data[i + 1]['lateral_acceleration'] is not None:
-                values.append(data[i + 1]['lateral_acceleration'])
-
-            if values:
-                moving_averages[i] = sum(values) / len(values)
+        values = np.array([row['lateral_acceleration'] for row in data], dtype=float)
+        moving_averages = [
+            None if np.isnan(value) else float(value)
+            for value in rolling_mean(values, window=3, center=True)
+        ]
 
         # Update the database with calculated moving averages
         for i, row in enumerate(data):
@@ -716,7 +517,11 @@ def calculate_lateral_acceleration_moving_average(trip_id):
             cursor.close()
             connection.close()
 
-def preprocess_trip_data(trip_id):
+def preprocess_trip_data_by_stage(trip_id):
+    """
+    Run the preprocessing stages one after another, each reading from and
+    writing to the database. Kept for comparison with the in-memory engine.
+    """
     preprocess_timestamp_data(trip_id)
     interpolate_lat_lon(trip_id)
     calculate_bearing(trip_id)
@@ -727,12 +532,28 @@ def preprocess_trip_data(trip_id):
     calculate_lateral_acceleration(trip_id)
     calculate_lateral_acceleration_moving_average(trip_id)
 
+def preprocess_trip_data(trip_id, incremental=False):
+    """
+    Preprocess a trip with the single-pass in-memory engine. With
+    incremental=True only samples appended since the last run are processed.
+    """
+    run_preprocessing_engine(trip_id, incremental=incremental)
+
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python preprocessing.py <trip_id> [--by-stage | --incremental]")
         sys.exit(1)
 
     trip_id = sys.argv[1]
 
-    preprocess_trip_data(trip_id)
+    try:
+        ensure_schema()
+    except Error:
+        sys.exit(1)
+
+    if "--by-stage" in sys.argv[2:]:
+        preprocess_trip_data_by_stage(trip_id)
+    else:
+        preprocess_trip_data(trip_id, incremental="--incremental" in sys.argv[2:])
     print(f"Preprocessed data for trip_id {trip_id} saved in preprocessed_driving_data.")
\ No newline at end of file
@@ -0,0 +1,119 @@
+import os
+import json
+import math
+import time
+import osmnx as ox
+from shapely.geometry import box
+
+from mj.scoring.speed_limit_index import MAX_ROAD_DISTANCE_M, parse_maxspeed, parse_road_id
+
+# Tile cache shared by every profile, at the repository root
+ROAD_TILE_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../..", "road_tiles")
+)
+
+# Side of a tile in degrees (about 1.1 km north-south)
+TILE_DEGREES = 0.01
+
+# Tiles older than this are fetched again
+TILE_TTL_SECONDS = 90 * 24 * 3600
+
+METERS_PER_DEGREE_LAT = 111320
+
+
+def trip_tiles(lats, lons, buffer=MAX_ROAD_DISTANCE_M, tile_degrees=TILE_DEGREES):
+    """
+    Return the sorted keys (tile_lat, tile_lon) of every tile within buffer
+    meters of a sample, a corridor around the trip rather than its whole
+    bounding box. Samples without a position are ignored.
+    """
+    tiles = set()
+    buffer_lat = buffer / METERS_PER_DEGREE_LAT
+    for lat, lon in zip(lats, lons):
+        if lat is None or lon is None or math.isnan(lat) or math.isnan(lon):
+            continue
+        buffer_lon = buffer_lat / max(math.cos(math.radians(lat)), 1e-6)
+        first_lat, last_lat = int((lat - buffer_lat) // tile_degrees), int((lat + buffer_lat) // tile_degrees)
+        first_lon, last_lon = int((lon - buffer_lon) // tile_degrees), int((lon + buffer_lon) // tile_degrees)
+        for tile_lat in range(first_lat, last_lat + 1):
+            for tile_lon in range(first_lon, last_lon + 1):
+                tiles.add((tile_lat, tile_lon))
+    return sorted(tiles)
+
+
+def tile_path(tile, tile_degrees=TILE_DEGREES, tile_dir=ROAD_TILE_DIR):
+    return os.path.join(tile_dir, f"{tile_degrees:g}_{tile[0]}_{tile[1]}.json")
+
+
+def fetch_tile_roads(tile, tile_degrees=TILE_DEGREES):
+    """
+    Fetch the roads with a maxspeed in one tile from OpenStreetMap.
+    Returns a list of (coordinates, speed limit in mph, OSM way id).
+    """
+    south, west = tile[0] * tile_degrees, tile[1] * tile_degrees
+    try:
+        gdf = ox.features_from_polygon(
+            box(west, south, west + tile_degrees, south + tile_degrees), {'highway': True}
+        )
+    except Exception as e:
+        # osmnx raises InsufficientResponseError for an area without roads
+        if type(e).__name__ != "InsufficientResponseError":
+            raise
+        return []
+    if 'maxspeed' not in gdf.columns:
+        return []
+
+    roads = []
+    for key, row in gdf[gdf['maxspeed'].notna()].iterrows():
+        speed_limit = parse_maxspeed(row['maxspeed'])
+        road_id = parse_road_id(key[-1] if isinstance(key, tuple) else key)
+        geometry = row['geometry']
+        if speed_limit is None:
+            continue
+        if geometry.geom_type == "LineString":
+            lines = [geometry]
+        elif geometry.geom_type == "MultiLineString":
+            lines = list(geometry.geoms)
+        else:
+            continue
+        roads.extend(([list(point) for point in line.coords], speed_limit, road_id) for line in lines)
+    return roads
+
+
+def load_tile_roads(tile, tile_degrees=TILE_DEGREES, tile_dir=ROAD_TILE_DIR, ttl=TILE_TTL_SECONDS):
+    """
+    Return the roads of a tile from the disk cache, fetching and caching
+    the tile if it is missing or expired. Returns (roads, fetched).
+    """
+    path = tile_path(tile, tile_degrees, tile_dir)
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) <= ttl:
+        with open(path) as f:
+            return [tuple(road) for road in json.load(f)], False
+
+    roads = fetch_tile_roads(tile, tile_degrees)
+
+    # Write to a temporary file first so concurrent trips never read a
+    # partly written tile
+    os.makedirs(tile_dir, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(roads, f)
+    os.replace(temporary_path, path)
+    return roads, True
+
+
+def load_trip_roads(lats, lons, tile_degrees=TILE_DEGREES, tile_dir=ROAD_TILE_DIR):
+    """
+    Load the roads around a whole trip, one external request per tile not
+    yet cached on disk. Roads crossing several tiles are kept once.
+    Returns (roads, tile count, tiles fetched).
+    """
+    tiles = trip_tiles(lats, lons, tile_degrees=tile_degrees)
+    roads = {}
+    fetched = 0
+    for tile in tiles:
+        tile_roads, was_fetched = load_tile_roads(tile, tile_degrees, tile_dir)
+        fetched += was_fetched
+        for coordinates, speed_limit, road_id in tile_roads:
+            roads[(road_id, tuple(coordinates[0]))] = (coordinates, speed_limit, road_id)
+    return list(roads.values()), len(tiles), fetched
@@ -0,0 +1,335 @@
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../..")
+    )
+)
+
+import numpy as np
+from mj.sql.database import connect_to_mysql
+from mj.sql.bulk_writer import BULK_BATCH_SIZE, upsert_rows
+from mj.sql.penalty_events import EVENT_COLUMNS, replace_trip_events, replace_trip_episodes
+from mj.sql.schema import ensure_schema
+from mj.scoring.speed import (
+    get_sample_speed_limit,
+    find_nearest_speed_limit,
+    prefetch_trip_roads,
+    report_speed_limit_cache
+)
+from mj.scoring.bands import PENALTY_BANDS, classify_bands
+from mj.scoring.episodes import iter_episodes, episode_penalties
+from mj.scoring.preprocessing_engine import to_datetime64, to_sql_values
+from mj.scoring.map_matching import NO_SEGMENT
+
+# Scoring criteria, in the order of the scores_data columns
+CRITERIA = ["acceleration", "braking", "speeding", "cornering"]
+
+# Default penalty basis: "samples" penalizes every flagged sample,
+# "episodes" penalizes each run of consecutive events once
+PENALTY_BASIS = "samples"
+
+
+def load_scoring_columns(cursor, trip_id):
+    """
+    Read every column the scoring criteria need for a trip in one query,
+    ordered by timestamp. Missing values are NaN in the numeric columns.
+    """
+    cursor.execute("""
+        SELECT timestamp, latitude, longitude, acceleration, speed_gps_avg, lateral_acceleration_avg,
+               segment_id
+        FROM preprocessed_driving_data
+        WHERE trip_id = %s
+        ORDER BY timestamp
+    """, (trip_id,))
+    data = cursor.fetchall()
+
+    if not data:
+        return None
+
+    timestamps, latitudes, longitudes, accelerations, speeds, lateral_accelerations, segment_ids = zip(*data)
+    return {
+        "timestamp": list(timestamps),
+        "latitude": list(latitudes),
+        "longitude": list(longitudes),
+        "acceleration": np.array(accelerations, dtype=float),
+        "speed_gps_avg": np.array(speeds, dtype=float),
+        "lateral_acceleration_avg": np.array(lateral_accelerations, dtype=float),
+        "segment_id": list(segment_ids),
+    }
+
+
+def scoring_columns_from_preprocessed(columns):
+    """
+    Build the scoring columns from the in-memory columns of a full
+    preprocessing run, so a trip that was just preprocessed is not read
+    back from the database.
+    """
+    return {
+        "timestamp": list(columns["timestamp"]),
+        "latitude": to_sql_values(columns["latitude_filled"]).tolist(),
+        "longitude": to_sql_values(columns["longitude_filled"]).tolist(),
+        "acceleration": columns["acceleration"],
+        "speed_gps_avg": columns["speed_gps_avg"],
+        "lateral_acceleration_avg": columns["lateral_acceleration_avg"],
+        "segment_id": [
+            None if segment_id == NO_SEGMENT else segment_id
+            for segment_id in columns["segment_id"].tolist()
+        ],
+    }
+
+
+def convert_to_g_force(acceleration_mps2):
+    """
+    Convert acceleration from miles per second squared to G-force.
+    """
+    return (acceleration_mps2 * 1609.34) / 9.80665
+
+
+def over_speed_percentage(speeds, speed_limits):
+    """
+    Percentage by which each speed exceeds its speed limit.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (speeds - speed_limits) / speed_limits * 100
+
+
+def resolve_speed_limits(columns):
+    """
+    Look up the speed limit of every sample with a speed, once per matched
+    road segment or from the roads prefetched for the trip, in timestamp
+    order so the nearest-point fallback sees the same cache as speed.py.
+    Samples without a speed or a known limit are NaN.
+    """
+    prefetch_trip_roads(columns["latitude"], columns["longitude"])
+    speed_limits = np.full(len(columns["timestamp"]), np.nan)
+    segment_limits = {}
+    for i, timestamp in enumerate(columns["timestamp"]):
+        if np.isnan(columns["speed_gps_avg"][i]):
+            print(f"Skipping row at {timestamp} (missing speed data).")
+            continue
+
+        latitude, longitude = columns["latitude"][i], columns["longitude"][i]
+        speed_limit = get_sample_speed_limit(latitude, longitude, columns["segment_id"][i], segment_limits)
+        if speed_limit is None:
+            speed_limit = find_nearest_speed_limit(latitude, longitude)
+
+        if speed_limit is None:
+            print(f"No nearest speed limit found for row at {timestamp}. Skipping.")
+            continue
+        speed_limits[i] = speed_limit
+
+    report_speed_limit_cache()
+    return speed_limits
+
+
+def normalized_score(criterion, penalties, trip_duration):
+    """
+    Normalize the penalty points of a criterion to a 0-100 score, no
+    lower than the criterion's floor in PENALTY_BANDS.
+    """
+    if not penalties.any():
+        return 100.0  # Perfect score if no penalties
+    total_score = int(penalties.sum())
+    return max(PENALTY_BANDS[criterion]["floor"], 100 - (total_score / trip_duration * 100))
+
+
+def criterion_magnitudes(criterion, columns):
+    """
+    Return the values the bands of a criterion are applied to: G-force for
+    acceleration and braking, lateral acceleration for cornering and the
+    percentage over the speed limit for speeding.
+    """
+    if criterion in ("acceleration", "braking"):
+        return convert_to_g_force(columns["acceleration"])
+    if criterion == "cornering":
+        return columns["lateral_acceleration_avg"]
+    if criterion == "speeding":
+        return over_speed_percentage(columns["speed_gps_avg"], resolve_speed_limits(columns))
+    raise ValueError(f"Unknown scoring criterion: {criterion}")
+
+
+def evaluate_criterion(criterion, columns):
+    """
+    Evaluate one criterion for every sample. Returns (events, penalties,
+    magnitudes). Criteria are independent of each other, so they can be
+    evaluated concurrently.
+    """
+    magnitudes = criterion_magnitudes(criterion, columns)
+    return classify_bands(criterion, magnitudes) + (magnitudes,)
+
+
+def evaluate_trip(columns):
+    """
+    Evaluate every criterion for every sample. Returns a dictionary of
+    criterion -> (events, penalties, magnitudes).
+    """
+    return {criterion: evaluate_criterion(criterion, columns) for criterion in CRITERIA}
+
+
+def detect_trip_episodes(results):
+    """
+    Merge consecutive events of every criterion into episodes.
+    Returns a dictionary of criterion -> list of episodes.
+    """
+    return {
+        criterion: list(iter_episodes(events, penalties, magnitudes))
+        for criterion, (events, penalties, magnitudes) in results.items()
+    }
+
+
+def write_penalty_events(cursor, trip_id, columns, results, batch_size=BULK_BATCH_SIZE):
+    """
+    Replace the stored events of the trip with the samples that carry
+    at least one event.
+    """
+    events = [results[column.replace("_event", "")][0] for column in EVENT_COLUMNS]
+    has_event = np.any([criterion_events.astype(bool) for criterion_events in events], axis=0)
+
+    rows = [
+        (trip_id, columns["timestamp"][i], columns["latitude"][i], columns["longitude"][i])
+        + tuple(criterion_events[i] for criterion_events in events)
+        for i in np.flatnonzero(has_event)
+    ]
+    return replace_trip_events(cursor, trip_id, rows, batch_size)
+
+
+def write_penalty_episodes(cursor, trip_id, columns, results, episodes, batch_size=BULK_BATCH_SIZE):
+    """
+    Replace the stored episodes of the trip.
+    """
+    times = to_datetime64(columns["timestamp"])
+    rows = []
+    for criterion, criterion_episodes in episodes.items():
+        magnitudes = results[criterion][2]
+        for episode in criterion_episodes:
+            first, last, peak = episode["first"], episode["last"], episode["peak"]
+            rows.append((
+                trip_id,
+                criterion,
+                columns["timestamp"][first],
+                columns["timestamp"][last],
+                float((times[last] - times[first]) / np.timedelta64(1, "s")),
+                episode["sample_count"],
+                episode["event"],
+                episode["penalty"],
+                columns["timestamp"][peak],
+                float(magnitudes[peak]),
+                columns["latitude"][peak],
+                columns["longitude"][peak]
+            ))
+    return replace_trip_episodes(cursor, trip_id, rows, batch_size)
+
+
+def write_scores(cursor, trip_id, scores):
+    """
+    Insert or update every component score of a trip in one statement.
+    """
+    score_columns = [f"{criterion}_score" for criterion in scores]
+    upsert_rows(
+        cursor,
+        "scores_data",
+        ["trip_id"] + score_columns,
+        [(trip_id,) + tuple(scores.values())],
+        update_columns=score_columns
+    )
+
+
+def store_trip_scores(trip_id, connection, columns, results, batch_size=BULK_BATCH_SIZE,
+                      basis=PENALTY_BASIS):
+    """
+    Merge episodes, score each criterion on the chosen penalty basis and
+    write all events, episodes and component scores in one transaction.
+    Returns a dictionary of component scores.
+    """
+    trip_duration = len(columns["timestamp"])
+    episodes = detect_trip_episodes(results)
+
+    # Score each criterion on the chosen penalty basis
+    if basis == "episodes":
+        penalties = {criterion: episode_penalties(episodes[criterion]) for criterion in results}
+    elif basis == "samples":
+        penalties = {criterion: results[criterion][1] for criterion in results}
+    else:
+        raise ValueError(f"Unknown penalty basis: {basis}")
+    scores = {
+        criterion: normalized_score(criterion, penalties[criterion], trip_duration)
+        for criterion in results
+    }
+
+    # Write events, episodes and scores in one transaction
+    cursor = connection.cursor()
+    try:
+        write_penalty_events(cursor, trip_id, columns, results, batch_size)
+        write_penalty_episodes(cursor, trip_id, columns, results, episodes, batch_size)
+        write_scores(cursor, trip_id, scores)
+        connection.commit()
+    finally:
+        cursor.close()
+
+    for criterion, score in scores.items():
+        print(f"{criterion.capitalize()} scores updated for trip_id {trip_id}. "
+              f"Final {criterion} score: {score:.2f}")
+    return scores
+
+
+def score_trip(trip_id, connection, batch_size=BULK_BATCH_SIZE, basis=PENALTY_BASIS, columns=None):
+    """
+    Score acceleration, braking, speeding and cornering for a trip in a
+    single pass: read the trip once, evaluate every criterion vectorized
+    and write all events, episodes and component scores in one transaction.
+    basis is "samples" to penalize every flagged sample or "episodes" to
+    penalize each run of consecutive events once. columns may be passed
+    in to skip reading the trip, see scoring_columns_from_preprocessed.
+    Returns a dictionary of component scores, or None if there is no data.
+    """
+    try:
+        # Step 1: Read the trip once
+        if columns is None:
+            cursor = connection.cursor()
+            try:
+                columns = load_scoring_columns(cursor, trip_id)
+            finally:
+                cursor.close()
+        if columns is None:
+            print("No data found for scoring.")
+            return None
+
+        # Step 2: Evaluate every criterion for every sample
+        results = evaluate_trip(columns)
+
+        # Step 3: Score and write everything in one transaction
+        return store_trip_scores(trip_id, connection, columns, results, batch_size, basis)
+
+    except Exception as e:
+        connection.rollback()
+        print(f"Error scoring data: {e}")
+        raise
+
+
+# Main Execution
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3) or (len(sys.argv) == 3 and sys.argv[2] != "--episodes"):
+        print("Usage: python scoring_engine.py <trip_id> [--episodes]")
+        sys.exit(1)
+
+    trip_id = sys.argv[1]
+    basis = "episodes" if len(sys.argv) == 3 else PENALTY_BASIS
+
+    connection = connect_to_mysql()
+
+    try:
+        # Make sure the schema is up to date
+        ensure_schema(connection)
+
+        # Score every criterion in one pass
+        score_trip(trip_id, connection, basis=basis)
+
+    except Exception:
+        sys.exit(1)
+
+    finally:
+        if connection.is_connected():
+            connection.close()
@@ -0,0 +1,161 @@
+from mj.sql.bulk_writer import BULK_BATCH_SIZE, upsert_rows
+
+# Event columns of penalty_events_data. Only samples with at least one
+# non-NULL event are stored.
+EVENT_COLUMNS = [
+    "acceleration_event",
+    "braking_event",
+    "speeding_event",
+    "cornering_event"
+]
+
+EVENT_ROW_COLUMNS = ["trip_id", "timestamp", "latitude", "longitude"] + EVENT_COLUMNS
+
+# Columns of penalty_episodes_data, one row per run of consecutive events
+EPISODE_COLUMNS = [
+    "trip_id",
+    "criterion",
+    "start_timestamp",
+    "end_timestamp",
+    "duration_seconds",
+    "sample_count",
+    "severity",
+    "penalty",
+    "peak_timestamp",
+    "peak_magnitude",
+    "latitude",
+    "longitude"
+]
+
+# Condition matching rows that carry no event at all
+NO_EVENT_CONDITION = " AND ".join(f"{column} IS NULL" for column in EVENT_COLUMNS)
+
+
+def clear_events(cursor, trip_id, column):
+    """
+    Reset one event column of a trip before it is rescored.
+    """
+    if column not in EVENT_COLUMNS:
+        raise ValueError(f"Unknown event column: {column}")
+    cursor.execute(f"""
+        UPDATE penalty_events_data
+        SET {column} = NULL
+        WHERE trip_id = %s AND {column} IS NOT NULL
+    """, (trip_id,))
+
+
+def prune_empty_events(cursor, trip_id=None):
+    """
+    Delete rows with no event, for one trip or for the whole table.
+    Returns the number of rows deleted.
+    """
+    if trip_id is None:
+        cursor.execute(f"DELETE FROM penalty_events_data WHERE {NO_EVENT_CONDITION}")
+    else:
+        cursor.execute(f"""
+            DELETE FROM penalty_events_data
+            WHERE trip_id = %s AND {NO_EVENT_CONDITION}
+        """, (trip_id,))
+    return cursor.rowcount
+
+
+def replace_trip_events(cursor, trip_id, rows, batch_size=BULK_BATCH_SIZE):
+    """
+    Replace every event of a trip with rows of (trip_id, timestamp,
+    latitude, longitude, acceleration_event, braking_event, speeding_event,
+    cornering_event). Rows without any event are skipped.
+    Returns the number of rows written; the caller commits.
+    """
+    cursor.execute("DELETE FROM penalty_events_data WHERE trip_id = %s", (trip_id,))
+    event_rows = (row for row in rows if any(event is not None for event in row[4:]))
+    return upsert_rows(
+        cursor,
+        "penalty_events_data",
+        EVENT_ROW_COLUMNS,
+        event_rows,
+        update_columns=EVENT_COLUMNS,
+        batch_size=batch_size
+    )
+
+
+def replace_trip_episodes(cursor, trip_id, rows, batch_size=BULK_BATCH_SIZE):
+    """
+    Replace every episode of a trip with rows in EPISODE_COLUMNS order.
+    Returns the number of rows written; the caller commits.
+    """
+    cursor.execute("DELETE FROM penalty_episodes_data WHERE trip_id = %s", (trip_id,))
+    return upsert_rows(
+        cursor,
+        "penalty_episodes_data",
+        EPISODE_COLUMNS,
+        rows,
+        update_columns=EPISODE_COLUMNS[3:],
+        batch_size=batch_size
+    )
+
+
+def get_penalty_events(cursor, trip_id, severity=None):
+    """
+    Return the stored events of a trip ordered by timestamp, optionally
+    only the samples with at least one event of the given severity.
+    """
+    if severity is None:
+        cursor.execute("""
+            SELECT timestamp, latitude, longitude,
+                   acceleration_event, braking_event, speeding_event, cornering_event
+            FROM penalty_events_data
+            WHERE trip_id = %s
+            ORDER BY timestamp
+        """, (trip_id,))
+    else:
+        matches = " OR ".join(f"{column} = %s" for column in EVENT_COLUMNS)
+        cursor.execute(f"""
+            SELECT timestamp, latitude, longitude,
+                   acceleration_event, braking_event, speeding_event, cornering_event
+            FROM penalty_events_data
+            WHERE trip_id = %s AND ({matches})
+            ORDER BY timestamp
+        """, (trip_id,) + (severity,) * len(EVENT_COLUMNS))
+    return cursor.fetchall()
+
+
+def count_penalty_events(cursor, trip_id):
+    """
+    Return {event column: {"mild": count, "severe": count}} for a trip.
+    """
+    counts = ", ".join(
+        f"SUM({column} = 'mild'), SUM({column} = 'severe')" for column in EVENT_COLUMNS
+    )
+    cursor.execute(f"""
+        SELECT {counts}
+        FROM penalty_events_data
+        WHERE trip_id = %s
+    """, (trip_id,))
+    result = cursor.fetchone()
+    return {
+        column: {"mild": int(result[2 * i] or 0), "severe": int(result[2 * i + 1] or 0)}
+        for i, column in enumerate(EVENT_COLUMNS)
+    }
+
+
+def get_penalty_episodes(cursor, trip_id, severity=None):
+    """
+    Return the episodes of a trip ordered by start time, optionally only
+    those of the given severity.
+    """
+    columns = ", ".join(EPISODE_COLUMNS[1:])
+    if severity is None:
+        cursor.execute(f"""
+            SELECT {columns}
+            FROM penalty_episodes_data
+            WHERE trip_id = %s
+            ORDER BY start_timestamp
+        """, (trip_id,))
+    else:
+        cursor.execute(f"""
+            SELECT {columns}
+            FROM penalty_episodes_data
+            WHERE trip_id = %s AND severity = %s
+            ORDER BY start_timestamp
+        """, (trip_id, severity))
+    return cursor.fetchall()
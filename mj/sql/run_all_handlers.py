@@ -24,6 +24,9 @@ if __name__ == "__main__":
 
     trip_id = sys.argv[1]
 
+    # Start and end of the trip in epoch milliseconds, when main.py recorded them
+    trip_window = sys.argv[2:4]
+
     print(f"Running handlers for Trip ID: {trip_id}")
 
     # Run user_info_handler.py
@@ -32,7 +35,7 @@ if __name__ == "__main__":
 
     # Run trip_mapping_handler.py
     print("Running trip_mapping_handler.py...")
-    run_script("sql/trip_mapping_handler.py", trip_id, GPS_DEVICE_ID, SENSOR_DEVICE_ID)
+    run_script("sql/trip_mapping_handler.py", trip_id, GPS_DEVICE_ID, SENSOR_DEVICE_ID, *trip_window)
 
     # Run telemetry_saver.py
     print("Running telemetry_saver.py...")
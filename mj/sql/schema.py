@@ -0,0 +1,330 @@
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../..")
+    )
+)
+
+from mysql.connector import Error, errorcode
+from mj.sql.database import connect_to_mysql
+from mj.sql.timestamps import TIMESTAMP_SQL_TYPE
+from mj.sql.penalty_events import prune_empty_events
+
+# Columns added to older databases by the per-script ALTER TABLE checks
+PREPROCESSED_DERIVED_COLUMNS = [
+    "bearing_gps",
+    "bearing_gps_avg",
+    "speed_gps",
+    "speed_gps_avg",
+    "acceleration",
+    "lateral_acceleration",
+    "lateral_acceleration_avg"
+]
+
+# Version 1: the full schema used by data collection, preprocessing and scoring
+CREATE_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS user_info (
+        gps_device_id VARCHAR(255),
+        sensor_device_id VARCHAR(255),
+        name VARCHAR(255),
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (gps_device_id, sensor_device_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS device_trip_mapping (
+        trip_id VARCHAR(255) PRIMARY KEY,
+        gps_device_id VARCHAR(255),
+        sensor_device_id VARCHAR(255),
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (gps_device_id, sensor_device_id)
+            REFERENCES user_info(gps_device_id, sensor_device_id)
+            ON DELETE CASCADE
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS driving_data (
+        trip_id VARCHAR(255),
+        timestamp {TIMESTAMP_SQL_TYPE},
+        latitude DOUBLE,
+        longitude DOUBLE,
+        bearing DOUBLE,
+        speed DOUBLE,
+        PRIMARY KEY (trip_id, timestamp),
+        FOREIGN KEY (trip_id)
+            REFERENCES device_trip_mapping(trip_id)
+            ON DELETE CASCADE
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS sensors_data (
+        trip_id VARCHAR(255),
+        timestamp {TIMESTAMP_SQL_TYPE},
+        accelerometer JSON,
+        gyroscope JSON,
+        linear_acceleration JSON,
+        magnetometer JSON,
+        PRIMARY KEY (trip_id, timestamp),
+        FOREIGN KEY (trip_id)
+            REFERENCES device_trip_mapping(trip_id)
+            ON DELETE CASCADE
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS preprocessed_driving_data (
+        trip_id VARCHAR(255),
+        timestamp {TIMESTAMP_SQL_TYPE},
+        latitude DOUBLE NULL,
+        longitude DOUBLE NULL,
+        bearing DOUBLE NULL,
+        speed DOUBLE NULL,
+        bearing_gps DOUBLE NULL,
+        bearing_gps_avg DOUBLE NULL,
+        speed_gps DOUBLE NULL,
+        speed_gps_avg DOUBLE NULL,
+        acceleration DOUBLE NULL,
+        lateral_acceleration DOUBLE NULL,
+        lateral_acceleration_avg DOUBLE NULL,
+        PRIMARY KEY (trip_id, timestamp)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS scores_data (
+        trip_id VARCHAR(255) PRIMARY KEY,
+        acceleration_score FLOAT DEFAULT 100,
+        braking_score FLOAT DEFAULT 100,
+        speeding_score FLOAT DEFAULT 100,
+        cornering_score FLOAT DEFAULT 100,
+        final_score FLOAT
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS penalty_events_data (
+        trip_id VARCHAR(255),
+        timestamp {TIMESTAMP_SQL_TYPE},
+        latitude DOUBLE,
+        longitude DOUBLE,
+        acceleration_event VARCHAR(10),
+        braking_event VARCHAR(10),
+        speeding_event VARCHAR(10),
+        cornering_event VARCHAR(10),
+        PRIMARY KEY (trip_id, timestamp)
+    )
+    """
+]
+
+# Set once the schema has been checked in this process
+_schema_checked = False
+
+
+def add_missing_columns(cursor, table_name, columns):
+    """
+    Add any of the given (name, definition) columns that a table created
+    by an older version of the scripts is missing.
+    """
+    cursor.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s
+    """, (table_name,))
+    existing_columns = {row[0] for row in cursor.fetchall()}
+
+    additions = [
+        f"ADD COLUMN {name} {definition}"
+        for name, definition in columns
+        if name not in existing_columns
+    ]
+    if additions:
+        cursor.execute(f"ALTER TABLE {table_name} {', '.join(additions)}")
+
+
+def create_base_schema(cursor):
+    """
+    Create every table and bring tables from older databases up to date.
+    """
+    for statement in CREATE_TABLES:
+        cursor.execute(statement)
+
+    add_missing_columns(
+        cursor,
+        "preprocessed_driving_data",
+        [(name, "DOUBLE NULL") for name in PREPROCESSED_DERIVED_COLUMNS]
+    )
+    add_missing_columns(cursor, "scores_data", [
+        ("braking_score", "FLOAT"),
+        ("speeding_score", "FLOAT"),
+        ("cornering_score", "FLOAT"),
+        ("final_score", "FLOAT")
+    ])
+    add_missing_columns(cursor, "penalty_events_data", [
+        ("braking_event", "VARCHAR(10)"),
+        ("speeding_event", "VARCHAR(10)"),
+        ("cornering_event", "VARCHAR(10)")
+    ])
+
+
+def create_preprocessing_state(cursor):
+    """
+    Track the last driving_data timestamp preprocessed for each trip.
+    """
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS preprocessing_state (
+            trip_id VARCHAR(255) PRIMARY KEY,
+            high_water_mark {TIMESTAMP_SQL_TYPE},
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def prune_penalty_events(cursor):
+    """
+    Delete the penalty_events_data rows written for samples without any
+    event, now that only samples with an event are stored.
+    """
+    deleted = prune_empty_events(cursor)
+    print(f"Pruned {deleted} penalty_events_data rows without an event.")
+
+
+def create_penalty_episodes(cursor):
+    """
+    Store runs of consecutive penalty events as one episode each.
+    """
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS penalty_episodes_data (
+            trip_id VARCHAR(255),
+            criterion VARCHAR(20),
+            start_timestamp {TIMESTAMP_SQL_TYPE},
+            end_timestamp {TIMESTAMP_SQL_TYPE},
+            duration_seconds DOUBLE,
+            sample_count INT,
+            severity VARCHAR(10),
+            penalty INT,
+            peak_timestamp {TIMESTAMP_SQL_TYPE},
+            peak_magnitude DOUBLE,
+            latitude DOUBLE,
+            longitude DOUBLE,
+            PRIMARY KEY (trip_id, criterion, start_timestamp),
+            INDEX idx_trip_severity (trip_id, severity)
+        )
+    """)
+
+
+def add_segment_ids(cursor):
+    """
+    Store the road segment each preprocessed sample was matched to.
+    """
+    add_missing_columns(cursor, "preprocessed_driving_data", [("segment_id", "BIGINT NULL")])
+
+
+def add_trip_windows(cursor):
+    """
+    Record when each trip started and ended, in epoch milliseconds, so
+    telemetry can be fetched for the trip's time window only.
+    """
+    add_missing_columns(cursor, "device_trip_mapping", [
+        ("start_ts", "BIGINT NULL"),
+        ("end_ts", "BIGINT NULL")
+    ])
+
+
+def create_sync_state(cursor):
+    """
+    Track the last ThingsBoard telemetry timestamp ingested for each device
+    and key set, so each sync only fetches newer telemetry.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            device_id VARCHAR(255),
+            key_set VARCHAR(20),
+            last_ts BIGINT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (device_id, key_set)
+        )
+    """)
+
+
+# Ordered list of (version, description, migration function)
+MIGRATIONS = [
+    (1, "Create base schema", create_base_schema),
+    (2, "Add preprocessing_state high-water marks", create_preprocessing_state),
+    (3, "Prune penalty_events_data rows without an event", prune_penalty_events),
+    (4, "Add penalty_episodes_data", create_penalty_episodes),
+    (5, "Add segment_id to preprocessed_driving_data", add_segment_ids),
+    (6, "Add trip start and end times to device_trip_mapping", add_trip_windows),
+    (7, "Add sync_state ingestion watermarks", create_sync_state),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(cursor):
+    """
+    Return the schema version recorded in the database, creating the
+    schema_version table on first use.
+    """
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        version = cursor.fetchone()[0]
+        return version or 0
+    except Error as e:
+        if e.errno != errorcode.ER_NO_SUCH_TABLE:
+            raise
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description VARCHAR(255),
+                applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        return 0
+
+
+def ensure_schema(connection=None):
+    """
+    Bring the database schema up to SCHEMA_VERSION. The schema_version
+    table is checked once per process; later calls return immediately,
+    so scoring and ingestion code never issues DDL or metadata queries.
+    Errors, including a database that cannot be reached, are reported and
+    raised to the caller.
+    """
+    global _schema_checked
+    if _schema_checked:
+        return
+
+    owns_connection = connection is None
+    try:
+        if owns_connection:
+            connection = connect_to_mysql()
+        cursor = connection.cursor()
+        current_version = get_schema_version(cursor)
+
+        for version, description, migrate in MIGRATIONS:
+            if version <= current_version:
+                continue
+            print(f"Applying schema migration {version}: {description}")
+            migrate(cursor)
+            cursor.execute("""
+                INSERT INTO schema_version (version, description)
+                VALUES (%s, %s)
+            """, (version, description))
+            connection.commit()
+
+        _schema_checked = True
+    except Error as e:
+        print(f"Error updating database schema: {e}")
+        raise
+    finally:
+        if owns_connection and connection is not None:
+            connection.close()
+
+
+if __name__ == "__main__":
+    try:
+        ensure_schema()
+    except Error:
+        sys.exit(1)
+    print(f"Database schema is at version {SCHEMA_VERSION}.")
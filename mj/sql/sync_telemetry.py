@@ -0,0 +1,94 @@
+import sys
+import os
+import time
+import argparse
+import requests
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../..")
+    )
+)
+from sql.database import DatabaseConnectionError, mysql_connection, report_pool_stats
+from sql.schema import ensure_schema
+from sql.telemetry_saver import get_jwt_token, sync_device
+from mysql.connector import Error
+
+
+def get_devices(cursor):
+    """
+    Return the (gps_device_id, sensor_device_id) pairs of every user.
+    """
+    cursor.execute("""
+        SELECT gps_device_id, sensor_device_id
+        FROM user_info
+        ORDER BY gps_device_id, sensor_device_id
+    """)
+    return cursor.fetchall()
+
+
+def sync_all_devices(connection, method=None):
+    """
+    Ingest the new telemetry of every user's devices. A device that fails is
+    reported and retried from its watermark on the next run. method is
+    passed to write_rows for each page. Returns the number of rows written
+    and the number of device key sets that failed.
+    """
+    jwt_token = get_jwt_token()
+    devices = get_devices(connection.cursor())
+
+    written = failed = 0
+    for gps_device_id, sensor_device_id in devices:
+        for device_id, key_set in ((gps_device_id, "gps"), (sensor_device_id, "sensors")):
+            try:
+                rows = sync_device(connection, jwt_token, device_id, key_set, method=method)
+            except (Error, requests.RequestException) as e:
+                print(f"Error syncing {key_set} data of device {device_id}: {e}")
+                failed += 1
+                continue
+            if rows:
+                print(f"Device {device_id}: saved {rows} new {key_set} rows.")
+            written += rows
+    return written, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep driving_data and sensors_data current with ThingsBoard for every user's devices."
+    )
+    parser.add_argument("--interval", type=float,
+                        help="Sync again every INTERVAL seconds instead of once")
+    parser.add_argument("--method", choices=["executemany", "load_data"],
+                        help="How each page is written (default: by page size)")
+    args = parser.parse_args()
+
+    # Make sure the schema is up to date
+    try:
+        ensure_schema()
+    except Error:
+        sys.exit(1)
+
+    try:
+        while True:
+            # Each run checks out a pooled connection, health checked after
+            # the idle time between runs
+            start = time.perf_counter()
+            try:
+                with mysql_connection(allow_local_infile=True) as connection:
+                    written, failed = sync_all_devices(connection, args.method)
+                print(f"Synced {written} new rows in {time.perf_counter() - start:.2f}s.")
+                if failed:
+                    print(f"{failed} device syncs failed and resume from their watermark next run.")
+            except (DatabaseConnectionError, requests.RequestException) as e:
+                print(f"Error: {e}")
+                failed = True
+            report_pool_stats()
+            if args.interval is None:
+                if failed:
+                    sys.exit(1)
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("Sync stopped.")
+
+if __name__ == "__main__":
+    main()
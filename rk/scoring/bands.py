@@ -0,0 +1,87 @@
+import numpy as np
+
+# Penalty bands for each scoring criterion. A value moves past an edge
+# when it compares true with the edge's operator, and the number of edges
+# passed selects the band: edges must be in increasing order and there is
+# one label and penalty per band (len(edges) + 1). "absolute" classifies
+# the magnitude of the value, and "floor" is the lowest score the
+# criterion can reach once it has a penalty.
+PENALTY_BANDS = {
+    # Longitudinal acceleration in G-force
+    "acceleration": {
+        "edges": [(0.15, ">="), (0.25, ">=")],
+        "labels": [None, "mild", "severe"],
+        "penalties": [0, 5, 10],
+        "floor": 10
+    },
+    # Longitudinal acceleration in G-force, negative when braking
+    "braking": {
+        "edges": [(-0.25, ">="), (-0.15, ">=")],
+        "labels": ["severe", "mild", None],
+        "penalties": [10, 5, 0],
+        "floor": 10
+    },
+    # Percentage over the speed limit
+    "speeding": {
+        "edges": [(5, ">="), (10, ">")],
+        "labels": [None, "mild", "severe"],
+        "penalties": [0, 5, 10],
+        "floor": 0
+    },
+    # Lateral acceleration in G-force, either direction
+    "cornering": {
+        "edges": [(0.18, ">="), (0.35, ">=")],
+        "labels": [None, "mild", "severe"],
+        "penalties": [0, 5, 10],
+        "floor": 10,
+        "absolute": True
+    }
+}
+
+EDGE_OPERATORS = {
+    ">=": np.greater_equal,
+    ">": np.greater
+}
+
+
+def band_index(values, edges):
+    """
+    Return the band of each value: the number of edges it has passed.
+    """
+    index = np.zeros(np.shape(values), dtype=np.int64)
+    for edge, operator in edges:
+        index += EDGE_OPERATORS[operator](values, edge)
+    return index
+
+
+def classify_bands(criterion, values, bands=PENALTY_BANDS):
+    """
+    Classify a whole array of values for a criterion in one call.
+    Returns (events, penalties): event labels as an object array with
+    None outside every penalty band, and integer penalty points.
+    NaN values get no event and no penalty.
+    """
+    config = bands[criterion]
+    values = np.asarray(values, dtype=float)
+    if config.get("absolute"):
+        values = np.abs(values)
+
+    with np.errstate(invalid="ignore"):
+        index = band_index(values, config["edges"])
+
+    events = np.array(config["labels"], dtype=object)[index]
+    points = np.array(config["penalties"], dtype=np.int64)[index]
+
+    missing = np.isnan(values)
+    if missing.any():
+        events[missing] = None
+        points[missing] = 0
+    return events, points
+
+
+def classify_value(criterion, value, bands=PENALTY_BANDS):
+    """
+    Classify a single value. Returns (event, penalty points).
+    """
+    events, points = classify_bands(criterion, [value], bands)
+    return events[0], int(points[0])
@@ -0,0 +1,77 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6371000
+METERS_PER_MILE = 1609.344
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in meters between points given in degrees.
+    Inputs broadcast against each other; NaN coordinates give NaN.
+    """
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(value, dtype=float)) for value in (lat1, lon1, lat2, lon2)
+    )
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2):
+    """
+    Initial bearing in degrees [0, 360) from the first point to the second.
+    Inputs broadcast against each other; NaN coordinates give NaN.
+    """
+    lat1, lon1, lat2, lon2 = (
+        np.radians(np.asarray(value, dtype=float)) for value in (lat1, lon1, lat2, lon2)
+    )
+    delta_lon = lon2 - lon1
+    x = np.sin(delta_lon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(delta_lon)
+    return (np.degrees(np.arctan2(x, y)) + 360) % 360
+
+
+def step_distances(lat, lon):
+    """
+    Distance in meters from each point to the next (length n - 1).
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    return haversine_distance(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+
+def step_bearings(lat, lon):
+    """
+    Initial bearing from each point to the next (length n - 1).
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    return initial_bearing(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+
+def cumulative_distance(lat, lon):
+    """
+    Odometer in meters: distance travelled from the first point to each
+    point. Steps to or from a NaN position add nothing.
+    """
+    distances = np.nan_to_num(step_distances(lat, lon), nan=0.0)
+    return np.concatenate([[0.0], np.cumsum(distances)])
+
+
+def nearest_point(lat, lon, point_lats, point_lons):
+    """
+    Find the nearest of a set of reference points for one or more query
+    points. Returns (index, distance in meters) arrays shaped like the
+    query, computed from a single broadcast distance matrix.
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    point_lats = np.asarray(point_lats, dtype=float).ravel()
+    point_lons = np.asarray(point_lons, dtype=float).ravel()
+    if point_lats.size == 0:
+        raise ValueError("No reference points to search")
+
+    distances = haversine_distance(
+        lat[..., np.newaxis], lon[..., np.newaxis], point_lats, point_lons
+    )
+    index = np.argmin(distances, axis=-1)
+    return index, np.take_along_axis(distances, index[..., np.newaxis], axis=-1)[..., 0]
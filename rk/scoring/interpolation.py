@@ -0,0 +1,61 @@
+import numpy as np
+
+# Supported gap-filling methods
+FILL_METHODS = ("linear", "ffill")
+
+
+def fill_gaps(times, values, method="linear", max_gap=None):
+    """
+    Fill NaN values in a time series in a single vectorized pass.
+
+    times must be ascending numbers (e.g. epoch seconds) and values a float
+    array with NaN for missing samples. With method="linear" interior gaps
+    are interpolated over time and the edges are forward/backward filled;
+    with method="ffill" every gap takes the last valid value (leading gaps
+    take the first valid value). If max_gap is given, gaps spanning more
+    than max_gap time units between their bounding samples are left as NaN,
+    as are edge samples further than max_gap from the nearest valid sample.
+    """
+    if method not in FILL_METHODS:
+        raise ValueError(f"Unknown fill method: {method}")
+
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    result = values.copy()
+
+    valid = ~np.isnan(values)
+    if valid.all() or not valid.any():
+        return result
+
+    # Index of the previous and next valid sample for every position
+    positions = np.arange(len(values))
+    prev_idx = np.maximum.accumulate(np.where(valid, positions, -1))
+    next_idx = np.minimum.accumulate(np.where(valid, positions, len(values))[::-1])[::-1]
+
+    missing = ~valid
+    has_prev = missing & (prev_idx >= 0)
+    has_next = missing & (next_idx < len(values))
+    interior = has_prev & has_next
+
+    prev_safe = np.clip(prev_idx, 0, len(values) - 1)
+    next_safe = np.clip(next_idx, 0, len(values) - 1)
+
+    if method == "linear":
+        t0, t1 = times[prev_safe[interior]], times[next_safe[interior]]
+        v0, v1 = values[prev_safe[interior]], values[next_safe[interior]]
+        result[interior] = v0 + (v1 - v0) * (times[interior] - t0) / (t1 - t0)
+        trailing = has_prev & ~has_next
+    else:
+        trailing = has_prev
+
+    leading = has_next & ~has_prev
+    result[trailing] = values[prev_safe[trailing]]
+    result[leading] = values[next_safe[leading]]
+
+    if max_gap is not None:
+        # Length of the gap each missing sample belongs to
+        gap_start = np.where(has_prev, times[prev_safe], times)
+        gap_end = np.where(has_next, times[next_safe], times)
+        result[missing & (gap_end - gap_start > max_gap)] = np.nan
+
+    return result
@@ -0,0 +1,138 @@
+import numpy as np
+
+from rk.scoring.speed_limit_index import (
+    MAX_ROAD_DISTANCE_M,
+    east_west_scale,
+    get_speed_limit_index,
+    project,
+    nearby_segments
+)
+
+# Standard deviation of GPS position error in meters (emission model)
+GPS_SIGMA_M = 10
+
+# Scale in meters of the difference between the distance the GPS fixes
+# moved and the distance between their matched points (transition model)
+TRANSITION_BETA_M = 5
+
+# Log-probability cost of moving between segments that do not touch,
+# which a car can only do by taking a road missing from the index
+DISCONNECTED_PENALTY = 5.0
+
+# Log-probability cost of turning onto a different road, so a match
+# only switches roads when later fixes confirm the turn
+ROAD_CHANGE_PENALTY = 4.0
+
+# Segments whose endpoints are this close in meters are connected
+ENDPOINT_TOLERANCE_M = 1.0
+
+# Candidate segments considered per sample, nearest first
+MAX_CANDIDATES = 8
+
+# Segment id of samples that could not be matched
+NO_SEGMENT = -1
+
+
+def sample_candidates(index, x, y, max_distance=MAX_ROAD_DISTANCE_M, max_candidates=MAX_CANDIDATES):
+    """
+    The nearest candidate segments of a projected sample. Returns
+    (segment rows, distances, matched points), nearest first.
+    """
+    rows, distances, points = nearby_segments(index, x, y, max_distance)
+    nearest = np.argsort(distances)[:max_candidates]
+    return rows[nearest], distances[nearest], points[nearest]
+
+
+def connected_segments(index, rows_a, rows_b):
+    """
+    Matrix that is True where segment rows_a[i] and rows_b[j] are the same
+    segment or share an endpoint.
+    """
+    ends_a = index["segments"][rows_a].reshape(-1, 2, 1, 2)
+    ends_b = index["segments"][rows_b].reshape(-1, 1, 2, 2)
+    gaps = np.hypot(
+        ends_a[:, np.newaxis, ..., 0] - ends_b[np.newaxis, ..., 0],
+        ends_a[:, np.newaxis, ..., 1] - ends_b[np.newaxis, ..., 1]
+    )
+    touching = (gaps <= ENDPOINT_TOLERANCE_M).any(axis=(2, 3))
+    return touching | (rows_a[:, np.newaxis] == rows_b[np.newaxis, :])
+
+
+def match_trajectory(index, lats, lons, sigma=GPS_SIGMA_M, beta=TRANSITION_BETA_M,
+                     penalty=DISCONNECTED_PENALTY, turn_penalty=ROAD_CHANGE_PENALTY,
+                     max_distance=MAX_ROAD_DISTANCE_M, max_candidates=MAX_CANDIDATES):
+    """
+    Match a trajectory to the indexed roads with a hidden Markov model,
+    decoded with the Viterbi algorithm. Each sample's hidden state is one
+    of its nearby segments: emissions favour segments close to the fix,
+    and transitions favour matched points that moved as far as the fixes
+    did, on the same road or at least a connected segment. A sample
+    without a position or without a segment in reach ends the chain.
+    Returns the OSM way id of every sample, NO_SEGMENT where unmatched.
+    """
+    n = len(lats)
+    segment_ids = np.full(n, NO_SEGMENT, dtype=np.int64)
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    x, y = project(lats, lons, float(index["reference_lat"]))
+
+    chain = []  # (sample, candidate rows, back pointers) of the current chain
+    scores = None
+
+    def decode_chain():
+        # Follow the back pointers from the best final state
+        state = int(np.argmax(scores))
+        for sample, rows, back in reversed(chain):
+            segment_ids[sample] = index["road_ids"][rows[state]]
+            if back is not None:
+                state = int(back[state])
+        chain.clear()
+
+    for i in range(n):
+        rows = np.empty(0, dtype=np.int64)
+        if not (np.isnan(x[i]) or np.isnan(y[i])):
+            rows, distances, points = sample_candidates(index, x[i], y[i], max_distance, max_candidates)
+        if rows.size == 0:
+            if chain:
+                decode_chain()
+            continue
+
+        emission = -0.5 * (distances / sigma) ** 2
+        if not chain:
+            scores = emission
+            back = None
+        else:
+            previous, previous_rows, _ = chain[-1]
+            scale = east_west_scale(index, y[i])
+            gps_distance = np.hypot((x[i] - x[previous]) * scale, y[i] - y[previous])
+            matched_distance = np.hypot(
+                (previous_points[:, np.newaxis, 0] - points[np.newaxis, :, 0]) * scale,
+                previous_points[:, np.newaxis, 1] - points[np.newaxis, :, 1]
+            )
+            transition = -np.abs(matched_distance - gps_distance) / beta
+            transition -= penalty * ~connected_segments(index, previous_rows, rows)
+            transition -= turn_penalty * (
+                index["road_ids"][previous_rows][:, np.newaxis] != index["road_ids"][rows][np.newaxis, :]
+            )
+
+            total = scores[:, np.newaxis] + transition
+            back = np.argmax(total, axis=0)
+            scores = total[back, np.arange(rows.size)] + emission
+
+        chain.append((i, rows, back))
+        previous_points = points
+
+    if chain:
+        decode_chain()
+    return segment_ids
+
+
+def match_segments(lats, lons):
+    """
+    Match a trip to the roads of the offline speed limit index. Every
+    sample is NO_SEGMENT when the index has not been built.
+    """
+    index = get_speed_limit_index()
+    if index is None:
+        return np.full(len(lats), NO_SEGMENT, dtype=np.int64)
+    return match_trajectory(index, lats, lons)
@@ -0,0 +1,62 @@
+import numpy as np
+
+# Rate of the grid that gaps are detected on
+SAMPLE_RATE_HZ = 1
+
+# How far a sample may be from a grid slot and still fill it, in seconds;
+# None uses half the grid period, so every sample fills its nearest slot
+GRID_TOLERANCE_SECONDS = None
+
+
+def grid_period(rate=SAMPLE_RATE_HZ):
+    """
+    Return the grid period for a sample rate in Hz as a timedelta64.
+    """
+    if rate <= 0:
+        raise ValueError(f"Sample rate must be positive, got {rate}")
+    return np.timedelta64(int(round(1e6 / rate)), "us")
+
+
+def snap_to_grid(times, origin=None, rate=SAMPLE_RATE_HZ, tolerance=GRID_TOLERANCE_SECONDS):
+    """
+    Match each sample to the nearest slot of a grid anchored at origin
+    (the first sample by default). Returns the slot index of every sample
+    and a mask of the samples within tolerance of their slot.
+    """
+    times = np.asarray(times)
+    period = grid_period(rate)
+    if origin is None:
+        origin = times[0]
+    if tolerance is None:
+        tolerance_delta = period / 2
+    else:
+        tolerance_delta = np.timedelta64(int(round(tolerance * 1e6)), "us")
+
+    offsets = (times - origin) / period
+    slots = np.rint(offsets).astype(np.int64)
+    matched = np.abs(times - (origin + slots * period)) <= tolerance_delta
+    return slots, matched
+
+
+def find_gaps(times, origin=None, rate=SAMPLE_RATE_HZ, tolerance=GRID_TOLERANCE_SECONDS):
+    """
+    Return the grid timestamps between the first and last of the sorted
+    sample times that no sample fills. Sample jitter within tolerance
+    never creates a gap.
+    """
+    times = np.asarray(times)
+    if times.size == 0:
+        return times
+
+    if origin is None:
+        origin = times[0]
+    period = grid_period(rate)
+    slots, matched = snap_to_grid(times, origin, rate, tolerance)
+
+    # Grid slots from the first to the last sample, inclusive
+    first_slot = int(np.ceil((times[0] - origin) / period))
+    last_slot = int(np.floor((times[-1] - origin) / period))
+    grid = np.arange(first_slot, last_slot + 1)
+
+    missing = np.setdiff1d(grid, slots[matched])
+    return origin + missing * period
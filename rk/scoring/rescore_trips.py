@@ -0,0 +1,237 @@
+import sys
+import os
+import io
+import time
+import json
+import hashlib
+import argparse
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Add the parent directory to sys.path
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../..")
+    )
+)
+
+from rk.sql.database import connect_to_mysql
+from rk.sql.schema import ensure_schema
+from rk.scoring.run_all_scoring import run_all_scoring, SCORING_STAGES
+from rk.scoring.bands import PENALTY_BANDS
+from rk.scoring.scoring_engine import PENALTY_BASIS
+from rk.scoring.final_score import WEIGHTS
+
+# Number of trips scored at the same time. Each worker process holds one
+# database connection, so this also bounds the connections in use.
+RESCORE_WORKERS = 4
+
+# Stage threads inside each worker process
+RESCORE_STAGE_WORKERS = 2
+
+# File recording the trips already rescored, one trip_id per line after
+# a header line with the scoring parameters they were rescored with
+RESCORE_CHECKPOINT = "rescore_checkpoint.txt"
+CHECKPOINT_HEADER = "# scoring parameters "
+
+# Connection of the current worker process, opened on its first trip and
+# closed when the process exits
+worker_connection = None
+
+
+def get_trip_ids(cursor, since=None, until=None):
+    """
+    Return the trip_ids in device_trip_mapping, oldest first, optionally
+    only those created on or after since and before until.
+    """
+    conditions = []
+    params = []
+    if since is not None:
+        conditions.append("timestamp >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("timestamp < %s")
+        params.append(until)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cursor.execute(f"""
+        SELECT trip_id
+        FROM device_trip_mapping
+        {where}
+        ORDER BY timestamp, trip_id
+    """, params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def scoring_parameters():
+    """
+    Return a short hash of the settings that change a trip's scores: the
+    penalty bands, the penalty basis and the final score weights.
+    """
+    parameters = json.dumps(
+        {"bands": PENALTY_BANDS, "basis": PENALTY_BASIS, "weights": WEIGHTS},
+        sort_keys=True
+    )
+    return hashlib.sha256(parameters.encode()).hexdigest()[:16]
+
+
+def read_checkpoint(path):
+    """
+    Return (parameters, trip_ids) recorded in a checkpoint file, where
+    parameters is None for a file without a header. Returns (None, set())
+    if there is no checkpoint.
+    """
+    if not os.path.exists(path):
+        return None, set()
+    parameters = None
+    trip_ids = set()
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(CHECKPOINT_HEADER):
+                parameters = line[len(CHECKPOINT_HEADER):]
+            elif line:
+                trip_ids.add(line)
+    return parameters, trip_ids
+
+
+def rescore_trip(trip_id, stage_workers=RESCORE_STAGE_WORKERS):
+    """
+    Run every scoring stage for one trip in a worker process, reusing the
+    worker's connection. Returns (trip_id, error, output, elapsed), where
+    error is None on success and output holds what the stages printed.
+    """
+    global worker_connection
+    start_time = time.perf_counter()
+    output = io.StringIO()
+    error = None
+
+    try:
+        with redirect_stdout(output):
+            if worker_connection is None or not worker_connection.is_connected():
+                worker_connection = connect_to_mysql()
+            results = run_all_scoring(trip_id, worker_connection, workers=stage_workers)
+
+        failed = [result["name"] for result in results if result["error"]]
+        if failed:
+            error = f"failed stages: {', '.join(failed)}"
+        elif len(results) < len(SCORING_STAGES):
+            error = "not every stage ran"
+    except Exception as e:
+        error = str(e)
+
+    return trip_id, error, output.getvalue(), time.perf_counter() - start_time
+
+
+def rescore_trips(trip_ids, checkpoint=RESCORE_CHECKPOINT, workers=RESCORE_WORKERS,
+                  stage_workers=RESCORE_STAGE_WORKERS):
+    """
+    Rescore trips on a pool of worker processes, skipping the trips already
+    in the checkpoint file and appending each trip to it once it succeeds,
+    so an interrupted run picks up where it stopped. A checkpoint written
+    with different scoring parameters is refused with a ValueError, since
+    its trips were scored with the old settings.
+    Returns the list of trip_ids that failed.
+    """
+    # Step 1: Skip trips finished by an earlier run with the same settings
+    parameters = scoring_parameters()
+    checkpoint_parameters, done = read_checkpoint(checkpoint)
+    if (checkpoint_parameters is not None or done) and checkpoint_parameters != parameters:
+        raise ValueError(
+            f"Checkpoint {checkpoint} was written with different scoring parameters "
+            f"({checkpoint_parameters or 'unknown'}, now {parameters}). "
+            f"Rerun with --restart to rescore every trip."
+        )
+    remaining = [trip_id for trip_id in trip_ids if trip_id not in done]
+    print(f"Rescoring {len(remaining)} trips "
+          f"({len(trip_ids) - len(remaining)} already done) on {workers} workers.")
+
+    failed = []
+    if not remaining:
+        return failed
+
+    # Step 2: Fan the trips out and record each one as it finishes
+    start_time = time.perf_counter()
+    with open(checkpoint, "a") as checkpoint_file, \
+            ProcessPoolExecutor(max_workers=workers) as executor:
+        if checkpoint_parameters is None:
+            checkpoint_file.write(f"{CHECKPOINT_HEADER}{parameters}\n")
+            checkpoint_file.flush()
+        futures = [executor.submit(rescore_trip, trip_id, stage_workers) for trip_id in remaining]
+        for count, future in enumerate(as_completed(futures), start=1):
+            trip_id, error, output, elapsed = future.result()
+            if error:
+                failed.append(trip_id)
+                print(f"Error rescoring trip_id {trip_id}: {error}")
+                print(f"--- Standard Output ---\n{output}")
+            else:
+                checkpoint_file.write(f"{trip_id}\n")
+                checkpoint_file.flush()
+
+            minutes = (time.perf_counter() - start_time) / 60
+            print(f"[{count}/{len(remaining)}] trip_id {trip_id} "
+                  f"{'failed' if error else 'rescored'} in {elapsed:.2f}s "
+                  f"({count / minutes:.1f} trips/min)")
+
+    # Step 3: Report the overall throughput
+    minutes = (time.perf_counter() - start_time) / 60
+    print(f"Rescored {len(remaining) - len(failed)} of {len(remaining)} trips in "
+          f"{minutes:.2f} min ({len(remaining) / minutes:.1f} trips/min).")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rescore many trips in parallel.")
+    selection = parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument("--trips", nargs="+", metavar="TRIP_ID", help="trip_ids to rescore")
+    selection.add_argument("--trips-file", help="file with one trip_id per line")
+    selection.add_argument("--all", action="store_true",
+                           help="every trip in device_trip_mapping, optionally within --since/--until")
+    parser.add_argument("--since", help="only trips created on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="only trips created before this date (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=RESCORE_WORKERS,
+                        help="trips scored at the same time (one connection each)")
+    parser.add_argument("--stage-workers", type=int, default=RESCORE_STAGE_WORKERS,
+                        help="stage threads per trip")
+    parser.add_argument("--checkpoint", default=RESCORE_CHECKPOINT,
+                        help="file recording the trips already rescored")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore and clear the checkpoint file")
+    args = parser.parse_args()
+
+    if (args.since or args.until) and not args.all:
+        parser.error("--since and --until can only be used with --all")
+
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    connection = connect_to_mysql()
+    try:
+        # Make sure the schema is up to date before the workers start
+        ensure_schema(connection)
+
+        if args.trips:
+            trip_ids = args.trips
+        elif args.trips_file:
+            with open(args.trips_file) as f:
+                trip_ids = [line.strip() for line in f if line.strip()]
+        else:
+            cursor = connection.cursor()
+            trip_ids = get_trip_ids(cursor, args.since, args.until)
+            cursor.close()
+    finally:
+        if connection.is_connected():
+            connection.close()
+
+    try:
+        failed = rescore_trips(trip_ids, args.checkpoint, args.workers, args.stage_workers)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if failed:
+        print(f"{len(failed)} trips failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import numpy as np
+
+
+def window_extent(window, center=True):
+    """
+    Return how many samples before and after each position a window covers.
+    Centered windows of even width reach one sample further back than ahead.
+    """
+    if window < 1:
+        raise ValueError(f"Window must be at least 1 sample, got {window}")
+    if not center:
+        return window - 1, 0
+    before = window // 2
+    return before, window - 1 - before
+
+
+def window_sums(values, window, center=True):
+    """
+    Return the sum and the count of non-NaN values in each window,
+    computed from cumulative sums in O(n).
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    valid = ~np.isnan(values)
+
+    cumulative_sum = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+    cumulative_count = np.concatenate([[0], np.cumsum(valid)])
+
+    before, after = window_extent(window, center)
+    positions = np.arange(n)
+    lower = np.clip(positions - before, 0, n)
+    upper = np.clip(positions + after + 1, 0, n)
+
+    return (
+        cumulative_sum[upper] - cumulative_sum[lower],
+        cumulative_count[upper] - cumulative_count[lower]
+    )
+
+
+def rolling_mean(values, window=3, center=True, min_periods=1):
+    """
+    Rolling arithmetic mean ignoring NaN. Windows with fewer than
+    min_periods valid values are NaN.
+    """
+    totals, counts = window_sums(values, window, center)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts >= min_periods, totals / counts, np.nan)
+
+
+def rolling_circular_mean(degrees, window=3, center=True, min_periods=1):
+    """
+    Rolling circular (vector) mean of angles in degrees ignoring NaN, so
+    that 359 and 1 average to 0 rather than 180. Returns values in [0, 360).
+    """
+    radians = np.radians(np.asarray(degrees, dtype=float))
+    sin_totals, counts = window_sums(np.sin(radians), window, center)
+    cos_totals, _ = window_sums(np.cos(radians), window, center)
+
+    means = (np.degrees(np.arctan2(sin_totals, cos_totals)) + 360) % 360
+    return np.where(counts >= min_periods, means, np.nan)
+
+
+def rolling_median(values, window=3, center=True, min_periods=1):
+    """
+    Rolling median ignoring NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    before, after = window_extent(window, center)
+    padded = np.pad(values, (before, after), constant_values=np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window)
+
+    counts = (~np.isnan(windows)).sum(axis=1)
+    medians = np.full(len(values), np.nan)
+    enough = counts >= max(min_periods, 1)
+    if enough.any():
+        medians[enough] = np.nanmedian(windows[enough], axis=1)
+    return medians
+
+
+def exponential_moving_average(values, span=3, alpha=None):
+    """
+    Trailing exponential moving average with smoothing factor alpha
+    (default 2 / (span + 1)). NaN inputs stay NaN and do not reset the average.
+    """
+    values = np.asarray(values, dtype=float)
+    if alpha is None:
+        alpha = 2 / (span + 1)
+
+    result = np.full(len(values), np.nan)
+    average = None
+    for i, value in enumerate(values):
+        if np.isnan(value):
+            continue
+        average = value if average is None else alpha * value + (1 - alpha) * average
+        result[i] = average
+    return result
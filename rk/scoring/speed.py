@@ -1,7 +1,7 @@
 import sys
 import os
+import math
 import osmnx as ox
-from geopy.distance import geodesic
 
 # Add the parent directory of `testing_user` to sys.path
 sys.path.append(
@@ -11,53 +11,79 @@ sys.path.append(
 )
 
 from rk.sql.database import connect_to_mysql
+from rk.sql.schema import ensure_schema
+from rk.sql.penalty_events import clear_events, prune_empty_events
+from rk.scoring.point_grid import PointGrid
+from rk.scoring.bands import PENALTY_BANDS, classify_value
+from rk.scoring.speed_limit_index import (
+    get_speed_limit_index,
+    build_speed_limit_index,
+    lookup_speed_limit,
+    parse_maxspeed,
+    road_speed_limits
+)
+from rk.scoring.road_tiles import load_trip_roads
+from rk.scoring.speed_limit_cache import SpeedLimitCache
 
-# Speed limit cache for known GPS points
-speed_limit_cache = {}
+# Points further than this from every known point get no fallback limit
+NEAREST_SPEED_LIMIT_MAX_M = 800
 
+# Speed limit cache for known GPS points, and a grid over the same points
+# for the nearest-point fallback
+speed_limit_cache = {}
+speed_limit_points = PointGrid(NEAREST_SPEED_LIMIT_MAX_M)
+
+# Index over the roads around the trip being scored, set by
+# prefetch_trip_roads. False when the trip's area has no road with a
+# speed limit, None when nothing was prefetched.
+trip_speed_limit_index = None
+
+# Persistent cache of OpenStreetMap lookups, opened on first use
+persistent_speed_limit_cache = None
+
+
+def get_persistent_cache():
+    """
+    Return the speed limit cache shared across trips and profiles.
+    """
+    global persistent_speed_limit_cache
+    if persistent_speed_limit_cache is None:
+        persistent_speed_limit_cache = SpeedLimitCache()
+    return persistent_speed_limit_cache
+
+
+def report_speed_limit_cache():
+    """
+    Save and print the hit rate of the persistent cache, if it was used.
+    """
+    if persistent_speed_limit_cache is None:
+        return
+    persistent_speed_limit_cache.save_stats()
+    stats = persistent_speed_limit_cache.stats()
+    print(f"Speed limit cache: {stats['hits']} hits, {stats['misses']} misses "
+          f"({stats['hit_rate']:.1%} hit rate, {stats['entries']} cells cached).")
+
+
+def prefetch_trip_roads(latitudes, longitudes):
+    """
+    Load the roads around a whole trip, tile by tile from the disk cache
+    or OpenStreetMap, into an in-memory index so every sample of the trip
+    is answered locally. Not needed when the offline index is built.
+    """
+    global trip_speed_limit_index
+    trip_speed_limit_index = None
+    if get_speed_limit_index() is not None:
+        return
 
-# Check if columns exist
-def column_exists(connection, table_name, column_name):
     try:
-        cursor = connection.cursor()
-        query = """
-        SELECT COUNT(*)
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
-        """
-        cursor.execute(query, (table_name, column_name))
-        return cursor.fetchone()[0] == 1
+        roads, tiles, fetched = load_trip_roads(latitudes, longitudes)
     except Exception as e:
-        print(f"Error checking column existence: {e}")
-        sys.exit(1)
-
-
-# Update the tables to add columns
-def update_tables(connection):
-    try:
-        cursor = connection.cursor()
-
-        # Add columns if they don't exist
-        if not column_exists(connection, "penalty_events_data", "speeding_event"):
-            cursor.execute("""
-            ALTER TABLE penalty_events_data 
-            ADD COLUMN speeding_event VARCHAR(10)
-            """)
-            # print("Added column `speeding_event` to `penalty_events_data`.")
-
-        if not column_exists(connection, "scores_data", "speeding_score"):
-            cursor.execute("""
-            ALTER TABLE scores_data 
-            ADD COLUMN speeding_score FLOAT
-            """)
-            # print("Added column `speeding_score` to `scores_data`.")
+        print(f"Error prefetching roads, looking up each sample instead: {e}")
+        return
 
-        connection.commit()
-        # print("Database schema updated successfully.")
-
-    except Exception as e:
-        print(f"Error updating tables: {e}")
-        sys.exit(1)
+    print(f"Loaded {len(roads)} roads with a speed limit from {tiles} tiles "
+          f"({fetched} fetched from OpenStreetMap).")
+    trip_speed_limit_index = build_speed_limit_index(roads) if roads else False
 
 
 # Fetch speeding data
@@ -65,7 +91,7 @@ def get_speeding_data(trip_id, connection):
     try:
         cursor = connection.cursor()
         query = """
-        SELECT trip_id, timestamp, latitude, longitude, speed_gps_avg
+        SELECT trip_id, timestamp, latitude, longitude, speed_gps_avg, segment_id
         FROM preprocessed_driving_data
         WHERE trip_id = %s
         """
@@ -73,65 +99,106 @@ def get_speeding_data(trip_id, connection):
         return cursor.fetchall()
     except Exception as e:
         print(f"Error fetching data: {e}")
-        sys.exit(1)
+        raise
 
 
 # Fetch the speed limit from OpenStreetMap
-def get_speed_limit(lat, lon):
-    try:
-        # Search for roads near the GPS point
-        location = (lat, lon)
-        tags = {'highway': True}  # Extract only roads
-        gdf = ox.features_from_point(location, tags, dist=50)
-
-        # Filter to include only speed limit information
-        if 'maxspeed' in gdf.columns:
-            max_speed = gdf['maxspeed'].dropna().iloc[0]
-
-            # Ensure speed is numeric
-            if isinstance(max_speed, str):
-                if "mph" in max_speed:
-                    max_speed = float(max_speed.replace(" mph", ""))
-                elif max_speed.isdigit():
-                    max_speed = float(max_speed)
-
-            # Cache the result
-            speed_limit_cache[(lat, lon)] = max_speed
-            return max_speed
+def fetch_osm_speed_limit(lat, lon):
+    # Search for roads near the GPS point
+    location = (lat, lon)
+    tags = {'highway': True}  # Extract only roads
+    gdf = ox.features_from_point(location, tags, dist=50)
+
+    # Filter to include only speed limit information
+    if 'maxspeed' not in gdf.columns or gdf['maxspeed'].dropna().empty:
         # print(f"No speed limit data found for point ({lat}, {lon}).")
         return None
 
-    except Exception as e:
-        print(f"Error fetching speed limit at ({lat}, {lon}): {e}")
+    # Use the first tag that holds a number, in mph, parsed as for the
+    # offline index and the road tiles
+    for max_speed in gdf['maxspeed'].dropna():
+        max_speed = parse_maxspeed(max_speed)
+        if max_speed is not None:
+            return max_speed
+    return None
+
+
+# Fetch the speed limit from the offline index or the roads prefetched
+# for the trip, or else from the persistent cache with OpenStreetMap
+# behind it
+def get_speed_limit(lat, lon):
+    # Samples without a position have no speed limit
+    if lat is None or lon is None or math.isnan(lat) or math.isnan(lon):
         return None
 
+    index = get_speed_limit_index()
+    if index is None:
+        index = trip_speed_limit_index
+    if index is False:
+        # The trip's area has no road with a speed limit
+        max_speed = None
+    elif index is not None:
+        max_speed = lookup_speed_limit(index, lat, lon)
+    else:
+        cache = get_persistent_cache()
+        found, max_speed = cache.get(lat, lon)
+        if found:
+            # Entries cached before tags were parsed may hold raw strings
+            max_speed = parse_maxspeed(max_speed)
+        else:
+            try:
+                max_speed = fetch_osm_speed_limit(lat, lon)
+            except Exception as e:
+                print(f"Error fetching speed limit at ({lat}, {lon}): {e}")
+                return None
+            cache.put(lat, lon, max_speed)
 
-# Find the nearest GPS point with a known speed limit
-def find_nearest_speed_limit(lat, lon):
-    try:
-        if not speed_limit_cache:
-            print("Speed limit cache is empty. No nearest point found.")
-            return None
+    remember_speed_limit(lat, lon, max_speed)
+    return max_speed
+
+
+# Remember a known speed limit for the nearest-point fallback
+def remember_speed_limit(lat, lon, speed_limit):
+    # The first limit known for a point is kept, so the cache and the
+    # grid always agree
+    if speed_limit is None or (lat, lon) in speed_limit_cache:
+        return
+    speed_limit_points.insert(lat, lon, speed_limit)
+    speed_limit_cache[(lat, lon)] = speed_limit
+
+
+# Look up the speed limit of a sample, once per distinct road segment
+# for samples matched to a segment of the offline index
+def get_sample_speed_limit(lat, lon, segment_id, segment_limits):
+    if segment_id is None:
+        return get_speed_limit(lat, lon)
 
-        # Find the nearest point
-        nearest_point = min(
-            speed_limit_cache.keys(),
-            key=lambda point: geodesic((lat, lon), point).miles
-        )
+    if segment_id not in segment_limits:
+        index = get_speed_limit_index()
+        segment_limits[segment_id] = road_speed_limits(index).get(segment_id) if index is not None else None
 
-        # Get the distance to the nearest point
-        distance = geodesic((lat, lon), nearest_point).miles
-        nearest_speed_limit = speed_limit_cache[nearest_point]
+    speed_limit = segment_limits[segment_id]
+    if speed_limit is None:
+        return get_speed_limit(lat, lon)
+    if lat is not None and lon is not None:
+        remember_speed_limit(lat, lon, speed_limit)
+    return speed_limit
 
-        # print(f"Nearest speed limit found: {nearest_speed_limit} mph at {nearest_point} "
-        #       f"({distance:.2f} miles away from {lat}, {lon}).")
 
-        return nearest_speed_limit
+# Find the nearest GPS point with a known speed limit
+def find_nearest_speed_limit(lat, lon):
+    if not speed_limit_cache:
+        print("Speed limit cache is empty. No nearest point found.")
+        return None
 
-    except ValueError:
-        print("No speed limit data available.")
+    # Only the points in the grid cells around the query are measured
+    nearest = speed_limit_points.nearest(lat, lon)
+    if nearest is None:
         return None
 
+    nearest_speed_limit, _ = nearest
+    return nearest_speed_limit
+
 
 # Score speeding and track penalty events
 def score_speeding(data, connection):
@@ -146,16 +213,26 @@ def score_speeding(data, connection):
         total_score = 0
         penalty_count = 0  # Count of penalty events
 
+        # Clear the previous speeding events of the trip
+        trip_id = data[0][0]
+        clear_events(cursor, trip_id, "speeding_event")
+
+        # Speed limits of the road segments seen so far in the trip
+        segment_limits = {}
+
+        # Load the roads around the trip once instead of querying each sample
+        prefetch_trip_roads([record[2] for record in data], [record[3] for record in data])
+
         for record in data:
-            trip_id, timestamp, latitude, longitude, speed_gps_avg = record
+            trip_id, timestamp, latitude, longitude, speed_gps_avg, segment_id = record
 
             # Skip rows where speed is None
             if speed_gps_avg is None:
                 print(f"Skipping row at {timestamp} (missing speed data).")
                 continue
 
-            # Fetch the speed limit from OpenStreetMap
-            speed_limit = get_speed_limit(latitude, longitude)
+            # Fetch the speed limit of the matched segment, or of the position
+            speed_limit = get_sample_speed_limit(latitude, longitude, segment_id, segment_limits)
 
             if speed_limit is None:
                 # print(f"Speed limit not found at {latitude}, {longitude}.
@@ -169,13 +246,8 @@ def score_speeding(data, connection):
             # Determine if a penalty applies for speeding
             over_speed_percentage = (speed_gps_avg - speed_limit) / speed_limit * 100
 
-            if 5 <= over_speed_percentage <= 10:
-                speeding_event = "mild"
-                penalty_score = 5
-            elif over_speed_percentage > 10:
-                speeding_event = "severe"
-                penalty_score = 10
-            else:
+            speeding_event, penalty_score = classify_value("speeding", over_speed_percentage)
+            if speeding_event is None:
                 continue  # No penalty for safe driving
 
             # INSERT or UPDATE for speeding_event
@@ -192,11 +264,16 @@ def score_speeding(data, connection):
             total_score += penalty_score
             penalty_count += 1
 
+        report_speed_limit_cache()
+
+        # Remove rows left without any event
+        prune_empty_events(cursor, trip_id)
+
         # Calculate the normalized speeding score
         if penalty_count == 0:
             normalized_score = 100.0  # Perfect score if no penalties
         else:
-            normalized_score = max(0, 100 - (total_score / trip_duration * 100))
+            normalized_score = max(PENALTY_BANDS["speeding"]["floor"], 100 - (total_score / trip_duration * 100))
 
         # Insert or update the speeding score in scores_data
         cursor.execute("""
@@ -211,7 +288,7 @@ def score_speeding(data, connection):
 
     except Exception as e:
         print(f"Error scoring data: {e}")
-        sys.exit(1)
+        raise
 
 
 # Main Execution
@@ -225,13 +302,16 @@ if __name__ == "__main__":
     connection = connect_to_mysql()
 
     try:
-        # Update tables before scoring
-        update_tables(connection)
+        # Make sure the schema is up to date
+        ensure_schema(connection)
 
         # Fetch and score data
         speeding_data = get_speeding_data(trip_id, connection)
         score_speeding(speeding_data, connection)
 
+    except Exception:
+        sys.exit(1)
+
     finally:
         if connection.is_connected():
             connection.close()
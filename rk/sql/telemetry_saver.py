@@ -5,125 +5,46 @@ sys.path.append(
         os.path.join(os.path.dirname(__file__), "../..")
     )
 )
-from sql.database import connect_to_mysql
+from sql.database import DatabaseConnectionError, mysql_connection
+from sql.timestamps import format_timestamp
+from sql.schema import ensure_schema
+from sql.bulk_writer import write_rows
 from mysql.connector import Error
 import datetime
+import heapq
 import requests
 import json
+from itertools import repeat
+from operator import itemgetter
 
 # Configuration for ThingsBoard IO
 THINGSBOARD_URL = 'http://54.241.86.221:8080'
 
-def save_driving_data_to_mysql(trip_id, driving_data):
-    """
-    Save driving data to the driving_data table.
-    """
-    connection = connect_to_mysql()
-    if not connection:
-        return
+# Telemetry values requested per key in each ThingsBoard call
+THINGSBOARD_PAGE_SIZE = 10000
 
-    try:
-        cursor = connection.cursor()
-
-        # Create the driving_data table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS driving_data (
-                trip_id VARCHAR(255),
-                timestamp VARCHAR(255),
-                latitude DOUBLE,
-                longitude DOUBLE,
-                bearing DOUBLE,
-                speed DOUBLE,
-                PRIMARY KEY (trip_id, timestamp),
-                FOREIGN KEY (trip_id)
-                    REFERENCES device_trip_mapping(trip_id)
-                    ON DELETE CASCADE
-            )
-        ''')
-
-        for entry in driving_data:
-            cursor.execute('''
-                INSERT INTO driving_data (
-                    trip_id, timestamp, latitude, longitude, bearing, speed
-                ) VALUES (%s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    latitude = VALUES(latitude),
-                    longitude = VALUES(longitude),
-                    bearing = VALUES(bearing),
-                    speed = VALUES(speed)
-            ''', (
-                entry["trip_id"],
-                entry["timestamp"],
-                entry.get("latitude"),
-                entry.get("longitude"),
-                entry.get("bearing"),
-                entry.get("speed"),
-            ))
-
-        connection.commit()
-        print("GPS data saved successfully.")
-    except Error as e:
-        print(f"Error saving GPS data: {e}")
-    finally:
-        connection.close()
+# Slack around the recorded trip window, for clock differences between
+# the phone and the ThingsBoard server
+TRIP_WINDOW_MARGIN_MS = 5 * 60 * 1000
 
-def save_sensors_data_to_mysql(trip_id, sensor_data):
+# Table columns, which are also the ThingsBoard keys they are read from
+DRIVING_DATA_COLUMNS = ["trip_id", "timestamp", "latitude", "longitude", "bearing", "speed"]
+SENSORS_DATA_COLUMNS = ["trip_id", "timestamp", "accelerometer", "gyroscope", "linear_acceleration", "magnetometer"]
+
+def serialize_json(value):
     """
-    Save sensor data to the sensors_data table.
+    Return a sensor reading as a JSON string for a JSON column.
     """
-    connection = connect_to_mysql()
-    if not connection:
-        return
-
-    try:
-        cursor = connection.cursor()
-
-        # Create the sensors_data table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sensors_data (
-                trip_id VARCHAR(255),
-                timestamp VARCHAR(255),
-                accelerometer JSON,
-                gyroscope JSON,
-                linear_acceleration JSON,
-                magnetometer JSON,
-                PRIMARY KEY (trip_id, timestamp),
-                FOREIGN KEY (trip_id)
-                    REFERENCES device_trip_mapping(trip_id)
-                    ON DELETE CASCADE
-            )
-        ''')
-
-        for entry in sensor_data:
-            cursor.execute('''
-                INSERT INTO sensors_data (
-                    trip_id, timestamp, accelerometer, gyroscope, linear_acceleration, magnetometer
-                ) VALUES (%s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    accelerometer = VALUES(accelerometer),
-                    gyroscope = VALUES(gyroscope),
-                    linear_acceleration = VALUES(linear_acceleration),
-                    magnetometer = VALUES(magnetometer)
-            ''', (
-                entry["trip_id"],
-                entry["timestamp"],
-                entry["accelerometer"] if isinstance(entry["accelerometer"], str) else json.dumps(entry["accelerometer"]),
-                entry["gyroscope"] if isinstance(entry["gyroscope"], str) else json.dumps(entry["gyroscope"]),
-                entry["linear_acceleration"] if isinstance(entry["linear_acceleration"], str) else json.dumps(entry["linear_acceleration"]),
-                entry["magnetometer"] if isinstance(entry["magnetometer"], str) else json.dumps(entry["magnetometer"]),
-            ))
-
-        connection.commit()
-        print("Sensor data saved successfully.")
-    except Error as e:
-        print(f"Error saving sensor data: {e}")
-    finally:
-        connection.close()
+    if value is None:
+        return None
+    return value if isinstance(value, str) else json.dumps(value)
 
 # Functions for ThingsBoard API
-def fetch_thingsboard_data(jwt_token, device_id, keys, start_ts, end_ts):
+def fetch_thingsboard_data(jwt_token, device_id, keys, start_ts, end_ts, limit=THINGSBOARD_PAGE_SIZE):
     """
-    Fetch telemetry data from ThingsBoard for the specified device ID, keys, and time range.
+    Fetch telemetry data from ThingsBoard for the specified device ID, keys, and time range,
+    at most limit values per key, oldest first. A failed request raises
+    requests.RequestException, so it is never mistaken for a range without telemetry.
     """
     try:
         url = f"{THINGSBOARD_URL}/api/plugins/telemetry/DEVICE/{device_id}/values/timeseries"
@@ -132,7 +53,8 @@ def fetch_thingsboard_data(jwt_token, device_id, keys, start_ts, end_ts):
             "startTs": start_ts,
             "endTs": end_ts,
             "agg": "NONE",
-            "limit": 10000000,
+            "orderBy": "ASC",
+            "limit": limit,
         }
         headers = {"X-Authorization": f"Bearer {jwt_token}"}
         response = requests.get(url, headers=headers, params=params)
@@ -140,11 +62,204 @@ def fetch_thingsboard_data(jwt_token, device_id, keys, start_ts, end_ts):
         return response.json()
     except requests.RequestException as e:
         print(f"Error fetching data from ThingsBoard for device {device_id}: {e}")
-        return {}
+        raise
+
+def iter_thingsboard_pages(jwt_token, device_id, keys, start_ts, end_ts, page_size=THINGSBOARD_PAGE_SIZE):
+    """
+    Fetch telemetry for a time range in pages of at most page_size values per key, yielding
+    each page as it arrives. A page ends at the earliest last timestamp among the keys that
+    filled it, so no key skips values, and the next page starts right after it.
+    """
+    while start_ts <= end_ts:
+        data = fetch_thingsboard_data(jwt_token, device_id, keys, start_ts, end_ts, page_size)
+        full_keys = [series[-1]["ts"] for series in data.values() if len(series) >= page_size]
+        if not full_keys:
+            if data:
+                yield data
+            return
+
+        page_end = min(full_keys)
+        yield {key: [value for value in series if value["ts"] <= page_end] for key, series in data.items()}
+        start_ts = page_end + 1
+
+def join_series(page, keys):
+    """
+    Join a page of ThingsBoard telemetry, one [{ts, value}] series per key, into one column
+    per key with a row for every distinct ts. A key without a value at a ts is None in that
+    row, so sparse keys never shift the values of other keys. The series are sorted by ts,
+    so they are joined with a single merge in linear time.
+    """
+    get_ts, get_value = itemgetter("ts"), itemgetter("value")
+    series = [page.get(key, ()) for key in keys]
+    ts_columns = [list(map(get_ts, values)) for values in series]
+
+    # Usually every key has a value at every ts and no merge is needed
+    if all(ts_column == ts_columns[0] for ts_column in ts_columns[1:]):
+        return [list(map(get_value, values)) for values in series]
+
+    streams = [
+        zip(ts_column, repeat(column), map(get_value, values))
+        for column, (ts_column, values) in enumerate(zip(ts_columns, series))
+    ]
+    columns = [[] for _ in keys]
+    last_ts = None
+    for ts, column, value in heapq.merge(*streams, key=itemgetter(0)):
+        if ts != last_ts:
+            for values in columns:
+                values.append(None)
+            last_ts = ts
+        columns[column][-1] = value
+    return columns
+
+def select_trip_rows(columns, trip_id=None):
+    """
+    Keep the rows of joined columns that belong to a trip, or to any trip if trip_id is
+    None. The first two columns are the trip id and timestamp; rows missing either are
+    dropped.
+    """
+    trip_ids, timestamps = columns[0], columns[1]
+    keep = [
+        i for i in range(len(trip_ids))
+        if trip_ids[i] is not None and timestamps[i] is not None
+        and (trip_id is None or trip_ids[i] == trip_id)  # Filter by trip_id
+    ]
+    if len(keep) == len(trip_ids):
+        return columns
+    return [[values[i] for i in keep] for values in columns]
+
+def iter_gps_rows(pages, trip_id=None):
+    """
+    Yield driving_data rows from pages of ThingsBoard GPS telemetry.
+    """
+    for page in pages:
+        trip_ids, timestamps, *values = select_trip_rows(join_series(page, DRIVING_DATA_COLUMNS), trip_id)
+        yield from zip(trip_ids, map(format_timestamp, timestamps), *values)  # Stored in TIMESTAMP_MODE format
+
+def iter_sensor_rows(pages, trip_id=None):
+    """
+    Yield sensors_data rows from pages of ThingsBoard sensor telemetry.
+    """
+    for page in pages:
+        trip_ids, timestamps, *readings = select_trip_rows(join_series(page, SENSORS_DATA_COLUMNS), trip_id)
+        yield from zip(
+            trip_ids,
+            map(format_timestamp, timestamps),
+            *(map(serialize_json, values) for values in readings)
+        )
+
+# What each ThingsBoard key set is synced into: table and columns (also the telemetry
+# keys), row decoder, and the device_trip_mapping column of the device
+KEY_SETS = {
+    "gps": ("driving_data", DRIVING_DATA_COLUMNS, iter_gps_rows, "gps_device_id"),
+    "sensors": ("sensors_data", SENSORS_DATA_COLUMNS, iter_sensor_rows, "sensor_device_id"),
+}
+
+def get_sync_watermark(cursor, device_id, key_set):
+    """
+    Return the last ThingsBoard timestamp ingested for a device's key set,
+    or None if it has never been synced.
+    """
+    cursor.execute("""
+        SELECT last_ts
+        FROM sync_state
+        WHERE device_id = %s AND key_set = %s
+    """, (device_id, key_set))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+def save_sync_watermark(cursor, device_id, key_set, last_ts):
+    """
+    Record the last ThingsBoard timestamp ingested for a device's key set.
+    """
+    cursor.execute("""
+        INSERT INTO sync_state (device_id, key_set, last_ts)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE last_ts = VALUES(last_ts)
+    """, (device_id, key_set, last_ts))
+
+def register_trips(cursor, trip_ids, device_column, device_id):
+    """
+    Add device_trip_mapping rows for trips seen in telemetry before their trip was mapped,
+    so their rows can be stored. trip_mapping_handler fills in the rest when the trip ends.
+    """
+    cursor.executemany(
+        f"INSERT IGNORE INTO device_trip_mapping (trip_id, {device_column}) VALUES (%s, %s)",
+        [(trip_id, device_id) for trip_id in trip_ids]
+    )
+
+def page_last_ts(page):
+    """
+    Return the latest ThingsBoard timestamp in a page of telemetry.
+    """
+    return max(series[-1]["ts"] for series in page.values() if series)
+
+def sync_device(connection, jwt_token, device_id, key_set, start_ts=0, end_ts=None,
+                page_size=THINGSBOARD_PAGE_SIZE, method=None):
+    """
+    Ingest a device's telemetry for one key set from just after its watermark (or start_ts,
+    whichever is later) up to end_ts, for every trip. Each page is written and the watermark
+    advanced in the same transaction, so an interrupted sync resumes where it stopped and
+    never skips telemetry. Pages are written with write_rows, so large pages use LOAD DATA
+    when the connection allows local infile. A failed ThingsBoard request stops the sync
+    with requests.RequestException after the pages already saved. Returns the number of
+    rows written.
+    """
+    table, columns, iter_rows, device_column = KEY_SETS[key_set]
+    if end_ts is None:
+        end_ts = int(datetime.datetime.now().timestamp() * 1000)  # Current time in milliseconds
+
+    cursor = connection.cursor()
+    watermark = get_sync_watermark(cursor, device_id, key_set)
+    if watermark is not None:
+        start_ts = max(start_ts, watermark + 1)
+    connection.commit()  # End the read so each page starts a fresh transaction
+
+    written = 0
+    try:
+        for page in iter_thingsboard_pages(jwt_token, device_id, columns, start_ts, end_ts, page_size):
+            rows = list(iter_rows([page]))
+            register_trips(cursor, {row[0] for row in rows}, device_column, device_id)
+            written += write_rows(
+                connection, table, columns, rows,
+                update_columns=columns[2:],
+                method=method,
+                label=f"{table} of device {device_id}",
+                commit=False
+            )
+            save_sync_watermark(cursor, device_id, key_set, page_last_ts(page))
+            connection.commit()
+    except Error:
+        connection.rollback()
+        raise
+    return written
+
+def get_trip_window(trip_id, margin=TRIP_WINDOW_MARGIN_MS):
+    """
+    Return the (start, end) of a trip in epoch milliseconds from device_trip_mapping, widened
+    by margin on both sides, or None if the trip's window was not recorded.
+    """
+    try:
+        with mysql_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("""
+                SELECT start_ts, end_ts
+                FROM device_trip_mapping
+                WHERE trip_id = %s
+            """, (trip_id,))
+            row = cursor.fetchone()
+    except Error as e:
+        print(f"Error reading the time window of trip {trip_id}: {e}")
+        return None
+
+    if row is None or row[0] is None:
+        return None
+    end_ts = row[1] if row[1] is not None else int(datetime.datetime.now().timestamp() * 1000)
+    return row[0] - margin, end_ts + margin
 
 def get_jwt_token():
     """
     Authenticate with ThingsBoard and retrieve a JWT token.
+    Raises requests.RequestException if authentication fails.
     """
     try:
         response = requests.post(
@@ -156,7 +271,7 @@ def get_jwt_token():
         return response.json()["token"]
     except requests.RequestException as e:
         print(f"Error during authentication: {e}")
-        sys.exit(1)
+        raise
 
 if __name__ == "__main__":
     # Accept trip_id, gps_device_id, and sensor_device_id as command-line arguments
@@ -168,87 +283,44 @@ if __name__ == "__main__":
         print("Error: Please provide the trip_id, gps_device_id, and sensor_device_id as command-line arguments.")
         sys.exit(1)
 
-    # Authenticate with ThingsBoard to get the JWT token
-    jwt_token = get_jwt_token()
-
-    # Define the time range for fetching data
-    start_time = 0  # Replace with the desired start timestamp in milliseconds
-    end_time = int(datetime.datetime.now().timestamp() * 1000)  # Current time in milliseconds
+    # Make sure the schema is up to date
+    try:
+        ensure_schema()
+    except Error:
+        sys.exit(1)
 
+    # Authenticate with ThingsBoard to get the JWT token
     try:
-        # Fetch GPS data from ThingsBoard
-        print("Fetching GPS data...")
-        gps_data = fetch_thingsboard_data(
-            jwt_token, 
-            gps_device_id,
-            ["latitude", "longitude", "bearing", "speed", "timestamp", "trip_id"],
-            start_time,
-            end_time
-        )
+        jwt_token = get_jwt_token()
+    except requests.RequestException:
+        sys.exit(1)
 
-        # Debugging: Print raw GPS data
-        # print("GPS Data:", json.dumps(gps_data, indent=4))  # Pretty print GPS data for inspection
-
-        # Process GPS data entries
-        gps_entries = []
-        if "timestamp" in gps_data and "trip_id" in gps_data:
-            gps_entries = [
-                {
-                    "trip_id": gps_data.get("trip_id", [{}])[i].get("value"),
-                    "timestamp": str(gps_data.get("timestamp", [{}])[i].get("value")),  # Ensure ISO format is preserved
-                    "latitude": gps_data.get("latitude", [{}])[i].get("value"),
-                    "longitude": gps_data.get("longitude", [{}])[i].get("value"),
-                    "bearing": gps_data.get("bearing", [{}])[i].get("value"),
-                    "speed": gps_data.get("speed", [{}])[i].get("value"),
-                }
-                for i in range(len(gps_data["timestamp"]))
-                if gps_data.get("trip_id", [{}])[i].get("value") == trip_id  # Filter by trip_id
-            ]
-
-        # Save filtered GPS data to the database
-        if gps_entries:
-            print(f"Saving {len(gps_entries)} GPS entries to the database...")
-            save_driving_data_to_mysql(trip_id, gps_entries)
-        else:
-            print("No matching GPS data available to save.")
-
-        # Fetch sensor data from ThingsBoard
-        print("Fetching sensor data...")
-        sensor_data = fetch_thingsboard_data(
-            jwt_token, 
-            sensor_device_id, 
-            ["accelerometer", "gyroscope", "linear_acceleration", "magnetometer", "timestamp", "trip_id"],
-            start_time,
-            end_time
-        )
+    # Devices synced before only fetch telemetry newer than their watermark. Otherwise start
+    # at the trip's time window, or the device's whole history for trips recorded before the
+    # window was stored.
+    trip_window = get_trip_window(trip_id)
+    if trip_window is not None:
+        start_time = trip_window[0]
+    else:
+        print(f"No time window recorded for trip {trip_id}; syncing from the device's full history.")
+        start_time = 0
 
-        # Debugging: Print raw sensor data
-        # print("Sensor Data:", json.dumps(sensor_data, indent=4))  # Pretty print sensor data for inspection
-
-        # Process sensor data entries
-        sensor_entries = []
-        if "timestamp" in sensor_data and "trip_id" in sensor_data:
-            sensor_entries = [
-                {
-                    "trip_id": sensor_data.get("trip_id", [{}])[i].get("value"),
-                    "timestamp": str(sensor_data.get("timestamp", [{}])[i].get("value")),  # Ensure ISO format is preserved
-                    "accelerometer": sensor_data.get("accelerometer", [{}])[i].get("value"),  # Direct value
-                    "gyroscope": sensor_data.get("gyroscope", [{}])[i].get("value"),        # Direct value
-                    "linear_acceleration": sensor_data.get("linear_acceleration", [{}])[i].get("value"),  # Direct value
-                    "magnetometer": sensor_data.get("magnetometer", [{}])[i].get("value"),  # Direct value
-                }
-                for i in range(len(sensor_data["timestamp"]))
-                if sensor_data.get("trip_id", [{}])[i].get("value") == trip_id  # Filter by trip_id
-            ]
-
-        # Save filtered sensor data to the database
-        if sensor_entries:
-            print(f"Saving {len(sensor_entries)} sensor entries to the database...")
-            save_sensors_data_to_mysql(trip_id, sensor_entries)
-        else:
-            print("No matching sensor data available to save.")
+    try:
+        with mysql_connection(allow_local_infile=True) as connection:
+            # Stream new GPS and sensor data from ThingsBoard into the database page by page
+            for device_id, key_set in ((gps_device_id, "gps"), (sensor_device_id, "sensors")):
+                print(f"Syncing {key_set} data...")
+                written = sync_device(connection, jwt_token, device_id, key_set, start_time)
+                print(f"Saved {written} new {key_set} rows.")
 
         print("Telemetry data saving process completed.")
 
+    except DatabaseConnectionError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    except requests.RequestException:
+        # Pages saved before the failed request are kept; the next run resumes after them
+        sys.exit(1)
     except Exception as e:
-        print(f"An error occurred: {e}")
\ No newline at end of file
+        print(f"An error occurred: {e}")
+        sys.exit(1)
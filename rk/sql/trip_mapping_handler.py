@@ -8,60 +8,55 @@ sys.path.append(
     )
 )
 
-from sql.database import connect_to_mysql
+from sql.database import mysql_connection
+from sql.schema import ensure_schema
 from mysql.connector import Error
 
 
-def save_device_trip_mapping(trip_id, gps_device_id, sensor_device_id):
+def save_device_trip_mapping(trip_id, gps_device_id, sensor_device_id, start_ts=None, end_ts=None):
     """
-    Save the mapping between trip_id, gps_device_id, and sensor_device_id to the device_trip_mapping table.
+    Save the mapping between trip_id, gps_device_id, and sensor_device_id to the device_trip_mapping table,
+    with the start and end of the trip in epoch milliseconds when they are known.
     """
-    connection = connect_to_mysql()
-    if not connection:
-        return
-
-    try:
-        cursor = connection.cursor()
-
-        # Create the device_trip_mapping table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS device_trip_mapping (
-                trip_id VARCHAR(255) PRIMARY KEY,
-                gps_device_id VARCHAR(255),
-                sensor_device_id VARCHAR(255),
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (gps_device_id, sensor_device_id)
-                    REFERENCES user_info(gps_device_id, sensor_device_id)
-                    ON DELETE CASCADE
-            )
-        ''')
-
-        # Insert or update the device-trip mapping
-        cursor.execute('''
-            INSERT INTO device_trip_mapping (trip_id, gps_device_id, sensor_device_id)
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE 
-                gps_device_id = VALUES(gps_device_id),
-                sensor_device_id = VALUES(sensor_device_id)
-        ''', (trip_id, gps_device_id, sensor_device_id))
-
-        connection.commit()
-        print(f"Device-trip mapping saved: Trip ID = {trip_id}, GPS Device ID = {gps_device_id}, Sensor Device ID = {sensor_device_id}")
-    except Error as e:
-        print(f"Error saving device-trip mapping: {e}")
-    finally:
-        connection.close()
+    with mysql_connection() as connection:
+        try:
+            cursor = connection.cursor()
+
+            # Insert or update the device-trip mapping
+            cursor.execute('''
+                INSERT INTO device_trip_mapping (trip_id, gps_device_id, sensor_device_id, start_ts, end_ts)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE 
+                    gps_device_id = VALUES(gps_device_id),
+                    sensor_device_id = VALUES(sensor_device_id),
+                    start_ts = COALESCE(VALUES(start_ts), start_ts),
+                    end_ts = COALESCE(VALUES(end_ts), end_ts)
+            ''', (trip_id, gps_device_id, sensor_device_id, start_ts, end_ts))
+
+            connection.commit()
+            print(f"Device-trip mapping saved: Trip ID = {trip_id}, GPS Device ID = {gps_device_id}, Sensor Device ID = {sensor_device_id}")
+        except Error as e:
+            print(f"Error saving device-trip mapping: {e}")
 
 
 if __name__ == "__main__":
-    # Accept the trip_id, gps_device_id, and sensor_device_id as command-line arguments or prompt for input
+    # Accept the trip_id, gps_device_id, and sensor_device_id as command-line arguments, optionally
+    # followed by the trip's start and end in epoch milliseconds
     if len(sys.argv) > 3:
         trip_id = sys.argv[1]
         gps_device_id = sys.argv[2]
         sensor_device_id = sys.argv[3]
+        start_ts = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        end_ts = int(sys.argv[5]) if len(sys.argv) > 5 else None
     else:
         print("Error: Please provide the trip_id, gps_device_id and the sensor_device_id as a command-line argument.")
         sys.exit(1)
 
+    # Make sure the schema is up to date
+    try:
+        ensure_schema()
+    except Error:
+        sys.exit(1)
+
     # Save the device-trip mapping
-    save_device_trip_mapping(trip_id, gps_device_id, sensor_device_id)
\ No newline at end of file
+    save_device_trip_mapping(trip_id, gps_device_id, sensor_device_id, start_ts, end_ts)
\ No newline at end of file
@@ -8,51 +8,11 @@ sys.path.append(
     )
 )
 
+import numpy as np
 from sr.sql.database import connect_to_mysql
-
-
-# Check if a column exists in a table
-def column_exists(connection, table_name, column_name):
-    try:
-        cursor = connection.cursor()
-        query = """
-        SELECT COUNT(*)
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
-        """
-        cursor.execute(query, (table_name, column_name))
-        return cursor.fetchone()[0] == 1
-    except Exception as e:
-        print(f"Error checking column existence: {e}")
-        sys.exit(1)
-
-
-# Update the Database Schema
-def update_tables(connection):
-    try:
-        cursor = connection.cursor()
-
-        # Check and add `braking_event` to `penalty_events_data`
-        if not column_exists(connection, "penalty_events_data", "braking_event"):
-            cursor.execute("""
-            ALTER TABLE penalty_events_data 
-            ADD COLUMN braking_event VARCHAR(10)
-            """)
-            print("Added column `braking_event` to `penalty_events_data`.")
-
-        # Check and add `braking_score` to `scores_data`
-        if not column_exists(connection, "scores_data", "braking_score"):
-            cursor.execute("""
-            ALTER TABLE scores_data 
-            ADD COLUMN braking_score FLOAT
-            """)
-            print("Added column `braking_score` to `scores_data`.")
-
-        connection.commit()
-    
-    except Exception as e:
-        print(f"Error updating tables: {e}")
-        sys.exit(1)
+from sr.sql.schema import ensure_schema
+from sr.sql.penalty_events import clear_events, prune_empty_events
+from sr.scoring.bands import PENALTY_BANDS, classify_bands
 
 
 # Fetch braking data for a specific trip
@@ -68,7 +28,7 @@ def get_braking_data(trip_id, connection):
         return cursor.fetchall()
     except Exception as e:
         print(f"Error fetching data: {e}")
-        sys.exit(1)
+        raise
 
 
 # Convert acceleration from mps² to G-force
@@ -89,27 +49,23 @@ def score_braking(data, connection):
         total_score = 0
         penalty_count = 0  # Count of penalty events
 
-        for record in data:
+        # Clear the previous braking events of the trip
+        trip_id = data[0][0]
+        clear_events(cursor, trip_id, "braking_event")
+
+        # Classify every sample against the braking bands in one call
+        acceleration_g = convert_to_g_force(np.array([record[4] for record in data], dtype=float))
+        events, penalties = classify_bands("braking", acceleration_g)
+
+        for i, record in enumerate(data):
             trip_id, timestamp, latitude, longitude, acceleration_mps2 = record
 
-            # Skip rows where acceleration is None
-            if acceleration_mps2 is None:
+            # Only samples with a braking event are stored
+            braking_event = events[i]
+            if braking_event is None:
                 continue
 
-            # Convert acceleration to G-force
-            acceleration_g = convert_to_g_force(acceleration_mps2)
-
-            # Determine if a penalty applies for braking
-            if -0.25 <= acceleration_g < -0.15:
-                braking_event = "mild"
-                penalty_score = 5
-            elif acceleration_g < -0.25:
-                braking_event = "severe"
-                penalty_score = 10
-            else:
-                # No penalty
-                braking_event = None
-                penalty_score = 0
+            penalty_score = int(penalties[i])
 
             # Corrected INSERT statement for penalty_events_data
             cursor.execute("""
@@ -126,11 +82,14 @@ def score_braking(data, connection):
                 total_score += penalty_score
                 penalty_count += 1
 
+        # Remove rows left without any event
+        prune_empty_events(cursor, trip_id)
+
         # Calculate normalized braking score
         if penalty_count == 0:
             normalized_score = 100.0  # Perfect score if no penalties
         else:
-            normalized_score = max(10, 100 - (total_score / trip_duration * 100))
+            normalized_score = max(PENALTY_BANDS["braking"]["floor"], 100 - (total_score / trip_duration * 100))
 
         # Insert or update the braking score in scores_data
         cursor.execute("""
@@ -145,7 +104,7 @@ def score_braking(data, connection):
 
     except Exception as e:
         print(f"Error scoring data: {e}")
-        sys.exit(1)
+        raise
 
 
 # Main Execution
@@ -159,13 +118,16 @@ if __name__ == "__main__":
     connection = connect_to_mysql()
 
     try:
-        # Update Tables Before Scoring
-        update_tables(connection)
+        # Make sure the schema is up to date
+        ensure_schema(connection)
 
         # Fetch and score data
         braking_data = get_braking_data(trip_id, connection)
         score_braking(braking_data, connection)
 
+    except Exception:
+        sys.exit(1)
+
     finally:
         if connection.is_connected():
             connection.close()
@@ -0,0 +1,117 @@
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../..")
+    )
+)
+
+import numpy as np
+from mysql.connector import Error
+from sr.sql.database import mysql_connection
+from sr.sql.timestamps import format_timestamp
+from sr.scoring.preprocessing_engine import (
+    DERIVED_COLUMNS,
+    load_trip_columns,
+    fill_missing_timestamps,
+    compute_derived_columns,
+    get_incremental_bounds,
+    to_datetime64
+)
+
+# Columns an incremental run rewrites that have to match a full run
+COMPARED_COLUMNS = ["latitude_filled", "longitude_filled"] + DERIVED_COLUMNS
+
+
+def gap_high_water_marks(columns):
+    """
+    Return the timestamp in the middle of every run of samples without a
+    GPS fix. An incremental run from there has to interpolate across the
+    high-water mark.
+    """
+    missing = np.isnan(columns["latitude"]) | np.isnan(columns["longitude"])
+
+    # Start and end of every run of missing positions
+    edges = np.diff(np.concatenate([[0], missing.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    return [columns["timestamp"][(start + end - 1) // 2] for start, end in zip(starts, ends)]
+
+
+def preprocess_in_memory(cursor, trip_id, origin, since=None):
+    """
+    Fill missing timestamps and compute the derived columns of a trip, or
+    of its rows from since onwards, without writing anything.
+    """
+    columns = load_trip_columns(cursor, trip_id, since=since)
+    return compute_derived_columns(fill_missing_timestamps(columns, origin))
+
+
+def compare_incremental_run(cursor, trip_id, high_water_mark, full):
+    """
+    Preprocess a trip as an incremental run after high_water_mark and
+    compare the rows it would write with full, the columns of a full run.
+    Returns the columns that differ.
+    """
+    bounds = get_incremental_bounds(cursor, trip_id, high_water_mark)
+    if bounds is None or bounds[0] is None:
+        return []  # Nothing or the whole trip is recomputed
+    load_from, write_from = bounds
+    incremental = preprocess_in_memory(cursor, trip_id, full["time"][0], since=load_from)
+
+    write_start = to_datetime64([write_from])[0]
+    full_rows = full["time"] >= write_start
+    incremental_rows = incremental["time"] >= write_start
+    if not np.array_equal(full["time"][full_rows], incremental["time"][incremental_rows]):
+        return ["timestamp"]
+    return [
+        column for column in COMPARED_COLUMNS
+        if not np.allclose(full[column][full_rows], incremental[column][incremental_rows], equal_nan=True)
+    ]
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python check_incremental.py <trip_id> [high_water_mark]")
+        sys.exit(1)
+
+    trip_id = sys.argv[1]
+
+    try:
+        with mysql_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                columns = load_trip_columns(cursor, trip_id)
+                if columns is None:
+                    print(f"No data found for trip_id: {trip_id}")
+                    sys.exit(1)
+
+                # By default, check a high-water mark inside every gap in the trip's positions
+                if len(sys.argv) == 3:
+                    high_water_marks = [format_timestamp(sys.argv[2])]
+                else:
+                    high_water_marks = gap_high_water_marks(columns)
+
+                full = preprocess_in_memory(cursor, trip_id, columns["time"][0])
+                mismatches = {}
+                for high_water_mark in high_water_marks:
+                    mismatched = compare_incremental_run(cursor, trip_id, high_water_mark, full)
+                    if mismatched:
+                        mismatches[high_water_mark] = mismatched
+            finally:
+                cursor.close()
+    except Error as e:
+        print(f"Error checking incremental preprocessing: {e}")
+        sys.exit(1)
+
+    for high_water_mark, mismatched in mismatches.items():
+        print(f"Incremental run after {high_water_mark} differs from a full run in: {', '.join(mismatched)}")
+    if mismatches:
+        sys.exit(1)
+    print(f"Incremental runs after {len(high_water_marks)} high-water marks match a full run "
+          f"of trip_id {trip_id}.")
+
+
+if __name__ == "__main__":
+    main()
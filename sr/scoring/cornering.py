@@ -8,50 +8,11 @@ sys.path.append(
     )
 )
 
+import numpy as np
 from sr.sql.database import connect_to_mysql
-
-
-# Check if columns exist
-def column_exists(connection, table_name, column_name):
-    try:
-        cursor = connection.cursor()
-        query = """
-        SELECT COUNT(*)
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
-        """
-        cursor.execute(query, (table_name, column_name))
-        return cursor.fetchone()[0] == 1
-    except Exception as e:
-        print(f"Error checking column existence: {e}")
-        sys.exit(1)
-
-
-# Update tables to add cornering columns
-def update_tables(connection):
-    try:
-        cursor = connection.cursor()
-
-        # Add columns if they don't exist
-        if not column_exists(connection, "penalty_events_data", "cornering_event"):
-            cursor.execute("""
-            ALTER TABLE penalty_events_data 
-            ADD COLUMN cornering_event VARCHAR(10)
-            """)
-            print("Added column `cornering_event` to `penalty_events_data`.")
-
-        if not column_exists(connection, "scores_data", "cornering_score"):
-            cursor.execute("""
-            ALTER TABLE scores_data
-            ADD COLUMN cornering_score FLOAT
-            """)
-            print("Added column `cornering_score` to `scores_data`.")
-
-        connection.commit()
-
-    except Exception as e:
-        print(f"Error updating tables: {e}")
-        sys.exit(1)
+from sr.sql.schema import ensure_schema
+from sr.sql.penalty_events import clear_events, prune_empty_events
+from sr.scoring.bands import PENALTY_BANDS, classify_bands
 
 
 # Fetch cornering data for a specific trip
@@ -68,7 +29,7 @@ def get_cornering_data(trip_id, connection):
         return cursor.fetchall()
     except Exception as e:
         print(f"Error fetching data: {e}")
-        sys.exit(1)
+        raise
 
 
 # Score cornering and track penalty events
@@ -84,26 +45,24 @@ def score_cornering(data, connection):
         total_score = 0
         penalty_count = 0
 
-        for record in data:
+        # Clear the previous cornering events of the trip
+        trip_id = data[0][0]
+        clear_events(cursor, trip_id, "cornering_event")
+
+        # Classify every sample against the cornering bands in one call
+        events, penalties = classify_bands(
+            "cornering", np.array([record[4] for record in data], dtype=float)
+        )
+
+        for i, record in enumerate(data):
             trip_id, timestamp, lat, lon, lateral_accel = record
 
-            # Skip if lateral acceleration is missing
-            if lateral_accel is None:
+            # Only samples with a cornering event are stored
+            cornering_event = events[i]
+            if cornering_event is None:
                 continue
 
-            # Take the absolute value of lateral acceleration
-            lateral_accel = abs(lateral_accel)
-
-            # Determine if a penalty applies for cornering
-            if 0.18 <= lateral_accel < 0.35:
-                cornering_event = "mild"
-                penalty_score = 5
-            elif lateral_accel >= 0.35:
-                cornering_event = "severe"
-                penalty_score = 10
-            else:
-                cornering_event = None
-                penalty_score = 0
+            penalty_score = int(penalties[i])
 
             # Corrected INSERT statement for penalty_events_data
             cursor.execute("""
@@ -120,11 +79,14 @@ def score_cornering(data, connection):
                 total_score += penalty_score
                 penalty_count += 1
 
+        # Remove rows left without any event
+        prune_empty_events(cursor, trip_id)
+
         # Calculate normalized cornering score
         if penalty_count == 0:
             normalized_score = 100.0  # Perfect score if no penalties
         else:
-            normalized_score = max(10, 100 - (total_score / trip_duration * 100))
+            normalized_score = max(PENALTY_BANDS["cornering"]["floor"], 100 - (total_score / trip_duration * 100))
 
         # Insert or update the cornering score in scores_data
         cursor.execute("""
@@ -139,7 +101,7 @@ def score_cornering(data, connection):
 
     except Exception as e:
         print(f"Error scoring data: {e}")
-        sys.exit(1)
+        raise
 
 
 # Main Execution
@@ -153,13 +115,16 @@ if __name__ == "__main__":
     connection = connect_to_mysql()
 
     try:
-        # Update tables before scoring
-        update_tables(connection)
+        # Make sure the schema is up to date
+        ensure_schema(connection)
 
         # Fetch and score data
         cornering_data = get_cornering_data(trip_id, connection)
         score_cornering(cornering_data, connection)
 
+    except Exception:
+        sys.exit(1)
+
     finally:
         if connection.is_connected():
             connection.close()
\ No newline at end of file
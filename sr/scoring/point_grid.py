@@ -0,0 +1,59 @@
+import math
+from sr.scoring.geodesy import nearest_point
+
+METERS_PER_DEGREE_LAT = 111320
+
+
+class PointGrid:
+    """
+    Nearest-neighbour lookup over points that arrive one at a time.
+    Points are hashed into cells as wide as the search radius, so an
+    insert is a dictionary append and a query only measures the points
+    in the few cells around it, however many points are stored.
+    """
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.cell_degrees = radius / METERS_PER_DEGREE_LAT
+        self.cells = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def cell(self, lat, lon):
+        return int(lat // self.cell_degrees), int(lon // self.cell_degrees)
+
+    def insert(self, lat, lon, value):
+        """
+        Add a point carrying a value.
+        """
+        self.cells.setdefault(self.cell(lat, lon), []).append((lat, lon, value))
+        self.size += 1
+
+    def nearest(self, lat, lon):
+        """
+        Return (value, distance in meters) of the nearest point within the
+        radius, or None if there is none.
+        """
+        if lat is None or lon is None or math.isnan(lat) or math.isnan(lon):
+            return None
+
+        # Cells shrink east-west away from the equator, so search as many
+        # columns as the radius spans at this latitude
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        reach_lon = min(math.ceil(1 / cos_lat), int(360 / self.cell_degrees))
+        cell_lat, cell_lon = self.cell(lat, lon)
+
+        candidates = []
+        for i in range(cell_lat - 1, cell_lat + 2):
+            for j in range(cell_lon - reach_lon, cell_lon + reach_lon + 1):
+                candidates.extend(self.cells.get((i, j), ()))
+        if not candidates:
+            return None
+
+        point_lats, point_lons, values = zip(*candidates)
+        index, distance = nearest_point(lat, lon, point_lats, point_lons)
+        if distance > self.radius:
+            return None
+        return values[int(index)], float(distance)
@@ -0,0 +1,380 @@
+import numpy as np
+from mysql.connector import Error
+
+from sr.sql.database import connect_to_mysql
+from sr.sql.bulk_writer import BULK_BATCH_SIZE, upsert_rows
+from sr.sql.timestamps import TIMESTAMP_MODE
+from sr.sql.schema import PREPROCESSED_DERIVED_COLUMNS
+from sr.scoring.interpolation import fill_gaps
+from sr.scoring.rolling import window_extent, rolling_mean, rolling_circular_mean
+from sr.scoring.geodesy import step_bearings, step_distances
+from sr.scoring.resampling import SAMPLE_RATE_HZ, GRID_TOLERANCE_SECONDS, find_gaps
+from sr.scoring.map_matching import NO_SEGMENT, match_segments
+
+# Raw columns copied from driving_data
+RAW_COLUMNS = ["latitude", "longitude", "bearing", "speed"]
+
+# Columns derived by the preprocessing pipeline
+DERIVED_COLUMNS = PREPROCESSED_DERIVED_COLUMNS
+
+MPS_TO_MPH = 2.23694
+MPH_TO_MPS = 0.44704
+G_FORCE_CONSTANT = 9.80665  # m/s^2
+
+# Gap filling for latitude and longitude; None keeps every gap filled
+GAP_FILL_METHOD = "linear"
+MAX_GAP_SECONDS = None
+
+# Width of the moving averages for bearing, speed and lateral acceleration
+SMOOTHING_WINDOW = 3
+SMOOTHING_CENTER = True
+
+# Samples a derived value depends on before and after its own row: the
+# lateral_acceleration_avg chain applies two windows and two differences
+_WINDOW_BEFORE, _WINDOW_AFTER = window_extent(SMOOTHING_WINDOW, SMOOTHING_CENTER)
+LOOKBACK_SAMPLES = 2 * _WINDOW_BEFORE + 2
+LOOKAHEAD_SAMPLES = 2 * _WINDOW_AFTER
+
+
+def to_datetime64(timestamps):
+    """
+    Convert stored timestamps (epoch milliseconds or ISO 8601 strings)
+    to a datetime64 array without per-row Python parsing.
+    """
+    values = np.asarray(timestamps)
+    if np.issubdtype(values.dtype, np.number):
+        return values.astype(np.int64).astype("datetime64[ms]")
+    return values.astype("datetime64[us]")
+
+
+def format_datetime64(times, mode=TIMESTAMP_MODE):
+    """
+    Convert a datetime64 array to stored timestamps of the given mode.
+    """
+    if mode == "epoch_ms":
+        return np.array(times.astype("datetime64[ms]").astype(np.int64).tolist(), dtype=object)
+    return np.datetime_as_string(times, unit="us").astype(object)
+
+
+def load_trip_columns(cursor, trip_id, since=None):
+    """
+    Load the raw driving data for a trip into NumPy columns ordered by timestamp,
+    optionally only from the since timestamp onwards.
+    Missing values are represented as NaN.
+    """
+    if since is None:
+        cursor.execute("""
+            SELECT timestamp, latitude, longitude, bearing, speed
+            FROM driving_data
+            WHERE trip_id = %s
+            ORDER BY timestamp
+        """, (trip_id,))
+    else:
+        cursor.execute("""
+            SELECT timestamp, latitude, longitude, bearing, speed
+            FROM driving_data
+            WHERE trip_id = %s AND timestamp >= %s
+            ORDER BY timestamp
+        """, (trip_id, since))
+    data = cursor.fetchall()
+
+    if not data:
+        return None
+
+    timestamps, latitudes, longitudes, bearings, speeds = zip(*data)
+    return {
+        "timestamp": np.array(timestamps, dtype=object),
+        "time": to_datetime64(timestamps),
+        "latitude": np.array(latitudes, dtype=float),
+        "longitude": np.array(longitudes, dtype=float),
+        "bearing": np.array(bearings, dtype=float),
+        "speed": np.array(speeds, dtype=float),
+    }
+
+
+def fill_missing_timestamps(columns, origin=None, rate=SAMPLE_RATE_HZ,
+                            tolerance=GRID_TOLERANCE_SECONDS):
+    """
+    Add NULL rows for every slot of the sampling grid between the first
+    and last timestamp that no sample fills, keeping rows ordered by time.
+    The grid is anchored at origin (the trip start) when it is given.
+    """
+    times = columns["time"]
+    missing = find_gaps(times, origin, rate, tolerance)
+    if missing.size == 0:
+        return columns
+
+    filled = {
+        "timestamp": np.concatenate([
+            columns["timestamp"],
+            format_datetime64(missing)
+        ]),
+        "time": np.concatenate([times, missing]),
+    }
+    for column in RAW_COLUMNS:
+        filled[column] = np.concatenate([columns[column], np.full(missing.size, np.nan)])
+
+    order = np.argsort(filled["time"], kind="stable")
+    return {name: values[order] for name, values in filled.items()}
+
+
+def compute_derived_columns(columns, method=GAP_FILL_METHOD, max_gap=MAX_GAP_SECONDS,
+                            window=SMOOTHING_WINDOW, center=SMOOTHING_CENTER):
+    """
+    Compute the interpolated positions and every derived column of the
+    preprocessing pipeline in memory.
+    """
+    seconds = (columns["time"] - columns["time"][0]) / np.timedelta64(1, "s")
+    n = len(seconds)
+
+    # Fill gaps in latitude and longitude
+    columns["latitude_filled"] = fill_gaps(seconds, columns["latitude"], method, max_gap)
+    columns["longitude_filled"] = fill_gaps(seconds, columns["longitude"], method, max_gap)
+
+    latitude = columns["latitude_filled"]
+    longitude = columns["longitude_filled"]
+    time_diff = np.diff(seconds)
+
+    # Bearing between consecutive points, normalized to [0, 360)
+    bearing_gps = np.full(n, np.nan)
+    bearing_gps[1:] = step_bearings(latitude, longitude)
+    columns["bearing_gps"] = bearing_gps
+    columns["bearing_gps_avg"] = rolling_circular_mean(bearing_gps, window, center)
+
+    # Speed in mph from the haversine distance between consecutive points
+    distance = step_distances(latitude, longitude)
+    speed_gps = np.full(n, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        speed_gps[1:] = np.where(time_diff > 0, distance / time_diff * MPS_TO_MPH, np.nan)
+    columns["speed_gps"] = speed_gps
+    columns["speed_gps_avg"] = speed_gps_avg = rolling_mean(speed_gps, window, center)
+
+    # Acceleration in miles per second squared
+    acceleration = np.full(n, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        acceleration[1:] = np.where(
+            time_diff > 0, np.diff(speed_gps_avg / 3600) / time_diff, np.nan
+        )
+    columns["acceleration"] = acceleration
+
+    # Lateral acceleration from the change in heading, with 360-degree wrapping
+    bearing_gps_avg = columns["bearing_gps_avg"]
+    avg_speed_mps = (speed_gps_avg[:-1] + speed_gps_avg[1:]) * MPH_TO_MPS / 2
+    lateral_acceleration = np.full(n, np.nan)
+    with np.errstate(invalid="ignore"):
+        delta_bearing = (np.diff(bearing_gps_avg) + 180) % 360 - 180
+        lateral_acceleration[1:] = avg_speed_mps ** 2 * np.tan(np.radians(delta_bearing)) / G_FORCE_CONSTANT
+    columns["lateral_acceleration"] = lateral_acceleration
+    columns["lateral_acceleration_avg"] = rolling_mean(lateral_acceleration, window, center)
+
+    return columns
+
+
+def to_sql_values(values):
+    """
+    Convert a float column to an object array with None in place of NaN.
+    """
+    result = values.astype(object)
+    result[np.isnan(values)] = None
+    return result
+
+
+def write_trip_columns(cursor, trip_id, columns, batch_size=BULK_BATCH_SIZE, since=None):
+    """
+    Write the rows of the trip to preprocessed_driving_data in multi-row
+    batches, optionally only the rows from the since timestamp onwards.
+    """
+    rows_to_write = slice(None)
+    if since is not None:
+        rows_to_write = columns["time"] >= to_datetime64([since])[0]
+
+    names = ["latitude", "longitude", "bearing", "speed"] + DERIVED_COLUMNS
+    values = [
+        to_sql_values(columns["latitude_filled"][rows_to_write]),
+        to_sql_values(columns["longitude_filled"][rows_to_write]),
+        to_sql_values(columns["bearing"][rows_to_write]),
+        to_sql_values(columns["speed"][rows_to_write]),
+    ] + [to_sql_values(columns[name][rows_to_write]) for name in DERIVED_COLUMNS]
+
+    # Matched road segments, NULL where no segment was matched
+    names = names + ["segment_id"]
+    segment_ids = columns["segment_id"][rows_to_write].astype(object)
+    segment_ids[segment_ids == NO_SEGMENT] = None
+    values.append(segment_ids)
+
+    timestamps = columns["timestamp"][rows_to_write]
+    rows = zip([trip_id] * len(timestamps), timestamps, *values)
+    return upsert_rows(
+        cursor,
+        "preprocessed_driving_data",
+        ["trip_id", "timestamp"] + names,
+        rows,
+        update_columns=names,
+        batch_size=batch_size
+    )
+
+
+def get_high_water_mark(cursor, trip_id):
+    """
+    Return the last driving_data timestamp already preprocessed for a trip,
+    or None if the trip has not been preprocessed.
+    """
+    cursor.execute("""
+        SELECT high_water_mark
+        FROM preprocessing_state
+        WHERE trip_id = %s
+    """, (trip_id,))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def save_high_water_mark(cursor, trip_id, high_water_mark):
+    """
+    Record the last driving_data timestamp preprocessed for a trip.
+    """
+    cursor.execute("""
+        INSERT INTO preprocessing_state (trip_id, high_water_mark)
+        VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE high_water_mark = VALUES(high_water_mark)
+    """, (trip_id, high_water_mark))
+
+
+def get_sample_before(cursor, trip_id, timestamp, offset):
+    """
+    Return the timestamp of the driving_data sample offset rows before
+    the given timestamp (0 is the sample at or before it), or None.
+    """
+    cursor.execute("""
+        SELECT timestamp
+        FROM driving_data
+        WHERE trip_id = %s AND timestamp <= %s
+        ORDER BY timestamp DESC
+        LIMIT 1 OFFSET %s
+    """, (trip_id, timestamp, offset))
+    result = cursor.fetchone()
+    return result[0] if result else None
+
+
+def get_last_fix(cursor, trip_id, timestamp):
+    """
+    Return the timestamp of the last driving_data sample with a GPS fix at
+    or before the given timestamp, or None.
+    """
+    cursor.execute("""
+        SELECT MAX(timestamp)
+        FROM driving_data
+        WHERE trip_id = %s AND timestamp <= %s
+        AND latitude IS NOT NULL AND longitude IS NOT NULL
+    """, (trip_id, timestamp))
+    return cursor.fetchone()[0]
+
+
+def get_incremental_bounds(cursor, trip_id, high_water_mark):
+    """
+    Work out which samples an incremental run has to load and rewrite.
+
+    Rows after the last GPS fix at or before the high-water mark were only
+    forward filled and are re-interpolated, as are the LOOKAHEAD_SAMPLES rows
+    whose centered windows reach past it. LOOKBACK_SAMPLES further rows are
+    loaded as context, going back to a GPS fix so that positions missing in
+    the context are interpolated between the same fixes as in a full run.
+    Returns (load_from, write_from), or None if there is nothing new to
+    process.
+    """
+    cursor.execute("""
+        SELECT MIN(timestamp)
+        FROM driving_data
+        WHERE trip_id = %s AND timestamp > %s
+    """, (trip_id, high_water_mark))
+    if cursor.fetchone()[0] is None:
+        return None
+
+    last_fix = get_last_fix(cursor, trip_id, high_water_mark)
+    if last_fix is None:
+        # No usable fix yet, so the whole trip has to be recomputed
+        return (None, None)
+
+    write_offset = max(LOOKAHEAD_SAMPLES - 1, 0)
+    write_from = get_sample_before(cursor, trip_id, last_fix, write_offset)
+    context_from = get_sample_before(cursor, trip_id, last_fix, write_offset + LOOKBACK_SAMPLES)
+    if write_from is None or context_from is None:
+        return (None, None)
+    load_from = get_last_fix(cursor, trip_id, context_from)
+    if load_from is None:
+        return (None, None)
+    return (load_from, write_from)
+
+
+def preprocess_trip_columns(connection, trip_id, batch_size=BULK_BATCH_SIZE, incremental=False):
+    """
+    Preprocess a trip on an open connection and commit. Returns
+    (columns, written): the in-memory columns that were computed, which
+    cover the whole trip unless incremental=True, and the number of rows
+    written. columns is None if there was nothing to process.
+    Database errors are raised to the caller.
+    """
+    cursor = connection.cursor()
+    try:
+        # Step 1: Work out which part of the trip needs processing
+        load_from = write_from = origin = None
+        if incremental:
+            high_water_mark = get_high_water_mark(cursor, trip_id)
+            if high_water_mark is not None:
+                bounds = get_incremental_bounds(cursor, trip_id, high_water_mark)
+                if bounds is None:
+                    print(f"Trip {trip_id} is already preprocessed up to {high_water_mark}.")
+                    return None, 0
+                load_from, write_from = bounds
+
+            if load_from is not None:
+                cursor.execute("""
+                    SELECT MIN(timestamp)
+                    FROM driving_data
+                    WHERE trip_id = %s
+                """, (trip_id,))
+                origin = to_datetime64([cursor.fetchone()[0]])[0]
+
+        # Step 2: Load the trip into memory
+        columns = load_trip_columns(cursor, trip_id, since=load_from)
+        if columns is None:
+            print(f"No data found for trip_id: {trip_id}")
+            return None, 0
+
+        # Step 3: Fill missing timestamps, compute derived columns and
+        # match the samples to road segments
+        columns = fill_missing_timestamps(columns, origin)
+        columns = compute_derived_columns(columns)
+        columns["segment_id"] = match_segments(columns["latitude_filled"], columns["longitude_filled"])
+
+        # Step 4: Write the rows back in bulk and advance the high-water mark
+        written = write_trip_columns(cursor, trip_id, columns, batch_size, since=write_from)
+        save_high_water_mark(cursor, trip_id, columns["timestamp"][-1])
+        connection.commit()
+        return columns, written
+    finally:
+        cursor.close()
+
+
+def run_preprocessing_engine(trip_id, batch_size=BULK_BATCH_SIZE, incremental=False):
+    """
+    Preprocess a trip in a single pass: load the raw driving data once,
+    compute every derived column in memory and write the results back
+    to preprocessed_driving_data in bulk.
+
+    With incremental=True only samples past the trip's high-water mark,
+    plus the lookback window the derived columns need, are loaded and
+    rewritten, so re-running on a growing trip costs time proportional
+    to the new data.
+    """
+    connection = None
+    try:
+        connection = connect_to_mysql()
+        _, written = preprocess_trip_columns(connection, trip_id, batch_size, incremental)
+        return written
+
+    except Error as e:
+        print(f"Error: {e}")
+        return 0
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
@@ -1,44 +1,234 @@
-import subprocess
 import sys
+import os
+import io
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-# List of scoring scripts to run in sequence
-SCORING_SCRIPTS = [
-    "preprocessing.py",
-    "accelerating.py",
-    "braking.py",
-    "speed.py",
-    "cornering.py",
-    "final_score.py"
+# Add the parent directory to sys.path
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../..")
+    )
+)
+
+from sr.sql.database import connect_to_mysql
+from sr.sql.schema import ensure_schema
+from sr.scoring.preprocessing_engine import preprocess_trip_columns
+from sr.scoring.scoring_engine import (
+    CRITERIA,
+    load_scoring_columns,
+    scoring_columns_from_preprocessed,
+    evaluate_criterion,
+    store_trip_scores
+)
+from sr.scoring.final_score import get_component_scores, calculate_final_score, update_final_score
+
+# Number of stages that may run at the same time
+SCORING_WORKERS = 4
+
+
+def run_preprocessing(context):
+    """
+    Preprocess the trip and keep its columns for the scoring stages.
+    """
+    columns, written = preprocess_trip_columns(context["connection"], context["trip_id"])
+    if columns is not None:
+        context["columns"] = scoring_columns_from_preprocessed(columns)
+    else:
+        cursor = context["connection"].cursor()
+        try:
+            context["columns"] = load_scoring_columns(cursor, context["trip_id"])
+        finally:
+            cursor.close()
+    print(f"Preprocessed {written} rows for trip_id {context['trip_id']}.")
+
+
+def criterion_stage(criterion):
+    """
+    Build the stage that evaluates one criterion. Criterion stages only
+    read the shared columns, so they can run concurrently.
+    """
+    def run_criterion(context):
+        if context["columns"] is None:
+            print("No data found for scoring.")
+            return
+        context["results"][criterion] = evaluate_criterion(criterion, context["columns"])
+        events = context["results"][criterion][0]
+        print(f"Evaluated {criterion}: {int(events.astype(bool).sum())} events.")
+    return run_criterion
+
+
+def run_store_scores(context):
+    """
+    Write the events, episodes and component scores of every criterion.
+    """
+    if context["columns"] is None:
+        context["scores"] = None
+        return
+    context["scores"] = store_trip_scores(
+        context["trip_id"], context["connection"], context["columns"], context["results"]
+    )
+
+
+def run_final_score(context):
+    """
+    Combine the component scores into the final score.
+    """
+    scores = context.get("scores")
+    if scores:
+        component_scores = tuple(scores[criterion] for criterion in CRITERIA)
+    else:
+        component_scores = get_component_scores(context["trip_id"], context["connection"])
+
+    final_score = calculate_final_score(component_scores)
+    update_final_score(context["trip_id"], final_score, context["connection"])
+
+
+# Scoring stages as (name, function, names of the stages it depends on).
+# The criteria only depend on preprocessing and run concurrently; stages
+# that use the shared connection run once everything before them is done.
+SCORING_STAGES = [("preprocessing", run_preprocessing, [])] + [
+    (criterion, criterion_stage(criterion), ["preprocessing"]) for criterion in CRITERIA
+] + [
+    ("store_scores", run_store_scores, list(CRITERIA)),
+    ("final_score", run_final_score, ["store_scores"])
 ]
 
 
+class StageOutput(io.TextIOBase):
+    """
+    Stand-in for sys.stdout that sends what each thread prints to the
+    buffer of the stage it is running, so concurrent stages can be
+    captured separately. Threads outside a stage print normally.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer or self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def run_stage(name, stage, context, output):
+    """
+    Run one stage, capturing what it prints and any error.
+    Returns a dictionary with the stage's output, error and elapsed time.
+    """
+    output.local.buffer = io.StringIO()
+    error = None
+    start_time = time.perf_counter()
+
+    try:
+        stage(context)
+    except Exception:
+        error = traceback.format_exc()
+    finally:
+        captured = output.local.buffer.getvalue()
+        output.local.buffer = None
+
+    return {
+        "name": name,
+        "output": captured,
+        "error": error,
+        "elapsed": time.perf_counter() - start_time
+    }
+
+
+def report_stage(result):
+    """
+    Print the captured output and timing of a finished stage.
+    """
+    if result["error"]:
+        print(f"Error running {result['name']}:")
+        print(f"--- Standard Output ---\n{result['output']}")
+        print(f"--- Error Output ---\n{result['error']}")
+    else:
+        print(result["output"], end="")
+        print(f"{result['name']} finished in {result['elapsed']:.2f}s.")
+
+
+def run_all_scoring(trip_id, connection, stages=SCORING_STAGES, workers=SCORING_WORKERS):
+    """
+    Run the scoring stages for a trip in this interpreter, starting each
+    stage on a pool of worker threads as soon as the stages it depends on
+    have finished. No new stages start after a failure.
+    Returns the list of stage results in completion order.
+    """
+    context = {"trip_id": trip_id, "connection": connection, "results": {}}
+    dependencies = {name: set(depends_on) for name, _, depends_on in stages}
+    functions = {name: function for name, function, _ in stages}
+    pending = [name for name, _, _ in stages]
+    finished = set()
+    results = []
+    failed = False
+
+    output = StageOutput(sys.stdout)
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            running = {}
+            while pending or running:
+                # Start every stage whose dependencies have finished
+                if not failed:
+                    for name in [name for name in pending if dependencies[name] <= finished]:
+                        pending.remove(name)
+                        print(f"Running {name} for trip_id {trip_id}...")
+                        running[executor.submit(run_stage, name, functions[name], context, output)] = name
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    result = future.result()
+                    results.append(result)
+                    report_stage(result)
+
+                    if result["error"]:
+                        failed = True
+                    else:
+                        finished.add(result["name"])
+    finally:
+        sys.stdout = output.stream
+
+    return results
+
+
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python run_all_scoring.py <trip_id>")
+    if len(sys.argv) not in (2, 4) or (len(sys.argv) == 4 and sys.argv[2] != "--workers"):
+        print("Usage: python run_all_scoring.py <trip_id> [--workers N]")
         sys.exit(1)
 
     trip_id = sys.argv[1]
+    workers = int(sys.argv[3]) if len(sys.argv) == 4 else SCORING_WORKERS
 
-    # Run each script sequentially
-    for script in SCORING_SCRIPTS:
-        print(f"Running {script} for trip_id {trip_id}...")
+    connection = connect_to_mysql()
 
-        try:
-            result = subprocess.run(
-                ["python", script, trip_id],
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            print(result.stdout)
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error running {script}:")
-            print(f"--- Standard Output ---\n{e.stdout}")
-            print(f"--- Error Output ---\n{e.stderr}")
+    try:
+        # Make sure the schema is up to date
+        ensure_schema(connection)
+
+        start_time = time.perf_counter()
+        results = run_all_scoring(trip_id, connection, workers=workers)
+        if any(result["error"] for result in results) or len(results) < len(SCORING_STAGES):
             sys.exit(1)
 
-    print("All scoring scripts completed successfully.")
+    finally:
+        if connection.is_connected():
+            connection.close()
+
+    total_time = time.perf_counter() - start_time
+    stage_time = sum(result["elapsed"] for result in results)
+    print(f"All scoring stages completed successfully in {total_time:.2f}s "
+          f"({stage_time:.2f}s of stage time on {workers} workers).")
 
 
 if __name__ == "__main__":
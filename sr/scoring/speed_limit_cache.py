@@ -0,0 +1,218 @@
+import sys
+import os
+import time
+import sqlite3
+import threading
+
+# Cache file shared by every profile, at the repository root
+SPEED_LIMIT_CACHE_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../..", "speed_limit_cache.sqlite")
+)
+
+# Side of a cache cell in degrees of latitude and longitude (about 22 m
+# north-south). GPS fixes in the same cell share one cached speed limit.
+CACHE_CELL_DEGREES = 0.0002
+
+# Entries older than this are fetched again
+CACHE_TTL_SECONDS = 90 * 24 * 3600
+
+# Least recently used entries are evicted beyond this many cells
+CACHE_MAX_ENTRIES = 1000000
+
+# Check the entry count after this many writes
+CACHE_EVICT_EVERY = 100
+
+# A hit only refreshes an entry's last use when it is older than this,
+# so repeated reads of the same cells do not turn into writes
+CACHE_TOUCH_SECONDS = 3600
+
+
+def cache_cell(lat, lon, cell_degrees=CACHE_CELL_DEGREES):
+    """
+    Quantize a point to the integer grid cell that contains it.
+    """
+    return int(lat // cell_degrees), int(lon // cell_degrees)
+
+
+class SpeedLimitCache:
+    """
+    Persistent speed limit cache in an SQLite file, keyed by grid cell.
+    Points where no speed limit was found are cached too, as NULL, so a
+    repeated route needs no lookups at all. The file can be shared by
+    several processes; one instance can be used from several threads.
+    """
+
+    def __init__(self, path=SPEED_LIMIT_CACHE_PATH, cell_degrees=CACHE_CELL_DEGREES,
+                 ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.cell_degrees = cell_degrees
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.unsaved_hits = 0
+        self.unsaved_misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS speed_limits (
+                cell_lat INTEGER,
+                cell_lon INTEGER,
+                speed_limit REAL,
+                fetched_at REAL,
+                last_used REAL,
+                PRIMARY KEY (cell_lat, cell_lon)
+            );
+            CREATE INDEX IF NOT EXISTS idx_last_used ON speed_limits (last_used);
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER
+            );
+        """)
+        self.connection.commit()
+
+    def get(self, lat, lon):
+        """
+        Look up the cell of a point. Returns (found, speed_limit), where
+        speed_limit may be None for a cell known to have no limit.
+        Expired entries count as misses.
+        """
+        cell = cache_cell(lat, lon, self.cell_degrees)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("""
+                SELECT speed_limit, fetched_at, last_used
+                FROM speed_limits
+                WHERE cell_lat = ? AND cell_lon = ?
+            """, cell).fetchone()
+
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                self.unsaved_misses += 1
+                return False, None
+
+            self.hits += 1
+            self.unsaved_hits += 1
+            if now - row[2] > CACHE_TOUCH_SECONDS:
+                self.connection.execute("""
+                    UPDATE speed_limits SET last_used = ?
+                    WHERE cell_lat = ? AND cell_lon = ?
+                """, (now,) + cell)
+                self.connection.commit()
+            return True, row[0]
+
+    def put(self, lat, lon, speed_limit):
+        """
+        Store the speed limit (or None) of a point's cell.
+        """
+        cell = cache_cell(lat, lon, self.cell_degrees)
+        now = time.time()
+        with self.lock:
+            self.connection.execute("""
+                INSERT OR REPLACE INTO speed_limits
+                    (cell_lat, cell_lon, speed_limit, fetched_at, last_used)
+                VALUES (?, ?, ?, ?, ?)
+            """, cell + (speed_limit, now, now))
+            self.writes += 1
+            if self.writes % CACHE_EVICT_EVERY == 0:
+                self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        """
+        Delete expired entries and the least recently used entries beyond
+        max_entries. Returns the number of entries deleted.
+        """
+        cursor = self.connection.execute(
+            "DELETE FROM speed_limits WHERE fetched_at < ?", (time.time() - self.ttl,)
+        )
+        deleted = cursor.rowcount
+        excess = self.connection.execute("SELECT COUNT(*) FROM speed_limits").fetchone()[0] - self.max_entries
+        if excess > 0:
+            cursor = self.connection.execute("""
+                DELETE FROM speed_limits WHERE rowid IN (
+                    SELECT rowid FROM speed_limits ORDER BY last_used LIMIT ?
+                )
+            """, (excess,))
+            deleted += cursor.rowcount
+        return deleted
+
+    def save_stats(self):
+        """
+        Add the hits and misses since the last save to the totals kept in
+        the cache file.
+        """
+        with self.lock:
+            for name, value in (("hits", self.unsaved_hits), ("misses", self.unsaved_misses)):
+                self.connection.execute("""
+                    INSERT INTO cache_stats (name, value) VALUES (?, ?)
+                    ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+                """, (name, value))
+            self.connection.commit()
+            self.unsaved_hits = 0
+            self.unsaved_misses = 0
+
+    def stats(self):
+        """
+        Return the entry count and the hit counts of this process and of
+        every process that saved its statistics.
+        """
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM speed_limits").fetchone()[0]
+            totals = dict(self.connection.execute("SELECT name, value FROM cache_stats").fetchall())
+
+        total_hits = totals.get("hits", 0) + self.unsaved_hits
+        total_misses = totals.get("misses", 0) + self.unsaved_misses
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0,
+            "total_hits": total_hits,
+            "total_misses": total_misses,
+            "total_hit_rate": total_hits / (total_hits + total_misses) if total_hits + total_misses else 0.0
+        }
+
+    def clear(self):
+        """
+        Delete every entry and the saved statistics.
+        """
+        with self.lock:
+            self.connection.execute("DELETE FROM speed_limits")
+            self.connection.execute("DELETE FROM cache_stats")
+            self.connection.commit()
+
+    def close(self):
+        self.save_stats()
+        self.connection.close()
+
+
+def main():
+    if len(sys.argv) != 2 or sys.argv[1] not in ("stats", "evict", "clear"):
+        print("Usage: python speed_limit_cache.py <stats|evict|clear>")
+        sys.exit(1)
+
+    cache = SpeedLimitCache()
+    try:
+        if sys.argv[1] == "evict":
+            with cache.lock:
+                deleted = cache.evict()
+                cache.connection.commit()
+            print(f"Evicted {deleted} entries.")
+        elif sys.argv[1] == "clear":
+            cache.clear()
+            print("Speed limit cache cleared.")
+
+        stats = cache.stats()
+        print(f"{stats['entries']} cached cells in {cache.path}, "
+              f"{stats['total_hits']} hits and {stats['total_misses']} misses overall "
+              f"({stats['total_hit_rate']:.1%} hit rate).")
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
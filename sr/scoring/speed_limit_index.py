@@ -0,0 +1,357 @@
+import sys
+import os
+import json
+import math
+import numpy as np
+
+# Add the parent directory to sys.path
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../..")
+    )
+)
+
+from sr.scoring.geodesy import EARTH_RADIUS_M
+
+# Default location of the serialized index
+SPEED_LIMIT_INDEX_PATH = os.path.join(os.path.dirname(__file__), "speed_limits.npz")
+
+# Roads further than this from a GPS point are ignored, matching the
+# 50 meter radius of the Overpass lookup in speed.py
+MAX_ROAD_DISTANCE_M = 50
+
+# Side of a grid cell in meters
+GRID_CELL_SIZE_M = 100
+
+KMH_PER_MPH = 1.609344
+
+# Cell coordinates are offset by this much to pack them into one key
+CELL_OFFSET = 2 ** 20
+
+# Index loaded from SPEED_LIMIT_INDEX_PATH on first use. False once we
+# know it has not been built.
+default_index = None
+
+
+def parse_maxspeed(value):
+    """
+    Convert an OSM maxspeed tag to miles per hour. Values tagged "km/h"
+    are converted; values tagged "mph" and bare numbers are used as is,
+    since the trips are driven where limits are posted in mph. Where
+    several limits are given ("35 mph;25 mph") the first is used.
+    Returns None for values without a number ("signals", "none").
+    """
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        value = value[0] if value else None
+        return parse_maxspeed(value)
+    if isinstance(value, (int, float)):
+        return None if math.isnan(value) else float(value)
+
+    value = str(value).split(";")[0].strip().lower()
+    try:
+        if value.endswith("mph"):
+            return float(value[:-3].strip())
+        if value.endswith("km/h"):
+            return float(value[:-4].strip()) / KMH_PER_MPH
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_road_id(value):
+    """
+    Convert an OSM way id ("way/123", "w123" or 123) to an integer, or
+    None if there is no usable id.
+    """
+    if value is None:
+        return None
+    digits = "".join(character for character in str(value) if character.isdigit())
+    return int(digits) if digits else None
+
+
+def read_geojson_roads(path):
+    """
+    Read roads from a GeoJSON file of LineString or MultiLineString
+    features. Returns a list of (coordinates as [(lon, lat), ...], speed
+    limit in mph, OSM way id or None) for every road with a usable maxspeed.
+    """
+    with open(path) as f:
+        features = json.load(f).get("features", [])
+
+    roads = []
+    for feature in features:
+        properties = feature.get("properties") or {}
+        maxspeed = properties.get("maxspeed", (properties.get("tags") or {}).get("maxspeed"))
+        speed_limit = parse_maxspeed(maxspeed)
+        geometry = feature.get("geometry") or {}
+        if speed_limit is None:
+            continue
+        road_id = parse_road_id(
+            feature.get("id", properties.get("@id", properties.get("osm_id", properties.get("id"))))
+        )
+
+        if geometry.get("type") == "LineString":
+            roads.append((geometry["coordinates"], speed_limit, road_id))
+        elif geometry.get("type") == "MultiLineString":
+            roads.extend((line, speed_limit, road_id) for line in geometry["coordinates"])
+    return roads
+
+
+def read_pbf_roads(path):
+    """
+    Read roads from an OSM PBF extract. Requires the pyosmium package.
+    Returns the same layout as read_geojson_roads.
+    """
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError("Reading PBF extracts requires pyosmium (pip install osmium).")
+
+    class RoadHandler(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.roads = []
+
+        def way(self, way):
+            if "highway" not in way.tags or "maxspeed" not in way.tags:
+                return
+            speed_limit = parse_maxspeed(way.tags["maxspeed"])
+            coordinates = [
+                (node.location.lon, node.location.lat)
+                for node in way.nodes if node.location.valid()
+            ]
+            if speed_limit is not None and len(coordinates) > 1:
+                self.roads.append((coordinates, speed_limit, way.id))
+
+    handler = RoadHandler()
+    handler.apply_file(path, locations=True)
+    return handler.roads
+
+
+def project(lat, lon, reference_lat):
+    """
+    Project degrees to planar meters with an equirectangular projection
+    centered on reference_lat. North-south distances are exact, but
+    east-west distances are only true at reference_lat and are off by a
+    factor of cos(lat) / cos(reference_lat) elsewhere, a few percent a few
+    degrees away. Rescale them with east_west_scale.
+    """
+    scale = np.cos(np.radians(reference_lat))
+    x = EARTH_RADIUS_M * np.radians(np.asarray(lon, dtype=float)) * scale
+    y = EARTH_RADIUS_M * np.radians(np.asarray(lat, dtype=float))
+    return x, y
+
+
+def east_west_scale(index, y):
+    """
+    Factor that turns projected east-west distances near the projected
+    latitude y into meters, re-centering the projection on y.
+    """
+    lat = np.degrees(np.asarray(y, dtype=float) / EARTH_RADIUS_M)
+    return np.cos(np.radians(lat)) / np.cos(np.radians(float(index["reference_lat"])))
+
+
+def cell_keys(cell_x, cell_y):
+    """
+    Pack integer grid cell coordinates into a single sortable key.
+    """
+    return (cell_x + CELL_OFFSET) * (2 * CELL_OFFSET) + (cell_y + CELL_OFFSET)
+
+
+def build_speed_limit_index(roads, cell_size=GRID_CELL_SIZE_M):
+    """
+    Build a uniform grid index over the straight segments of a list of
+    roads. Each segment is registered in every cell its bounding box
+    touches, and the cells are stored sorted so lookups are a binary search.
+    Roads without an OSM way id are numbered after the largest id.
+    Returns the index as a dictionary of numpy arrays.
+    """
+    # Step 1: Split the roads into segments
+    starts, ends, limits, road_ids = [], [], [], []
+    next_id = max([road_id for _, _, road_id in roads if road_id is not None], default=0) + 1
+    for coordinates, speed_limit, road_id in roads:
+        coordinates = np.asarray(coordinates, dtype=float)
+        if len(coordinates) < 2:
+            continue
+        if road_id is None:
+            road_id = next_id
+            next_id += 1
+        starts.append(coordinates[:-1])
+        ends.append(coordinates[1:])
+        limits.append(np.full(len(coordinates) - 1, speed_limit))
+        road_ids.append(np.full(len(coordinates) - 1, road_id, dtype=np.int64))
+    if not starts:
+        raise ValueError("No roads with a speed limit to index")
+
+    starts = np.concatenate(starts)
+    ends = np.concatenate(ends)
+    reference_lat = float(np.mean(starts[:, 1]))
+    x1, y1 = project(starts[:, 1], starts[:, 0], reference_lat)
+    x2, y2 = project(ends[:, 1], ends[:, 0], reference_lat)
+
+    # Step 2: Enumerate the cells covered by each segment's bounding box
+    cell_x0 = np.floor(np.minimum(x1, x2) / cell_size).astype(np.int64)
+    cell_x1 = np.floor(np.maximum(x1, x2) / cell_size).astype(np.int64)
+    cell_y0 = np.floor(np.minimum(y1, y2) / cell_size).astype(np.int64)
+    cell_y1 = np.floor(np.maximum(y1, y2) / cell_size).astype(np.int64)
+    widths = cell_x1 - cell_x0 + 1
+    counts = widths * (cell_y1 - cell_y0 + 1)
+
+    segments = np.repeat(np.arange(len(counts)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_x = np.repeat(cell_x0, counts) + local % np.repeat(widths, counts)
+    cell_y = np.repeat(cell_y0, counts) + local // np.repeat(widths, counts)
+
+    # Step 3: Group the segments by cell
+    keys = cell_keys(cell_x, cell_y)
+    order = np.argsort(keys, kind="stable")
+    keys, cell_starts = np.unique(keys[order], return_index=True)
+
+    return {
+        "cell_size": np.float64(cell_size),
+        "reference_lat": np.float64(reference_lat),
+        "cell_keys": keys,
+        "cell_starts": np.append(cell_starts, len(order)),
+        "cell_segments": segments[order],
+        "segments": np.column_stack([x1, y1, x2, y2]),
+        "speed_limits": np.concatenate(limits),
+        "road_ids": np.concatenate(road_ids)
+    }
+
+
+def save_speed_limit_index(index, path=SPEED_LIMIT_INDEX_PATH):
+    """
+    Write an index to a compressed .npz file.
+    """
+    np.savez_compressed(path, **index)
+
+
+def load_speed_limit_index(path=SPEED_LIMIT_INDEX_PATH):
+    """
+    Load an index written by save_speed_limit_index.
+    """
+    with np.load(path) as data:
+        index = {name: data[name] for name in data.files}
+
+    # Indexes built before road ids were stored number every segment
+    if "road_ids" not in index:
+        index["road_ids"] = np.arange(len(index["segments"]), dtype=np.int64)
+    return index
+
+
+def get_speed_limit_index():
+    """
+    Return the index at SPEED_LIMIT_INDEX_PATH, loading it once per
+    process, or None if it has not been built.
+    """
+    global default_index
+    if default_index is None:
+        if os.path.exists(SPEED_LIMIT_INDEX_PATH):
+            default_index = load_speed_limit_index(SPEED_LIMIT_INDEX_PATH)
+        else:
+            default_index = False
+    return default_index or None
+
+
+def road_speed_limits(index):
+    """
+    Return {OSM way id: speed limit in mph} for every indexed road.
+    """
+    if "road_limits" not in index:
+        index["road_limits"] = dict(zip(index["road_ids"].tolist(), index["speed_limits"].tolist()))
+    return index["road_limits"]
+
+
+def nearby_segments(index, x, y, max_distance=MAX_ROAD_DISTANCE_M):
+    """
+    Find the indexed segments within max_distance meters of a projected
+    point. Distances are in meters at the point's own latitude. Returns
+    (segment rows, distances, projected points as an (n, 2) array), empty
+    when no segment is in reach.
+    """
+    cell_size = float(index["cell_size"])
+    scale = float(east_west_scale(index, y))
+
+    # Step 1: Collect the segments of every cell within reach of the point.
+    # Keys are ordered by column then row, so the cells in reach of each
+    # column form one contiguous run of keys and of segments.
+    reach_x = int(np.ceil(max_distance / scale / cell_size))
+    reach_y = int(np.ceil(max_distance / cell_size))
+    cell_x = int(np.floor(x / cell_size)) + np.arange(-reach_x, reach_x + 1)
+    cell_y = int(np.floor(y / cell_size))
+    first = np.searchsorted(index["cell_keys"], cell_keys(cell_x, cell_y - reach_y), side="left")
+    last = np.searchsorted(index["cell_keys"], cell_keys(cell_x, cell_y + reach_y), side="right")
+    candidates = np.unique(np.concatenate([
+        index["cell_segments"][index["cell_starts"][i]:index["cell_starts"][j]]
+        for i, j in zip(first.tolist(), last.tolist()) if j > i
+    ] or [np.empty(0, dtype=np.int64)]))
+
+    # Step 2: Distance from the point to each candidate segment, with
+    # east-west offsets rescaled to meters at the point's latitude
+    x1, y1, x2, y2 = index["segments"][candidates].T
+    dx = (x2 - x1) * scale
+    dy = y2 - y1
+    px = (x - x1) * scale
+    py = y - y1
+    length_squared = dx * dx + dy * dy
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.where(length_squared > 0, (px * dx + py * dy) / length_squared, 0.0)
+    t = np.clip(t, 0, 1)
+    points = np.column_stack([x1 + t * (x2 - x1), y1 + t * dy])
+    distances = np.hypot(px - t * dx, py - t * dy)
+
+    within = distances <= max_distance
+    return candidates[within], distances[within], points[within]
+
+
+def lookup_speed_limit(index, lat, lon, max_distance=MAX_ROAD_DISTANCE_M):
+    """
+    Return the speed limit in mph of the nearest indexed road within
+    max_distance meters of a point, or None if there is none.
+    """
+    if lat is None or lon is None or math.isnan(lat) or math.isnan(lon):
+        return None
+    x, y = project(lat, lon, float(index["reference_lat"]))
+
+    candidates, distances, _ = nearby_segments(index, float(x), float(y), max_distance)
+    if candidates.size == 0:
+        return None
+    return float(index["speed_limits"][candidates[np.argmin(distances)]])
+
+
+def lookup_speed_limits(index, lats, lons, max_distance=MAX_ROAD_DISTANCE_M):
+    """
+    Speed limit of every point as a float array, NaN where no road is in reach.
+    """
+    limits = [lookup_speed_limit(index, lat, lon, max_distance) for lat, lon in zip(lats, lons)]
+    return np.array([np.nan if limit is None else limit for limit in limits], dtype=float)
+
+
+def main():
+    if len(sys.argv) not in (2, 3) or not sys.argv[1].endswith((".geojson", ".json", ".pbf")):
+        print("Usage: python speed_limit_index.py <extract.geojson|extract.osm.pbf> [index.npz]")
+        sys.exit(1)
+
+    extract_path = sys.argv[1]
+    index_path = sys.argv[2] if len(sys.argv) == 3 else SPEED_LIMIT_INDEX_PATH
+
+    if extract_path.endswith(".pbf"):
+        roads = read_pbf_roads(extract_path)
+    else:
+        roads = read_geojson_roads(extract_path)
+
+    try:
+        index = build_speed_limit_index(roads)
+    except ValueError as e:
+        print(f"Error building speed limit index: {e}")
+        sys.exit(1)
+
+    save_speed_limit_index(index, index_path)
+    print(f"Indexed {len(index['speed_limits'])} road segments from {len(roads)} roads "
+          f"in {len(index['cell_keys'])} cells to {index_path}.")
+
+
+if __name__ == "__main__":
+    main()
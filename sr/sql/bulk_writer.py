@@ -0,0 +1,132 @@
+import os
+import tempfile
+import time
+
+from mysql.connector import Error
+
+# Default number of rows per multi-row INSERT statement
+BULK_BATCH_SIZE = 1000
+
+# Row count above which write_rows streams a CSV through LOAD DATA LOCAL INFILE
+LOAD_DATA_THRESHOLD = 50000
+
+
+def build_upsert_query(table, columns, update_columns):
+    """
+    Build an INSERT ... ON DUPLICATE KEY UPDATE statement for the given
+    table that updates update_columns when the primary key already exists.
+    """
+    column_list = ", ".join(columns)
+    placeholders = ", ".join(["%s"] * len(columns))
+    query = f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})"
+    if update_columns:
+        updates = ", ".join(f"{column} = VALUES({column})" for column in update_columns)
+        query += f" ON DUPLICATE KEY UPDATE {updates}"
+    return query
+
+
+def upsert_rows(cursor, table, columns, rows, update_columns=None, batch_size=BULK_BATCH_SIZE):
+    """
+    Write rows into a table using multi-row INSERT statements of at most
+    batch_size rows each. Returns the number of rows sent to the server.
+
+    The caller owns the transaction and is responsible for committing.
+    """
+    query = build_upsert_query(table, columns, update_columns)
+
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.executemany(query, batch)
+            written += len(batch)
+            batch = []
+
+    if batch:
+        cursor.executemany(query, batch)
+        written += len(batch)
+
+    return written
+
+
+def format_csv_value(value):
+    """
+    Format a value for LOAD DATA with '"' enclosures and no escape character.
+    """
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def load_data_rows(cursor, table, columns, rows):
+    """
+    Stream rows through a temporary CSV file and LOAD DATA LOCAL INFILE,
+    replacing rows whose primary key already exists. The connection must
+    be opened with allow_local_infile=True. Returns the number of rows loaded.
+    """
+    written = 0
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8") as csv_file:
+        for row in rows:
+            csv_file.write(",".join(format_csv_value(value) for value in row) + "\n")
+            written += 1
+
+    try:
+        cursor.execute(f"""
+            LOAD DATA LOCAL INFILE %s
+            REPLACE INTO TABLE {table}
+            CHARACTER SET utf8mb4
+            FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+            LINES TERMINATED BY '\\n'
+            ({", ".join(columns)})
+        """, (csv_file.name,))
+    finally:
+        os.remove(csv_file.name)
+
+    return written
+
+
+def report_throughput(label, rows, elapsed):
+    """
+    Print the number of rows written and the write rate.
+    """
+    rate = rows / elapsed if elapsed > 0 else float("inf")
+    print(f"{label}: wrote {rows} rows in {elapsed:.2f}s ({rate:.0f} rows/s).")
+
+
+def write_rows(connection, table, columns, rows, update_columns=None,
+               batch_size=BULK_BATCH_SIZE, method=None, label=None, commit=True):
+    """
+    Bulk write rows to a table and commit, unless commit is False so the
+    caller can add more statements to the same transaction. method is
+    "executemany", "load_data", or None to pick LOAD DATA for more than
+    LOAD_DATA_THRESHOLD rows. Falls back to executemany if the server
+    rejects LOAD DATA. Returns the number of rows written.
+    """
+    rows = list(rows)
+    if method is None:
+        method = "load_data" if len(rows) > LOAD_DATA_THRESHOLD else "executemany"
+
+    cursor = connection.cursor()
+    start_time = time.perf_counter()
+
+    written = None
+    if method == "load_data":
+        # Only undo the LOAD DATA on failure, not earlier statements of the
+        # caller's transaction
+        cursor.execute("SAVEPOINT load_data")
+        try:
+            written = load_data_rows(cursor, table, columns, rows)
+        except Error as e:
+            print(f"LOAD DATA LOCAL INFILE failed for {table}, using batched inserts: {e}")
+            cursor.execute("ROLLBACK TO SAVEPOINT load_data")
+
+    if written is None:
+        written = upsert_rows(cursor, table, columns, rows, update_columns, batch_size)
+
+    if commit:
+        connection.commit()
+    report_throughput(label or table, written, time.perf_counter() - start_time)
+    return written
@@ -1,5 +1,8 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
 import mysql.connector
-import sys
 
 # MySQL Configuration
 MYSQL_HOST = 'ec2-54-241-86-221.us-west-1.compute.amazonaws.com'
@@ -7,22 +10,268 @@ MYSQL_USER = 'driving_user'
 MYSQL_PASSWORD = 'dsci560'
 MYSQL_DATABASE = 'driving_data'
 
+# Most connections each pool keeps open at once
+POOL_SIZE = 5
+
+# Seconds to wait for a connection when every pooled connection is in use
+POOL_CHECKOUT_TIMEOUT = 30
+
+# Idle connections older than this many seconds are pinged before reuse
+POOL_HEALTH_CHECK_SECONDS = 30
+
+# Connection attempts before giving up, waiting CONNECT_BACKOFF_SECONDS
+# after the first failure and doubling the wait after each one
+CONNECT_ATTEMPTS = 3
+CONNECT_BACKOFF_SECONDS = 0.5
+
+# Seconds before a connection attempt times out
+CONNECT_TIMEOUT = 10
+
+
+class DatabaseConnectionError(mysql.connector.Error):
+    """
+    Raised when no database connection could be made or checked out.
+    A mysql.connector.Error, so callers catching Error handle it too.
+    """
+
+
+class PooledConnection:
+    """
+    A connection checked out of a ConnectionPool. It behaves like the
+    underlying MySQL connection, except that close() returns it to the pool.
+    """
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise DatabaseConnectionError("Connection was already returned to the pool")
+        return getattr(self._connection, name)
+
+    def is_connected(self):
+        return self._connection is not None and self._connection.is_connected()
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection)
+
+    def __del__(self):
+        # A connection dropped without close() still goes back to the pool
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of MySQL connections, opened on demand up to size.
+    Idle connections are health checked before reuse and replaced if the
+    server dropped them; new connections are retried with exponential
+    backoff. Checkouts wait up to checkout_timeout for a free connection.
+    """
+
+    def __init__(self, size=POOL_SIZE, checkout_timeout=POOL_CHECKOUT_TIMEOUT, **options):
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.options = options
+        self.pid = os.getpid()
+        self.idle = []  # (connection, time returned), most recent last
+        self.in_use = 0
+        self.condition = threading.Condition()
+        self.metrics = {"checkouts": 0, "waits": 0, "creations": 0, "reconnects": 0, "failures": 0}
+
+    def create_connection(self):
+        """
+        Open a new connection, retrying with exponential backoff.
+        """
+        delay = CONNECT_BACKOFF_SECONDS
+        for attempt in range(1, CONNECT_ATTEMPTS + 1):
+            try:
+                connection = mysql.connector.connect(
+                    host=MYSQL_HOST,
+                    user=MYSQL_USER,
+                    password=MYSQL_PASSWORD,
+                    database=MYSQL_DATABASE,
+                    auth_plugin='mysql_native_password',
+                    connection_timeout=CONNECT_TIMEOUT,
+                    **self.options
+                )
+                with self.condition:
+                    self.metrics["creations"] += 1
+                return connection
+            except mysql.connector.Error as e:
+                with self.condition:
+                    self.metrics["failures"] += 1
+                if attempt == CONNECT_ATTEMPTS:
+                    raise DatabaseConnectionError(
+                        f"Error connecting to MySQL after {attempt} attempts: {e}"
+                    ) from e
+                print(f"Error connecting to MySQL (attempt {attempt}), retrying in {delay:g}s: {e}")
+                time.sleep(delay)
+                delay *= 2
+
+    def is_healthy(self, connection):
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def acquire(self):
+        """
+        Check out a connection, reusing an idle one when possible.
+        Raises DatabaseConnectionError if none could be made in time.
+        """
+        with self.condition:
+            self.metrics["checkouts"] += 1
+            if not self.idle and self.in_use >= self.size:
+                self.metrics["waits"] += 1
+                if not self.condition.wait_for(lambda: self.idle or self.in_use < self.size,
+                                               self.checkout_timeout):
+                    raise DatabaseConnectionError(
+                        f"No database connection free after {self.checkout_timeout}s "
+                        f"({self.size} in use)"
+                    )
+            if self.idle:
+                connection, returned_at = self.idle.pop()
+            else:
+                connection, returned_at = None, None
+            self.in_use += 1
+
+        try:
+            if connection is not None and time.monotonic() - returned_at > POOL_HEALTH_CHECK_SECONDS:
+                if not self.is_healthy(connection):
+                    with self.condition:
+                        self.metrics["reconnects"] += 1
+                    try:
+                        connection.close()
+                    except mysql.connector.Error:
+                        pass
+                    connection = None
+            if connection is None:
+                connection = self.create_connection()
+        except BaseException:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+        return PooledConnection(self, connection)
+
+    def release(self, connection):
+        """
+        Return a connection to the pool, rolling back anything uncommitted.
+        A connection that is no longer usable is closed instead.
+        """
+        if os.getpid() != self.pid:
+            return  # Inherited from the parent process, whose socket it shares
+
+        reusable = True
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except mysql.connector.Error:
+            reusable = False
+        if not reusable:
+            try:
+                connection.close()
+            except mysql.connector.Error:
+                pass
+
+        with self.condition:
+            self.in_use -= 1
+            if reusable:
+                self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def close(self):
+        """
+        Close every idle connection.
+        """
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except mysql.connector.Error:
+                pass
+
+    def stats(self):
+        """
+        Return the pool's counters with the connections in use and idle.
+        """
+        with self.condition:
+            return dict(self.metrics, in_use=self.in_use, idle=len(self.idle), size=self.size)
+
+
+# Process-wide pools, one per set of connection options
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(allow_local_infile=False):
+    """
+    Return the process's pool for the given connection options. A process
+    forked from one that used the pool starts with a new, empty pool, so
+    parent and child never share a socket.
+    """
+    with _pools_lock:
+        pool = _pools.get(allow_local_infile)
+        if pool is None or pool.pid != os.getpid():
+            pool = ConnectionPool(allow_local_infile=allow_local_infile)
+            _pools[allow_local_infile] = pool
+        return pool
+
+
+def pool_stats():
+    """
+    Return the statistics of every pool in this process, keyed by whether
+    it allows LOAD DATA LOCAL INFILE.
+    """
+    with _pools_lock:
+        pools = dict(_pools)
+    return {key: pool.stats() for key, pool in pools.items()}
+
+
+def report_pool_stats():
+    """
+    Print the statistics of every pool in this process.
+    """
+    for allow_local_infile, stats in pool_stats().items():
+        name = "LOAD DATA connection pool" if allow_local_infile else "Connection pool"
+        print(f"{name}: {stats['checkouts']} checkouts, {stats['waits']} waits, "
+              f"{stats['creations']} connections opened, {stats['reconnects']} reconnects, "
+              f"{stats['failures']} failed connects ({stats['in_use']} in use, {stats['idle']} idle).")
+
 
 # Connect to MySQL
-def connect_to_mysql():
+def connect_to_mysql(allow_local_infile=False):
+    """
+    Check out a connection to the MySQL database from the process's pool.
+    Closing it returns it to the pool. Set allow_local_infile to permit
+    LOAD DATA LOCAL INFILE on the connection. Raises
+    DatabaseConnectionError if the database cannot be reached.
+    """
+    return get_pool(allow_local_infile).acquire()
+
+
+@contextmanager
+def mysql_connection(allow_local_infile=False):
     """
-    Establish a connection to the MySQL database.
+    Context manager that checks out a pooled connection and returns it to
+    the pool on exit, rolling back anything left uncommitted.
     """
+    connection = connect_to_mysql(allow_local_infile)
     try:
-        connection = mysql.connector.connect(
-            host=MYSQL_HOST,
-            user=MYSQL_USER,
-            password=MYSQL_PASSWORD,
-            database=MYSQL_DATABASE,
-            auth_plugin='mysql_native_password'
-        )
-        if connection.is_connected():
-            return connection
-    except mysql.connector.Error as e:
-        print(f"Error connecting to MySQL: {e}")
-        sys.exit(1)
+        yield connection
+    finally:
+        connection.close()
@@ -0,0 +1,146 @@
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.append(
+    os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "../..")
+    )
+)
+
+from sr.sql.database import mysql_connection
+from mysql.connector import Error
+
+# Timestamp columns converted in each table, with the table's primary key
+# (rebuilt when it includes a converted column)
+TIMESTAMP_COLUMNS = [
+    ("driving_data", ["timestamp"], ["trip_id", "timestamp"]),
+    ("sensors_data", ["timestamp"], ["trip_id", "timestamp"]),
+    ("preprocessed_driving_data", ["timestamp"], ["trip_id", "timestamp"]),
+    ("penalty_events_data", ["timestamp"], ["trip_id", "timestamp"]),
+    ("preprocessing_state", ["high_water_mark"], ["trip_id"]),
+    ("penalty_episodes_data", ["start_timestamp", "end_timestamp", "peak_timestamp"],
+     ["trip_id", "criterion", "start_timestamp"]),
+]
+
+
+def column_type(cursor, table_name, column_name):
+    """
+    Return the data type of a column, or None if the table or column does
+    not exist.
+    """
+    cursor.execute("""
+        SELECT data_type
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table_name, column_name))
+    result = cursor.fetchone()
+    return result[0].lower() if result else None
+
+
+def foreign_keys(cursor, table_name):
+    """
+    Return {constraint name: columns} for the foreign keys of a table.
+    """
+    cursor.execute("""
+        SELECT constraint_name, column_name
+        FROM information_schema.key_column_usage
+        WHERE table_schema = DATABASE() AND table_name = %s
+          AND referenced_table_name IS NOT NULL
+        ORDER BY constraint_name, ordinal_position
+    """, (table_name,))
+    keys = {}
+    for constraint_name, column_name in cursor.fetchall():
+        keys.setdefault(constraint_name, []).append(column_name)
+    return keys
+
+
+def migrate_table(cursor, table_name, columns, primary_key):
+    """
+    Convert the ISO 8601 VARCHAR timestamp columns of a table to BIGINT
+    epoch milliseconds, rebuilding the primary key if it includes one.
+    """
+    pending = []
+    for column in columns:
+        data_type = column_type(cursor, table_name, column)
+        if data_type is None:
+            print(f"Column {table_name}.{column} does not exist. Skipping.")
+        elif data_type == "bigint":
+            print(f"Column {table_name}.{column} already uses epoch-millisecond timestamps. Skipping.")
+        else:
+            pending.append(column)
+    if not pending:
+        return
+
+    for column in pending:
+        # Step 1: Add the new BIGINT column
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column}_ms BIGINT NULL")
+
+        # Step 2: Convert the ISO strings, with or without fractional seconds.
+        # Digit strings were already written in epoch milliseconds.
+        cursor.execute(f"""
+            UPDATE {table_name}
+            SET {column}_ms = IF({column} REGEXP '^[0-9]+$',
+                CAST({column} AS SIGNED),
+                ROUND(UNIX_TIMESTAMP(
+                    IF(LOCATE('.', {column}) > 0,
+                       STR_TO_DATE({column}, '%Y-%m-%dT%H:%i:%s.%f'),
+                       STR_TO_DATE({column}, '%Y-%m-%dT%H:%i:%s'))
+                ) * 1000))
+        """)
+
+    # Step 3: A foreign key on the leading primary key columns uses the
+    # primary key as its index, and MySQL refuses to drop it (error 1553),
+    # so give the foreign key its own index while the key is rebuilt
+    rebuild_key = any(column in primary_key for column in pending)
+    foreign_key_indexes = []
+    if rebuild_key:
+        for constraint_name, key_columns in foreign_keys(cursor, table_name).items():
+            if primary_key[:len(key_columns)] == key_columns:
+                index_name = f"{constraint_name}_migration"
+                cursor.execute(f"ALTER TABLE {table_name} ADD INDEX {index_name} ({', '.join(key_columns)})")
+                foreign_key_indexes.append(index_name)
+
+    # Step 4: Swap the columns and rebuild the primary key
+    changes = ["DROP PRIMARY KEY"] if rebuild_key else []
+    for column in pending:
+        null = "NOT NULL" if column in primary_key else "NULL"
+        changes.append(f"DROP COLUMN {column}")
+        changes.append(f"CHANGE COLUMN {column}_ms {column} BIGINT {null}")
+    if rebuild_key:
+        changes.append(f"ADD PRIMARY KEY ({', '.join(primary_key)})")
+    cursor.execute(f"ALTER TABLE {table_name} {', '.join(changes)}")
+
+    # Step 5: The rebuilt primary key serves the foreign keys again
+    if foreign_key_indexes:
+        drops = ", ".join(f"DROP INDEX {index_name}" for index_name in foreign_key_indexes)
+        cursor.execute(f"ALTER TABLE {table_name} {drops}")
+    print(f"Converted {', '.join(pending)} of {table_name} to epoch milliseconds.")
+
+
+def migrate_timestamps(time_zone="SYSTEM"):
+    """
+    One-time migration of every timestamp column from ISO 8601 strings to
+    epoch milliseconds. Running it again converts only the columns still
+    stored as strings. ISO timestamps were recorded in the phone's local
+    time, so time_zone should be the zone they were taken in.
+    """
+    with mysql_connection() as connection:
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SET time_zone = %s", (time_zone,))
+
+            for table_name, columns, primary_key in TIMESTAMP_COLUMNS:
+                migrate_table(cursor, table_name, columns, primary_key)
+
+            connection.commit()
+            print("Timestamp migration completed. Set TIMESTAMP_MODE = \"epoch_ms\" to use the new format.")
+        except Error as e:
+            print(f"Error migrating timestamps: {e}")
+
+
+if __name__ == "__main__":
+    # Accept an optional time zone such as '-08:00' as a command-line argument
+    time_zone = sys.argv[1] if len(sys.argv) > 1 else "SYSTEM"
+
+    migrate_timestamps(time_zone)
@@ -0,0 +1,62 @@
+import time
+from datetime import datetime
+
+# Timestamp storage mode:
+#   "iso"      - ISO 8601 strings in VARCHAR(255) columns (original format)
+#   "epoch_ms" - integer milliseconds since the Unix epoch in BIGINT columns
+# Switch to "epoch_ms" only after running sql/migrate_timestamps.py. The
+# collectors in data_collection/ import this setting too.
+TIMESTAMP_MODE = "iso"
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+def timestamp_sql_type(mode=TIMESTAMP_MODE):
+    """
+    Return the column type used for timestamp columns in the given mode.
+    """
+    return "BIGINT" if mode == "epoch_ms" else "VARCHAR(255)"
+
+
+TIMESTAMP_SQL_TYPE = timestamp_sql_type()
+
+
+def current_timestamp(mode=TIMESTAMP_MODE):
+    """
+    Return the current time in the storage format of the given mode.
+    """
+    if mode == "epoch_ms":
+        return int(time.time() * 1000)
+    return datetime.now().isoformat()
+
+
+def parse_timestamp(value):
+    """
+    Convert a stored timestamp (ISO string or epoch milliseconds) to a
+    naive local datetime.
+    """
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000)
+    return datetime.fromisoformat(value)
+
+
+def format_timestamp(value, mode=TIMESTAMP_MODE):
+    """
+    Convert a datetime, ISO string or epoch-millisecond value (possibly
+    sent as a digit string) to the storage format of the given mode.
+    """
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+
+    if mode == "epoch_ms":
+        if isinstance(value, (int, float)):
+            return int(value)
+        if not isinstance(value, datetime):
+            value = parse_timestamp(value)
+        return int(round(value.timestamp() * 1000))
+
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, datetime):
+        value = parse_timestamp(value)
+    return value.strftime(ISO_FORMAT)